@@ -0,0 +1,958 @@
+#
+# ArrayModule.py
+#
+# A columnar Module backend. Instead of one Python object per cell, pin and
+# net, an ArrayModule keeps integer ids in flat int32 columns:
+#
+#   cells   name (table), type (id into the table of cell types)
+#   pins    cell, name (id into the table of pin names), net
+#   nets    name (table), width, busName, bitIdx
+#
+# A pin's net is a net id >= 0 or -(port index)-1 for a port, like in
+# binaryNetlist. Ports stay ordinary Port objects, a module only has a few
+# of them and they are shared with the link step of the parent module.
+#
+# The columns are appended to while the module is built and converted to
+# NumPy arrays the first time they are queried. Linking works on the arrays
+# as a whole and stores the pin directions, the driver of every signal and
+# the loads of every signal in CSR form. Signals number the ports first,
+# then the nets: signal s is port s for s < nports and net s - nports after.
+#
+# cells, nets and the pins of a cell are still available by name through
+# small mappings that create CellView/PinView/NetView objects on demand, so
+# code written against Module (writeVerilog, the readers, iteration) works
+# with either backend.
+#
+import array
+import hashlib
+import numpy
+import Module
+import Port
+import Bus
+from SymbolTable import symbols
+
+_NO_NET = -(1 << 31)
+
+# pin directions after link
+DIR_NONE = 0
+DIR_IN   = 1
+DIR_OUT  = 2
+
+
+class ArrayModule(Module.Module):
+    """
+    A Module that stores its cells, pins and nets as integer ids in NumPy
+    arrays.
+
+    >>> import Netlist
+    >>> nl = Netlist.Netlist()
+    >>> nl.readYAML("test/gates.yml")
+    >>> nl.readVerilog("test/Iface_test.gv", engine="fast", backend="array")
+    >>> nl.link("Iface_test")
+    >>> mod = nl.mods["Iface_test"]
+    >>> (mod.backend, mod.numCells, mod.numPins)
+    ('array', 112, 426)
+    >>> cell = mod.cells["U138"]
+    >>> (cell.submodname, cell.pins["Z"].net.fanin == cell.pins["Z"])
+    ('MUX4D1', True)
+    >>> counts = mod.cellTypeCounts()
+    >>> (counts["EDFQD1"], counts["INVD1"])
+    (24, 14)
+
+    Everything is also available as arrays indexed by id:
+
+    >>> s = mod.pinSignals()[cell.pins["Z"].id]
+    >>> mod.signal(s).name == cell.pins["Z"].net.name
+    True
+    >>> mod.cell(int(mod.pinCells()[mod.signalDrivers()[s]])).name
+    'U138'
+
+    levelize() returns arrays of cell ids:
+
+    >>> levels = mod.levelize()
+    >>> (len(levels), len(levels[0]), sum([ len(level) for level in levels ]))
+    (9, 35, 112)
+
+    The structural hash does not depend on the backend:
+
+    >>> nl2 = Netlist.Netlist()
+    >>> nl2.readYAML("test/gates.yml")
+    >>> nl2.readVerilog("test/Iface_test.gv")
+    >>> mod.structuralHash() == nl2.mods["Iface_test"].structuralHash()
+    True
+    >>> mod.netDigests() == nl2.mods["Iface_test"].netDigests()
+    True
+    """
+    __slots__ = ('__cellNames', '__cellIndex', '__cellType',
+                 '__types', '__typeIndex',
+                 '__pinCell', '__pinName', '__pinNet',
+                 '__pinNames', '__pinNameIndex',
+                 '__netNames', '__netIndex', '__netWidth',
+                 '__netBusName', '__netBitIdx', '__netRange',
+                 '__pinsOrdered', '__arrays',
+                 '__submods', '__pinDir', '__driver', '__loadStart', '__loads',
+                 '__multiDriven', '__linkedPorts')
+
+    backend = "array"
+
+    def __init__(self, attrs):
+        Module.Module.__init__(self, attrs)
+
+        self.__cellNames = []
+        self.__cellIndex = dict()
+        self.__cellType  = array.array('i')
+        self.__types     = []
+        self.__typeIndex = dict()
+
+        self.__pinCell      = array.array('i')
+        self.__pinName      = array.array('i')
+        self.__pinNet       = array.array('i')
+        self.__pinNames     = []
+        self.__pinNameIndex = dict()
+
+        self.__netNames   = []
+        self.__netIndex   = dict()
+        self.__netWidth   = array.array('i')
+        self.__netBusName = []
+        self.__netBitIdx  = []
+        # (msb, lsb) of the few nets that have them
+        self.__netRange   = dict()
+
+        # True while the pins are in cell order
+        self.__pinsOrdered = True
+        # NumPy copies of the columns, dropped whenever a column changes
+        self.__arrays    = dict()
+
+        # to be linked
+        self.__submods   = None
+        self.__pinDir    = None
+        self.__driver    = None
+        self.__loadStart = None
+        self.__loads     = None
+        self.__multiDriven = None
+        self.__linkedPorts = []
+
+    cells = property(lambda self: _Table(self.__cellNames, self.__cellIndex,
+                                         self.cell))
+    nets  = property(lambda self: _Table(self.__netNames, self.__netIndex,
+                                         self.net))
+
+    numCells   = property(lambda self: len(self.__cellNames))
+    numPins    = property(lambda self: len(self.__pinCell))
+    numNets    = property(lambda self: len(self.__netNames))
+    numSignals = property(lambda self: len(self.ports) + len(self.__netNames))
+    typeNames  = property(lambda self: list(self.__types))
+    pinNameTable = property(lambda self: list(self.__pinNames))
+    linked     = property(lambda self: self.__pinDir is not None)
+
+    @staticmethod
+    def fromModule(mod):
+        " Copy a Module (of either backend) into a new ArrayModule "
+        amod = ArrayModule({"name": mod.name})
+        for port in mod.ports.entries():
+            if isinstance(port, Bus.Bus):
+                amod.new_bus({"name": port.name, "width": port.width,
+                              "lsb": port.lsb, "direction": port.direction,
+                              "portClass": port.portClass})
+            else:
+                amod.add_port(port.__class__(_netAttrs(port, module=amod,
+                                                       direction=port.direction)))
+        nets = dict()
+        for net in mod.nets.values():
+            nets[net.name] = amod.new_net(_netAttrs(net))
+        for cell in mod.cells.values():
+            acell = amod.new_cell({"name": cell.name, "submodname": cell.submodname})
+            for pin in cell.pins.values():
+                apin = acell.new_pin({"name": pin.name})
+                net = pin.net
+                if isinstance(net, Port.Port):
+                    apin.connectNet(amod.ports[net.name])
+                elif net is not None:
+                    apin.connectNet(nets[net.name])
+        return amod
+
+    #
+    # building, same interface as Module
+    #
+    def __changed(self):
+        self.changed()
+        if not self.__arrays and self.__pinDir is None:
+            return
+        self.__arrays = dict()
+        self.__pinDir = None
+        self.__driver = None
+        self.__loadStart = None
+        self.__loads = None
+        self.__multiDriven = None
+
+    def new_cell(self, cellAttr):
+        name = cellAttr["name"]
+        submodname = cellAttr["submodname"]
+        t = self.__typeIndex.get(submodname)
+        if t is None:
+            t = len(self.__types)
+            submodname = symbols.intern(submodname)
+            self.__types.append(submodname)
+            self.__typeIndex[submodname] = t
+        c = self.__cellIndex.get(name)
+        if c is None:
+            c = len(self.__cellNames)
+            self.__cellNames.append(name)
+            self.__cellIndex[name] = c
+            self.__cellType.append(t)
+        else:
+            # like an OrderedDict, a redefined cell keeps its place (and
+            # here also its pins)
+            self.__cellType[c] = t
+        self.__changed()
+        return CellView(self, c)
+
+    def new_net(self, netAttr):
+        netAttr["module"] = self
+        # checks the attributes exactly like a Net object would
+        net = _checkNet(netAttr)
+        n = self.__netIndex.get(net.name)
+        if n is None:
+            n = len(self.__netNames)
+            self.__netNames.append(net.name)
+            self.__netIndex[net.name] = n
+            self.__netWidth.append(net.width)
+            self.__netBusName.append(symbols.intern(net.busName))
+            self.__netBitIdx.append(net.bitIdx)
+        else:
+            self.__netWidth[n] = net.width
+            self.__netBusName[n] = symbols.intern(net.busName)
+            self.__netBitIdx[n] = net.bitIdx
+        if net.msb is not None or net.lsb is not None:
+            self.__netRange[n] = (net.msb, net.lsb)
+        if net.busName is not None:
+            self.add_net_bit(net.busName, net.bitIdx)
+        self.__changed()
+        return NetView(self, n)
+
+    def new_port(self, portAttr):
+        return self.add_port(Module.Module.new_port(self, portAttr))
+
+    def add_port(self, port):
+        Module.Module.add_port(self, port)
+        self.__changed()
+        return port
+
+    def new_bus(self, busAttr):
+        bus = Module.Module.new_bus(self, busAttr)
+        self.__changed()
+        return bus
+
+    def new_pin(self, c, pinAttr):
+        " add a pin to cell c, replacing a pin of the same name "
+        name = pinAttr["name"]
+        n = self.__pinNameIndex.get(name)
+        if n is None:
+            n = len(self.__pinNames)
+            name = symbols.intern(name)
+            self.__pinNames.append(name)
+            self.__pinNameIndex[name] = n
+        pinCell = self.__pinCell
+        if self.__pinsOrdered and (not pinCell or c >= pinCell[-1]):
+            # the usual case, c is the cell whose pins are at the end
+            p = len(pinCell) - 1
+            while p >= 0 and pinCell[p] == c:
+                if self.__pinName[p] == n:
+                    break
+                p -= 1
+            else:
+                p = None
+        else:
+            p = None
+            for q in self.cellPins(c):
+                if self.__pinName[q] == n:
+                    p = q
+        if p is not None:
+            self.__pinNet[p] = _NO_NET
+            self.__changed()
+            return PinView(self, p)
+        if pinCell and c < pinCell[-1]:
+            self.__pinsOrdered = False
+        pinCell.append(c)
+        self.__pinName.append(n)
+        self.__pinNet.append(_NO_NET)
+        self.__changed()
+        return PinView(self, len(self.__pinCell) - 1)
+
+    def connectNet(self, p, net):
+        " connect pin p to net, a NetView of this module or one of its ports "
+        if isinstance(net, NetView):
+            if net.module is not self:
+                raise Exception("net " + net.name + " is not in " + self.name)
+            value = net.id
+        elif net is None:
+            value = _NO_NET
+        elif self.ports.get(net.name) is net:
+            value = -self.ports.index(net.name) - 1
+        else:
+            raise Exception("net " + net.name + " is not in " + self.name)
+        self.__pinNet[p] = value
+        self.__changed()
+
+    #
+    # id based access
+    #
+    def cell(self, c):
+        " the view of cell c, which may also be a cell name "
+        if isinstance(c, basestring):
+            c = self.__cellIndex[c]
+        return CellView(self, c)
+
+    def net(self, n):
+        " the view of net n, which may also be a net name "
+        if isinstance(n, basestring):
+            n = self.__netIndex[n]
+        return NetView(self, n)
+
+    def pin(self, p):
+        return PinView(self, p)
+
+    def signal(self, s):
+        " the Port or NetView of signal s "
+        nports = len(self.ports)
+        if s < nports:
+            return self.ports.at(s)
+        return NetView(self, s - nports)
+
+    def submodnames(self):
+        return list(self.__types)
+
+    def cellName(self, c):
+        return self.__cellNames[c]
+
+    def cellTypeName(self, c):
+        return self.__types[self.__cellType[c]]
+
+    def cellSubmod(self, c):
+        if self.__submods is None:
+            return None
+        return self.__submods[self.__cellType[c]]
+
+    def cellPins(self, c):
+        " the pin ids of cell c, in the order they were added "
+        pinCell = self.__pinCell
+        npins = len(pinCell)
+        # cells are nearly always built one at a time, so the pins of the
+        # last cell are at the end of the columns
+        if self.__pinsOrdered and c == len(self.__cellNames) - 1:
+            p = npins
+            while p > 0 and pinCell[p - 1] == c:
+                p -= 1
+            return range(p, npins)
+        (start, order) = self.__cellPinIndex()
+        return order[start[c]:start[c + 1]].tolist()
+
+    def pinName(self, p):
+        return self.__pinNames[self.__pinName[p]]
+
+    def pinCell(self, p):
+        return self.__pinCell[p]
+
+    def pinNet(self, p):
+        " the NetView or Port pin p connects to, None if it is unconnected "
+        n = self.__pinNet[p]
+        if n >= 0:
+            return NetView(self, n)
+        if n == _NO_NET:
+            return None
+        return self.ports.at(-n - 1)
+
+    def pinPort(self, p):
+        " the port of the submodule pin p connects to, None before link "
+        submod = self.cellSubmod(self.__pinCell[p])
+        if submod is None:
+            return None
+        return submod.ports.get(self.pinName(p))
+
+    def netName(self, n):
+        return self.__netNames[n]
+
+    def netAttr(self, n, name):
+        " width, msb, lsb, busName or bitIdx of net n "
+        if name == "width":
+            return self.__netWidth[n]
+        if name == "busName":
+            return self.__netBusName[n]
+        if name == "bitIdx":
+            return self.__netBitIdx[n]
+        (msb, lsb) = self.__netRange.get(n, (None, None))
+        if name == "msb":
+            return msb
+        if name == "lsb":
+            return lsb
+        raise KeyError(name)
+
+    def netFanin(self, n):
+        " the PinView driving net n, None if there is none or before link "
+        if self.__driver is None:
+            return None
+        d = self.__driver[len(self.ports) + n]
+        if d < 0:
+            return None
+        return PinView(self, int(d))
+
+    def netFanout(self, n):
+        " the PinViews loading net n "
+        if self.__loads is None:
+            return ()
+        s = len(self.ports) + n
+        return [ PinView(self, int(p))
+                 for p in self.__loads[self.__loadStart[s]:self.__loadStart[s + 1]] ]
+
+    #
+    # NumPy columns
+    #
+    def __column(self, name, values, dtype=numpy.int32):
+        a = self.__arrays.get(name)
+        if a is None:
+            a = _fromColumn(values).astype(dtype)
+            a.flags.writeable = False
+            self.__arrays[name] = a
+        return a
+
+    def cellTypes(self):
+        " int32 cell type id of every cell, see typeNames "
+        return self.__column("cellType", self.__cellType)
+
+    def pinCells(self):
+        " int32 cell id of every pin "
+        return self.__column("pinCell", self.__pinCell)
+
+    def pinNameIds(self):
+        " int32 pin name id of every pin, see pinNameTable "
+        return self.__column("pinName", self.__pinName)
+
+    def pinSignals(self):
+        " int32 signal id of every pin, -1 for unconnected pins "
+        a = self.__arrays.get("pinSignal")
+        if a is None:
+            net = _fromColumn(self.__pinNet).astype(numpy.int64)
+            a = numpy.where(net >= 0, net + len(self.ports), -net - 1)
+            a[net == _NO_NET] = -1
+            a = a.astype(numpy.int32)
+            a.flags.writeable = False
+            self.__arrays["pinSignal"] = a
+        return a
+
+    def pinDirections(self):
+        " int8 DIR_IN/DIR_OUT of every pin, None before link "
+        return self.__pinDir
+
+    def signalNames(self):
+        return self.ports.keys() + self.__netNames
+
+    def signalDrivers(self):
+        " int32 driving pin of every signal, -1 if none, None before link "
+        return self.__driver
+
+    def signalLoads(self):
+        """ (start, pins) CSR arrays of the loads of every signal, the loads
+        of signal s are pins[start[s]:start[s+1]]; None before link """
+        if self.__loads is None:
+            return None
+        return (self.__loadStart, self.__loads)
+
+    def __cellPinIndex(self):
+        " (start, order) CSR arrays of the pins of every cell "
+        a = self.__arrays.get("cellPinIndex")
+        if a is None:
+            pinCell = self.pinCells()
+            order = numpy.argsort(pinCell, kind="mergesort").astype(numpy.int32)
+            counts = numpy.bincount(pinCell, minlength=len(self.__cellNames))
+            start = numpy.zeros(len(self.__cellNames) + 1, dtype=numpy.int32)
+            numpy.cumsum(counts, out=start[1:])
+            a = (start, order)
+            self.__arrays["cellPinIndex"] = a
+        return a
+
+    def cellIncidence(self):
+        """ (start, signals) CSR arrays of the signals of every cell, one
+        entry per connected pin in pin order: the signals of cell c are
+        signals[start[c]:start[c+1]]. While the pins are in cell order and
+        all of them are connected, signals is pinSignals() itself """
+        a = self.__arrays.get("cellIncidence")
+        if a is None:
+            (start, order) = self.__cellPinIndex()
+            signals = self.pinSignals()
+            if not self.__pinsOrdered:
+                signals = signals[order]
+            connected = signals >= 0
+            if not connected.all():
+                counts = numpy.bincount(self.pinCells()[order][connected],
+                                        minlength=len(self.__cellNames))
+                start = numpy.zeros(len(self.__cellNames) + 1, dtype=numpy.int32)
+                numpy.cumsum(counts, out=start[1:])
+                signals = signals[connected]
+                signals.flags.writeable = False
+            a = (start, signals)
+            self.__arrays["cellIncidence"] = a
+        return a
+
+    def cellTypeCounts(self):
+        " dict cell type -> number of instances "
+        counts = numpy.bincount(self.cellTypes(), minlength=len(self.__types))
+        return dict(zip(self.__types, counts.tolist()))
+
+    #
+    # link
+    #
+    def submodChanged(self, submodname):
+        if submodname in self.__typeIndex:
+            self.__changed()
+
+    def dirtyCells(self):
+        " any change relinks the whole module, see link() "
+        if self.linked:
+            return []
+        return self.cells.values()
+
+    def link(self, mods):
+        """ Link all cells to their submodules in mods, computes the pin
+        directions, signal drivers and signal loads. Every change to the
+        module drops the link, linking an unchanged module does nothing. """
+        if self.linked:
+            return
+        missing = set([ t for t in self.__types if t not in mods ])
+        if len(missing) > 0:
+            raise Exception(str("link error, " +
+                                str(missing) +
+                                " have not been defined"))
+
+        submods = [ mods[t] for t in self.__types ]
+
+        # direction of every (cell type, pin name) pair, 0 if there is no
+        # such port
+        table = numpy.zeros((len(submods), len(self.__pinNames)), dtype=numpy.int8)
+        for (t, submod) in enumerate(submods):
+            pinTable = submod.pinTable()
+            for (n, pname) in enumerate(self.__pinNames):
+                portDir = pinTable.get(pname)
+                if portDir is not None:
+                    table[t, n] = portDir[1] and DIR_IN or DIR_OUT
+
+        (start, order) = self.__cellPinIndex()
+        pinCell = self.pinCells()
+        pinDir = table[self.cellTypes()[pinCell], self.pinNameIds()]
+        bad = order[pinDir[order] == DIR_NONE]
+        if len(bad) > 0:
+            p = int(bad[0])
+            raise Exception(str("port " + self.pinName(p) + " not in "
+                                + self.cellTypeName(pinCell[p])))
+
+        nports = len(self.ports)
+        nsignals = nports + len(self.__netNames)
+        sig = self.pinSignals()
+
+        # drivers, in cell order. A signal with several drivers keeps the
+        # first, violations() reports the others
+        outs = order[(pinDir[order] == DIR_OUT) & (sig[order] >= 0)]
+        driven = sig[outs]
+        (signals, first) = numpy.unique(driven, return_index=True)
+        driver = numpy.empty(nsignals, dtype=numpy.int32)
+        driver.fill(-1)
+        driver[signals] = outs[first]
+        multiDriven = numpy.zeros(nsignals, dtype=bool)
+        multiDriven[driven[driver[driven] != outs]] = True
+
+        # loads, in cell order for each signal
+        ins = order[(pinDir[order] == DIR_IN) & (sig[order] >= 0)]
+        loads = ins[numpy.argsort(sig[ins], kind="mergesort")]
+        loadStart = numpy.zeros(nsignals + 1, dtype=numpy.int32)
+        numpy.cumsum(numpy.bincount(sig[ins], minlength=nsignals), out=loadStart[1:])
+
+        # the ports are objects, they get their fanin and fanout the same
+        # way as with the object backend (after forgetting the last link)
+        for port in self.__linkedPorts:
+            port.clearLinks()
+        ports = self.ports
+        portAt = dict()
+        linkedPorts = []
+        for p in order[sig[order] < nports]:
+            s = sig[p]
+            if s < 0:
+                continue
+            port = portAt.get(s)
+            if port is None:
+                port = portAt[s] = ports.at(s)
+                linkedPorts.append(port)
+            if pinDir[p] == DIR_IN:
+                port.addFanout(PinView(self, int(p)))
+            else:
+                port.setFanin(PinView(self, int(p)))
+
+        for a in (pinDir, driver, loads, loadStart, multiDriven):
+            a.flags.writeable = False
+        self.__submods   = submods
+        self.__pinDir    = pinDir
+        self.__driver    = driver
+        self.__multiDriven = multiDriven
+        self.__loadStart = loadStart
+        self.__loads     = loads
+        self.__linkedPorts = linkedPorts
+        self.markLinked()
+
+    #
+    # structural hashing
+    #
+    def computeStructuralHash(self):
+        " computeStructuralHash() on the columns "
+        return Module._canonicalHash(
+            Module._labels(self.__types)[self.cellTypes()], self.pinCells(),
+            Module._labels(self.__pinNames)[self.pinNameIds()], self.pinSignals(),
+            Module._signalLabels(self, self.__netWidth))
+
+    def computeDigests(self):
+        " computeDigests() on the columns, the pins are taken in cell order "
+        sha1 = hashlib.sha1
+        (start, order) = self.__cellPinIndex()
+        signals = self.signalNames()
+        pinNames = self.__pinNames
+        pins = [ s < 0 and pinNames[n] or pinNames[n] + "=" + signals[s]
+                 for (n, s) in zip(self.pinNameIds()[order].tolist(),
+                                   self.pinSignals()[order].tolist()) ]
+        start = start.tolist()
+        types = self.__types
+        cellType = self.__cellType
+        cells = dict()
+        for (c, name) in enumerate(self.__cellNames):
+            p = pins[start[c]:start[c + 1]]
+            p.sort()
+            cells[name] = sha1(name + "\0" + types[cellType[c]] + "\0" +
+                               "\0".join(p)).digest()
+        return cells
+
+    def computeNetDigests(self):
+        nports = len(self.ports)
+        net = self.pinSignals().astype(numpy.int64) - nports
+        order = numpy.argsort(net, kind="mergesort")
+        order = order[net[order] >= 0]
+        counts = numpy.bincount(net[order], minlength=len(self.__netNames)).tolist()
+        cellNames = self.__cellNames
+        pinNames = self.__pinNames
+        pins = [ cellNames[c] + "." + pinNames[n]
+                 for (c, n) in zip(self.pinCells()[order].tolist(),
+                                   self.pinNameIds()[order].tolist()) ]
+        connections = dict()
+        p = 0
+        for (name, count) in zip(self.__netNames, counts):
+            connections[name] = pins[p:p + count]
+            p += count
+        return Module._netDigests(connections)
+
+    #
+    # levelization
+    #
+    def computeLevels(self):
+        """ levelize() on the arrays: a list of int32 arrays of cell ids,
+        level 0 holds the sequential cells. The cells of a level are in id
+        order """
+        if not self.linked:
+            raise Exception("levelize " + self.name + " before link")
+        ncells = len(self.__cellNames)
+        seqType = numpy.array([ submod.sequential for submod in self.__submods ]
+                              + [ False ], dtype=bool)
+        seqCell = seqType[self.cellTypes()]
+
+        # one edge per connection from a combinational driver to a
+        # combinational load
+        pinCell = self.pinCells()
+        sig = self.pinSignals()
+        loadPins = numpy.flatnonzero((self.__pinDir == DIR_IN) & (sig >= 0))
+        driver = self.__driver[sig[loadPins]]
+        loadPins = loadPins[driver >= 0]
+        src = pinCell[driver[driver >= 0]]
+        dst = pinCell[loadPins]
+        comb = ~seqCell[src] & ~seqCell[dst]
+        src = src[comb]
+        dst = dst[comb]
+
+        pending = numpy.bincount(dst, minlength=ncells)
+        order = numpy.argsort(src, kind="mergesort")
+        dst = dst[order]
+        start = numpy.zeros(ncells + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(src, minlength=ncells), out=start[1:])
+
+        levels = [ numpy.flatnonzero(seqCell).astype(numpy.int32) ]
+        current = numpy.flatnonzero(~seqCell & (pending == 0))
+        placed = len(levels[0])
+        while len(current):
+            levels.append(current.astype(numpy.int32))
+            placed += len(current)
+            # the loads of all cells of the level, gathered from the CSR
+            lens = start[current + 1] - start[current]
+            first = numpy.repeat(start[current] - numpy.cumsum(lens) + lens, lens)
+            loads = dst[first + numpy.arange(lens.sum())]
+            (cells, counts) = numpy.unique(loads, return_counts=True)
+            pending[cells] -= counts
+            current = cells[pending[cells] == 0]
+        if placed < ncells:
+            names = sorted([ self.__cellNames[c]
+                             for c in numpy.flatnonzero(pending > 0) ])
+            raise Exception("combinational loop in " + self.name + " through "
+                            + ", ".join(names[:10]))
+        return levels
+
+    def violations(self):
+        """ Generate the design rule Violations of the linked module, in
+        the same order as Module.violations """
+        if not self.linked:
+            raise Exception("violations of " + self.name + " before link")
+        name = self.name
+        for v in Module._portViolations(self):
+            yield v
+
+        nports = len(self.ports)
+        (loadStart, loads) = self.signalLoads()
+        multiDriven = self.__multiDriven
+        for n in numpy.flatnonzero((self.__driver[nports:] < 0) |
+                                   multiDriven[nports:]):
+            n = int(n)
+            nloads = loadStart[nports + n + 1] - loadStart[nports + n]
+            if multiDriven[nports + n]:
+                pins = [ PinView(self, int(p)) for p in
+                         numpy.flatnonzero((self.pinSignals() == nports + n) &
+                                           (self.__pinDir == DIR_OUT)) ]
+                yield Module._multipleDrivers(name, self.__netNames[n], pins)
+            elif nloads:
+                yield Module.Violation("undriven", name, self.__netNames[n],
+                                       "net has " + str(nloads) +
+                                       " loads but no driver")
+            else:
+                yield Module.Violation("floating", name, self.__netNames[n],
+                                       "net is not connected")
+
+        # width of every (cell type, pin name) port and of every signal
+        portWidth = numpy.zeros((len(self.__submods), len(self.__pinNames)),
+                                dtype=numpy.int32)
+        for (t, submod) in enumerate(self.__submods):
+            pinTable = submod.pinTable()
+            for (n, pname) in enumerate(self.__pinNames):
+                portDir = pinTable.get(pname)
+                if portDir is not None:
+                    portWidth[t, n] = portDir[0].width
+        sigWidth = numpy.array([ port.width for port in self.ports.itervalues() ]
+                               + self.__netWidth.tolist(), dtype=numpy.int32)
+        (start, order) = self.__cellPinIndex()
+        sig = self.pinSignals()
+        width = portWidth[self.cellTypes()[self.pinCells()], self.pinNameIds()]
+        unconnected = (sig < 0) & (self.__pinDir == DIR_IN)
+        mismatch = (sig >= 0) & (sigWidth[sig] != width)
+        for p in order[(unconnected | mismatch)[order]]:
+            pin = PinView(self, int(p))
+            if unconnected[p]:
+                yield Module.Violation("floating", name, Module._pinName(pin),
+                                       "input pin is not connected")
+            else:
+                s = int(sig[p])
+                if s < nports:
+                    signame = self.ports.at(s).name
+                else:
+                    signame = self.__netNames[s - nports]
+                yield Module.Violation("width", name, Module._pinName(pin),
+                                       "connects " + signame +
+                                       " of width " + str(sigWidth[s]) +
+                                       " to a port of width " + str(width[p]))
+
+
+def _fromColumn(column):
+    " a NumPy view of an array.array('i') column, without copying "
+    if len(column) == 0:
+        return numpy.zeros(0, dtype=numpy.intc)
+    return numpy.frombuffer(column, dtype=numpy.intc)
+
+def _netAttrs(net, **extra):
+    " the constructor attributes of a copy of net "
+    attrs = { "name": net.name, "width": net.width,
+              "msb": net.msb, "lsb": net.lsb,
+              "busMember": net.busMember, "busName": net.busName,
+              "bitIdx": net.bitIdx }
+    attrs.update(extra)
+    return attrs
+
+def _checkNet(attrs):
+    import Net
+    return Net.Net(attrs)
+
+
+class _Table(object):
+    """ Read-only dict interface to the cells or nets of an ArrayModule,
+    in the order they were added """
+    __slots__ = ('__names', '__index', '__view')
+
+    def __init__(self, names, index, view):
+        self.__names = names
+        self.__index = index
+        self.__view  = view
+
+    def __getitem__(self, name):
+        return self.__view(self.__index[name])
+
+    def get(self, name, default=None):
+        i = self.__index.get(name)
+        if i is None:
+            return default
+        return self.__view(i)
+
+    def __contains__(self, name):
+        return name in self.__index
+
+    has_key = __contains__
+
+    def __len__(self):
+        return len(self.__names)
+
+    def __iter__(self):
+        return iter(self.__names)
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self.__names)
+
+    def itervalues(self):
+        view = self.__view
+        return (view(i) for i in xrange(len(self.__names)))
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        view = self.__view
+        return ((name, view(i)) for (i, name) in enumerate(self.__names))
+
+    def items(self):
+        return list(self.iteritems())
+
+
+class _View(object):
+    " Base of the objects standing in for one row of an ArrayModule "
+    __slots__ = ('__module', '__id')
+
+    def __init__(self, module, i):
+        self.__module = module
+        self.__id = i
+
+    module = property(lambda self: self.__module)
+    id     = property(lambda self: self.__id)
+
+    def __eq__(self, other):
+        return (type(other) is type(self) and other.module is self.__module
+                and other.id == self.__id)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self.__module), self.__id))
+
+    def __repr__(self):
+        return "<%s %s>" % (type(self).__name__, self.name)
+
+
+class CellView(_View):
+    __slots__ = ()
+
+    name       = property(lambda self: self.module.cellName(self.id))
+    submodname = property(lambda self: self.module.cellTypeName(self.id))
+    submod     = property(lambda self: self.module.cellSubmod(self.id))
+    pins       = property(lambda self: PinsView(self.module, self.id))
+
+    def new_pin(self, pinAttr):
+        return self.module.new_pin(self.id, pinAttr)
+
+
+class PinView(_View):
+    __slots__ = ()
+
+    name     = property(lambda self: self.module.pinName(self.id))
+    cell     = property(lambda self: CellView(self.module, self.module.pinCell(self.id)))
+    net      = property(lambda self: self.module.pinNet(self.id))
+    port     = property(lambda self: self.module.pinPort(self.id))
+    portname = name
+    netname  = property(lambda self: self.net and self.net.name)
+
+    def connectNet(self, net):
+        self.module.connectNet(self.id, net)
+
+
+class NetView(_View):
+    __slots__ = ()
+
+    name      = property(lambda self: self.module.netName(self.id))
+    width     = property(lambda self: self.module.netAttr(self.id, "width"))
+    msb       = property(lambda self: self.module.netAttr(self.id, "msb"))
+    lsb       = property(lambda self: self.module.netAttr(self.id, "lsb"))
+    busName   = property(lambda self: self.module.netAttr(self.id, "busName"))
+    bitIdx    = property(lambda self: self.module.netAttr(self.id, "bitIdx"))
+    busMember = property(lambda self: self.busName != None)
+    fanin     = property(lambda self: self.module.netFanin(self.id))
+    fanout    = property(lambda self: self.module.netFanout(self.id))
+
+
+class PinsView(object):
+    " The pins of a cell of an ArrayModule, with the interface of Cell.PinMap "
+    __slots__ = ('__module', '__pins')
+
+    def __init__(self, module, c):
+        self.__module = module
+        self.__pins = module.cellPins(c)
+
+    def __find(self, name):
+        module = self.__module
+        for p in self.__pins:
+            if module.pinName(p) == name:
+                return p
+        return None
+
+    def get(self, name, default=None):
+        p = self.__find(name)
+        if p is None:
+            return default
+        return PinView(self.__module, p)
+
+    def __getitem__(self, name):
+        p = self.__find(name)
+        if p is None:
+            raise KeyError(name)
+        return PinView(self.__module, p)
+
+    def __contains__(self, name):
+        return self.__find(name) is not None
+
+    has_key = __contains__
+
+    def __len__(self):
+        return len(self.__pins)
+
+    def __iter__(self):
+        module = self.__module
+        return (module.pinName(p) for p in self.__pins)
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self.__iter__())
+
+    def itervalues(self):
+        module = self.__module
+        return (PinView(module, p) for p in self.__pins)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        module = self.__module
+        return ((module.pinName(p), PinView(module, p)) for p in self.__pins)
+
+    def items(self):
+        return list(self.iteritems())
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,346 @@
+import bisect
+from Generic import *
+import Port
+
+
+class Bus(Generic):
+    """
+    A multi-bit port or wire, stored once instead of one object per bit.
+
+    Bit i of a bus called x is named x[i]. The bits of a port bus are Port
+    objects that are only created when they are first looked up. A wire bus
+    only records the range of the bit nets created so far, its bits are the
+    nets of the module. A range may also be given as msb and lsb, in either
+    order.
+
+    >>> import Module, PortIn
+    >>> mod = Module.Module({"name": "top"})
+    >>> bus = mod.new_bus({"name": "data", "width": 8, "direction": "in",
+    ...                    "portClass": PortIn.PortIn})
+    >>> (bus.msb, bus.lsb, bus.isLoaded(3))
+    (7, 0, False)
+    >>> port = mod.ports["data[3]"]
+    >>> (port.name, port.busName, port.bitIdx, port.direction, bus.isLoaded(3))
+    ('data[3]', 'data', 3, 'in', True)
+    >>> mod.ports["data[3]"] is port, "data[8]" in mod.ports, len(mod.ports)
+    (True, False, 8)
+    >>> bus = mod.new_bus({"name": "a", "msb": 0, "lsb": 3, "direction": "in"})
+    >>> (bus.msb, bus.lsb, bus.width, len(mod.ports))
+    (3, 0, 4, 12)
+
+    The bits of a wire bus are the nets that exist:
+
+    >>> wire = mod.new_bus({"name": "w", "width": 4})
+    >>> net = mod.new_net({"name": "w[2]", "width": 1, "busMember": True,
+    ...                    "bitIdx": 2, "busName": "w"})
+    >>> wire.isLoaded(1), wire.isLoaded(2), [ n.name for n in wire.loadedBits() ]
+    (False, True, ['w[2]'])
+    """
+    __slots__ = ('__lsb', '__width', '__direction', '__portClass', '__bits')
+
+    def __init__(self, attrs):
+        Generic.__init__(self, attrs)
+
+        msb = self.get(attrs, "msb", require=False)
+        self.__lsb = self.get(attrs, "lsb", require=False) or 0
+        if msb is None:
+            self.__width = self.get(attrs, "width")
+        else:
+            # [0:3] is the same range as [3:0]
+            self.__width = abs(msb - self.__lsb) + 1
+            self.__lsb = min(msb, self.__lsb)
+        if self.__width < 0:
+            raise Exception("Bus " + self.name + " has negative width " +
+                            str(self.__width))
+        # None for a wire bus
+        self.__direction = self.get(attrs, "direction", require=False)
+        self.__portClass = self.get(attrs, "portClass", require=False) or Port.Port
+        if self.__direction is None:
+            self.__bits = None
+        else:
+            self.__bits = [ None ] * self.__width
+
+    width     = property(lambda self: self.__width)
+    lsb       = property(lambda self: self.__lsb)
+    msb       = property(lambda self: self.__lsb + self.__width - 1)
+    direction = property(lambda self: self.__direction)
+    portClass = property(lambda self: self.__portClass)
+    isPort    = property(lambda self: self.__direction is not None)
+
+    def bitName(self, i):
+        return self.name + "[" + str(i) + "]"
+
+    def bitNames(self):
+        " the names of all bits, lsb first "
+        name = self.name
+        return [ name + "[" + str(i) + "]"
+                 for i in xrange(self.__lsb, self.__lsb + self.__width) ]
+
+    def isLoaded(self, i):
+        """ True once the Port object of bit i exists, for a wire bus once
+        the net exists """
+        if self.__bits is None:
+            return self.module.nets.get(self.bitName(i)) is not None
+        k = i - self.__lsb
+        return k >= 0 and k < self.__width and self.__bits[k] is not None
+
+    def bit(self, i):
+        """ The Port (for a wire bus the net) of bit i, None if i is outside
+        of the bus """
+        k = i - self.__lsb
+        if k < 0 or k >= self.__width:
+            return None
+        if self.__bits is None:
+            return self.module.nets.get(self.bitName(i))
+        port = self.__bits[k]
+        if port is None:
+            port = self.__portClass({ "name": self.bitName(i), "width": 1,
+                                      "module": self.module,
+                                      "direction": self.__direction,
+                                      "busMember": True, "bitIdx": i,
+                                      "busName": self.name })
+            self.__bits[k] = port
+        return port
+
+    def bits(self):
+        " all bits, lsb first "
+        return [ self.bit(i) for i in xrange(self.__lsb, self.__lsb + self.__width) ]
+
+    def loadedBits(self):
+        """ the Port objects of the bits that have been created so far, for a
+        wire bus the nets that exist """
+        if self.__bits is None:
+            return [ net for net in self.bits() if net is not None ]
+        return [ port for port in self.__bits if port is not None ]
+
+    def addBit(self, i, port=None):
+        """ Widen the bus to include bit i and, for a port bus, make port its
+        Port object. Returns the number of bits the bus grew by """
+        if self.__width == 0:
+            self.__lsb = i
+        grow = 0
+        if i < self.__lsb:
+            grow = self.__lsb - i
+            if self.__bits is not None:
+                self.__bits[0:0] = [ None ] * grow
+            self.__lsb = i
+        elif i > self.msb:
+            grow = i - self.msb
+            if self.__bits is not None:
+                self.__bits.extend([ None ] * grow)
+        self.__width += grow
+        if port is not None:
+            self.__bits[i - self.__lsb] = port
+        return grow
+
+
+class PortMap(object):
+    """
+    The ports of a module, by name and in declaration order. Scalar ports
+    are stored as they are, multi-bit ports as Bus objects, whose bits are
+    still looked up as "name[i]". It supports the read-only dict methods.
+
+    >>> import Module, PortOut
+    >>> mod = Module.Module({"name": "top"})
+    >>> port = mod.add_port(PortOut.PortOut({"name": "y", "width": 1,
+    ...     "module": mod, "busMember": False, "bitIdx": None, "busName": None}))
+    >>> bus = mod.new_bus({"name": "q", "width": 2, "direction": "out"})
+    >>> mod.ports.keys(), mod.ports.index("q[1]"), mod.ports.at(1).name
+    (['y', 'q[0]', 'q[1]'], 2, 'q[0]')
+
+    Bits added one at a time only widen their bus when they are next to it,
+    other bits are kept as they are:
+
+    >>> for i in (1, 2, 7):
+    ...     port = mod.add_port(PortOut.PortOut({"name": "z[%d]" % i, "width": 1,
+    ...         "module": mod, "busMember": True, "bitIdx": i, "busName": "z"}))
+    >>> mod.ports.keys(), mod.ports.bus("z").width, mod.ports.index("z[7]")
+    (['y', 'q[0]', 'q[1]', 'z[1]', 'z[2]', 'z[7]'], 2, 5)
+    """
+    __slots__ = ('__entries', '__scalars', '__buses', '__len', '__starts',
+                 '__startList')
+
+    def __init__(self):
+        # Port or Bus objects, in declaration order
+        self.__entries = []
+        self.__scalars = dict()
+        self.__buses = dict()
+        self.__len = 0
+        # index of the first port of every entry, built by index()/at()
+        self.__starts = None
+        self.__startList = None
+
+    def __replace(self, old, new):
+        entries = self.__entries
+        for i in xrange(len(entries)):
+            if entries[i] is old:
+                entries[i] = new
+                return
+
+    def add(self, port):
+        """ add a Port. A bus member becomes a bit of the bus of that name if
+        it is inside of the bus or next to it, otherwise it is added like a
+        scalar port so that no bits are made up in between """
+        self.__starts = None
+        self.__startList = None
+        bus = None
+        if port.busName is not None and port.name not in self.__scalars:
+            bus = self.__buses.get(port.busName)
+            if bus is None:
+                bus = self.addBus(Bus({ "name": port.busName, "module": port.module,
+                                        "width": 0, "direction": port.direction,
+                                        "portClass": type(port) }))
+            elif (bus.width and
+                  (port.bitIdx < bus.lsb - 1 or port.bitIdx > bus.msb + 1)):
+                bus = None
+        if bus is None:
+            old = self.__scalars.get(port.name)
+            self.__scalars[port.name] = port
+            if old is None:
+                self.__entries.append(port)
+                self.__len += 1
+            else:
+                self.__replace(old, port)
+            return port
+
+        self.__len += bus.addBit(port.bitIdx, port)
+        return port
+
+    def addBus(self, bus):
+        " add a Bus, replacing a bus of the same name "
+        self.__starts = None
+        self.__startList = None
+        old = self.__buses.get(bus.name)
+        self.__buses[bus.name] = bus
+        if old is None:
+            self.__entries.append(bus)
+        else:
+            self.__replace(old, bus)
+            self.__len -= old.width
+        self.__len += bus.width
+        return bus
+
+    def entries(self):
+        " the scalar ports and buses, in declaration order "
+        return list(self.__entries)
+
+    def buses(self):
+        return [ e for e in self.__entries if isinstance(e, Bus) ]
+
+    def bus(self, name):
+        return self.__buses.get(name)
+
+    def __bit(self, name):
+        " the bus bit called name, None if there is none "
+        k = name.rfind('[')
+        if k <= 0 or name[-1:] != ']':
+            return None
+        bus = self.__buses.get(name[:k])
+        if bus is None:
+            return None
+        try:
+            i = int(name[k + 1:-1])
+        except ValueError:
+            return None
+        return bus.bit(i)
+
+    def get(self, name, default=None):
+        port = self.__scalars.get(name)
+        if port is not None:
+            return port
+        # this is called for every connection while reading, so only
+        # parse names that can be bus bits
+        if self.__buses and name[-1:] == ']':
+            port = self.__bit(name)
+            if port is not None:
+                return port
+        return default
+
+    def __getitem__(self, name):
+        port = self.get(name)
+        if port is None:
+            raise KeyError(name)
+        return port
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    has_key = __contains__
+
+    def __len__(self):
+        return self.__len
+
+    def __iter__(self):
+        for e in self.__entries:
+            if isinstance(e, Bus):
+                for name in e.bitNames():
+                    yield name
+            else:
+                yield e.name
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self.__iter__())
+
+    def itervalues(self):
+        for e in self.__entries:
+            if isinstance(e, Bus):
+                for port in e.bits():
+                    yield port
+            else:
+                yield e
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        return ((port.name, port) for port in self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __index(self):
+        " {(isBus, name): first index} and the list of first indices "
+        if self.__starts is None:
+            starts = dict()
+            startList = []
+            n = 0
+            for e in self.__entries:
+                isBus = isinstance(e, Bus)
+                starts[(isBus, e.name)] = n
+                startList.append(n)
+                if isBus:
+                    n += e.width
+                else:
+                    n += 1
+            self.__starts = starts
+            self.__startList = startList
+        return self.__starts
+
+    def index(self, name):
+        " the position of port name in keys() "
+        starts = self.__index()
+        if name in self.__scalars:
+            return starts[(False, name)]
+        port = self.__bit(name)
+        if port is None:
+            raise KeyError(name)
+        bus = self.__buses[port.busName]
+        return starts[(True, bus.name)] + port.bitIdx - bus.lsb
+
+    def at(self, i):
+        " the i'th port of values() "
+        if i < 0 or i >= self.__len:
+            raise IndexError(i)
+        self.__index()
+        k = bisect.bisect_right(self.__startList, i) - 1
+        e = self.__entries[k]
+        if isinstance(e, Bus):
+            return e.bit(e.lsb + i - self.__startList[k])
+        return e
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
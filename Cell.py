@@ -1,17 +1,18 @@
 from Generic import *
-from ordereddict import OrderedDict
 import Pin
+from SymbolTable import symbols
 
 class Cell(Generic):
     "Defines an instantiated Cell"
+    __slots__ = ('__submodname', '__pins', '__submod')
 
     def __init__(self, attrs):
         Generic.__init__(self, attrs)
 
-        self.__submodname = self.get("submodname")
+        self.__submodname = self.get(attrs, "submodname")
 
         # to be linked
-        self.__pins = OrderedDict()
+        self.__pins = PinMap()
         self.__submod = None
 
 
@@ -22,12 +23,99 @@ class Cell(Generic):
     def new_pin(self, pinAttr):
         pinAttr["cell"] = self
         pinAttr["module"] = self.module
+        pinAttr["name"] = symbols.intern(pinAttr["name"])
         # create new pin here
         pin = Pin.Pin(pinAttr)
-        self.__pins[pin.name] = pin
+        old = self.__pins.add(pin)
+        if old is not None:
+            old.unlink()
+        self.module.changed(self)
         return pin
 
     def linkMod(self, mod):
         if self.__submod != None:
             print "Warning: " + self.name + " multiply linked"
         self.__submod = mod
+
+    def unlinkMod(self):
+        " forget the submodule, it has been redefined "
+        self.__submod = None
+
+
+class PinMap(object):
+    """
+    The pins of a cell, by name and in the order they were added. Cells only
+    have a handful of pins, so a list searched by name is much smaller than
+    an OrderedDict and just as fast. It supports the read-only dict methods.
+
+    >>> import Module
+    >>> mod = Module.Module({"name": "top"})
+    >>> cell = mod.new_cell({"name": "U1", "submodname": "ND2D1"})
+    >>> for name in ("A1", "A2", "ZN"): pin = cell.new_pin({"name": name})
+    >>> cell.pins.keys(), "A2" in cell.pins, cell.pins["ZN"].name
+    (['A1', 'A2', 'ZN'], True, 'ZN')
+    """
+    __slots__ = ('__pins',)
+
+    def __init__(self):
+        self.__pins = []
+
+    def add(self, pin):
+        " add pin, returns the pin of the same name it replaced (or None) "
+        pins = self.__pins
+        name = pin.name
+        for i in xrange(len(pins)):
+            if pins[i].name == name:
+                old = pins[i]
+                pins[i] = pin
+                return old
+        pins.append(pin)
+        return None
+
+    def get(self, name, default=None):
+        for pin in self.__pins:
+            if pin.name == name:
+                return pin
+        return default
+
+    def __getitem__(self, name):
+        for pin in self.__pins:
+            if pin.name == name:
+                return pin
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        for pin in self.__pins:
+            if pin.name == name:
+                return True
+        return False
+
+    has_key = __contains__
+
+    def __len__(self):
+        return len(self.__pins)
+
+    def __iter__(self):
+        return (pin.name for pin in self.__pins)
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return [ pin.name for pin in self.__pins ]
+
+    def values(self):
+        return list(self.__pins)
+
+    def itervalues(self):
+        return iter(self.__pins)
+
+    def items(self):
+        return [ (pin.name, pin) for pin in self.__pins ]
+
+    def iteritems(self):
+        return ((pin.name, pin) for pin in self.__pins)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,237 @@
+#
+# Connectivity.py
+#
+# The connectivity of a module as sparse matrices in CSR form, for graph
+# algorithms that work on arrays (partitioning, clustering, centrality):
+#
+#   incidence   cells x signals, one entry per connected pin
+#   adjacency   cells x cells, one entry per (driver cell, load cell) pair
+#
+# A matrix is a pair of NumPy arrays (indptr, indices): the columns of row r
+# are indices[indptr[r]:indptr[r+1]]. Cells and signals are numbered like
+# everywhere else: cells in module order (the cell ids of an ArrayModule),
+# signals the ports first, then the nets (see Simulator.row). For an
+# ArrayModule the incidence matrix is the cell/pin columns themselves, see
+# ArrayModule.cellIncidence.
+#
+# scipy.sparse matrices and NetworkX graphs are built from the arrays on
+# request, neither package is needed otherwise.
+#
+import numpy
+
+
+class Connectivity(object):
+    """
+    Sparse connectivity of a module, with the maps between ids and names.
+
+    >>> import Netlist
+    >>> nl = Netlist.Netlist()
+    >>> nl.readYAML("test/gates.yml")
+    >>> nl.readVerilog("test/counter_test.gv")
+    >>> nl.link("counter")
+    >>> conn = Connectivity(nl.mods["counter"])
+    >>> conn.cellNames
+    ['r0', 'r1', 'U1', 'U2', 'U3']
+    >>> (indptr, indices) = conn.incidence()
+    >>> c = conn.cellId("U2")
+    >>> [ conn.signalNames[s] for s in indices[indptr[c]:indptr[c + 1]] ]
+    ['q[0]', 'en', 'c0']
+    >>> (indptr, indices) = conn.adjacency()
+    >>> c = conn.cellId("r0")
+    >>> [ conn.cellNames[d] for d in indices[indptr[c]:indptr[c + 1]] ]
+    ['U1', 'U2']
+    >>> conn.cellNames[conn.drivers()[conn.signalId("c0")]]
+    'U2'
+
+    The array backend gives the same matrices:
+
+    >>> nl2 = Netlist.Netlist()
+    >>> nl2.readYAML("test/gates.yml")
+    >>> nl2.readVerilog("test/counter_test.gv", engine="fast", backend="array")
+    >>> nl2.link("counter")
+    >>> conn2 = Connectivity(nl2.mods["counter"])
+    >>> [ a.tolist() for a in conn2.adjacency() ]
+    [[0, 2, 3, 4, 5, 6], [2, 3, 4, 0, 4, 1]]
+    >>> [ a.tolist() for a in conn2.incidence() ] == [ a.tolist() for a in conn.incidence() ]
+    True
+    >>> conn2.drivers().tolist() == conn.drivers().tolist()
+    True
+    """
+
+    module      = property(lambda self: self.__mod)
+    # id -> name of every cell and signal
+    cellNames   = property(lambda self: self.__cellNames)
+    signalNames = property(lambda self: self.__signalNames)
+
+    def __init__(self, mod):
+        """ The connectivity of mod as it is now, it is not updated when the
+        module changes """
+        self.__mod = mod
+        self.__cellNames = mod.cells.keys()
+        self.__signalNames = mod.ports.keys() + mod.nets.keys()
+        self.__cellIds = None
+        self.__signalIds = None
+        self.__incidence = None
+        self.__adjacency = None
+        self.__drivers = None
+
+    def cellId(self, name):
+        if self.__cellIds is None:
+            self.__cellIds = _ids(self.__cellNames)
+        return self.__cellIds[name]
+
+    def signalId(self, name):
+        if self.__signalIds is None:
+            self.__signalIds = _ids(self.__signalNames)
+        return self.__signalIds[name]
+
+    #
+    # CSR arrays
+    #
+    def incidence(self):
+        """ (indptr, indices) of the cells x signals incidence matrix, one
+        entry per connected pin in pin order, so a cell that connects a
+        signal to several pins has it several times """
+        if self.__incidence is None:
+            mod = self.__mod
+            if mod.backend == "array":
+                self.__incidence = mod.cellIncidence()
+            else:
+                if self.__signalIds is None:
+                    self.__signalIds = _ids(self.__signalNames)
+                ids = self.__signalIds
+                counts = []
+                indices = []
+                for cell in mod.cells.itervalues():
+                    n = len(indices)
+                    for pin in cell.pins.itervalues():
+                        net = pin.net
+                        if net is not None:
+                            indices.append(ids[net.name])
+                    counts.append(len(indices) - n)
+                indptr = numpy.zeros(len(counts) + 1, dtype=numpy.int32)
+                numpy.cumsum(counts, out=indptr[1:])
+                self.__incidence = (indptr, numpy.array(indices, dtype=numpy.int32))
+        return self.__incidence
+
+    def adjacency(self):
+        """ (indptr, indices) of the cells x cells adjacency matrix of the
+        linked module: cell a has an entry for cell b if a drives a signal
+        that b loads. Entries are unique and sorted """
+        if self.__adjacency is None:
+            mod = self.__mod
+            if mod.backend == "array":
+                (src, dst) = self.__arrayEdges()
+            else:
+                (src, dst) = self.__objectEdges()
+            self.__adjacency = _csr(src, dst, len(self.__cellNames))
+        return self.__adjacency
+
+    def drivers(self):
+        """ The cell id driving every signal of the linked module, -1 for
+        signals driven by a port or not at all """
+        if self.__drivers is None:
+            mod = self.__mod
+            if mod.backend == "array":
+                if not mod.linked:
+                    raise Exception("drivers of " + mod.name + " before link")
+                drivers = mod.signalDrivers()
+                self.__drivers = numpy.where(drivers >= 0,
+                                             mod.pinCells()[numpy.maximum(drivers, 0)], -1)
+            else:
+                if mod.dirtyCells():
+                    raise Exception("drivers of " + mod.name + " before link")
+                if self.__cellIds is None:
+                    self.__cellIds = _ids(self.__cellNames)
+                ids = self.__cellIds
+                drivers = []
+                for signals in (mod.ports.itervalues(), mod.nets.itervalues()):
+                    for signal in signals:
+                        cell = getattr(signal.fanin, "cell", None)
+                        if cell is None:
+                            drivers.append(-1)
+                        else:
+                            drivers.append(ids[cell.name])
+                self.__drivers = numpy.array(drivers, dtype=numpy.int32)
+        return self.__drivers
+
+    def __objectEdges(self):
+        mod = self.__mod
+        if mod.dirtyCells():
+            raise Exception("adjacency of " + mod.name + " before link")
+        if self.__cellIds is None:
+            self.__cellIds = _ids(self.__cellNames)
+        ids = self.__cellIds
+        src = []
+        dst = []
+        for signals in (mod.ports.itervalues(), mod.nets.itervalues()):
+            for signal in signals:
+                if signal.fanin is None or not signal.fanout:
+                    continue
+                loads = [ ids[pin.cell.name] for pin in signal.fanout ]
+                src.extend([ ids[signal.fanin.cell.name] ] * len(loads))
+                dst.extend(loads)
+        return (numpy.array(src, dtype=numpy.int64),
+                numpy.array(dst, dtype=numpy.int64))
+
+    def __arrayEdges(self):
+        mod = self.__mod
+        if not mod.linked:
+            raise Exception("adjacency of " + mod.name + " before link")
+        pinCell = mod.pinCells()
+        drivers = mod.signalDrivers()
+        (start, loads) = mod.signalLoads()
+        driverCell = numpy.where(drivers >= 0, pinCell[numpy.maximum(drivers, 0)], -1)
+        src = numpy.repeat(driverCell, numpy.diff(start)).astype(numpy.int64)
+        dst = pinCell[loads].astype(numpy.int64)
+        driven = src >= 0
+        return (src[driven], dst[driven])
+
+    #
+    # other packages
+    #
+    def sparse(self, matrix="incidence"):
+        """ The incidence or the adjacency matrix as a scipy.sparse
+        csr_matrix of ones, needs scipy """
+        import scipy.sparse
+        if matrix == "incidence":
+            (indptr, indices) = self.incidence()
+            shape = (len(self.__cellNames), len(self.__signalNames))
+        elif matrix == "adjacency":
+            (indptr, indices) = self.adjacency()
+            shape = (len(self.__cellNames), len(self.__cellNames))
+        else:
+            raise Exception("Unknown matrix " + str(matrix))
+        data = numpy.ones(len(indices), dtype=numpy.int8)
+        return scipy.sparse.csr_matrix((data, indices, indptr), shape=shape)
+
+    def graph(self):
+        """ The adjacency as a networkx.DiGraph of cell names, needs
+        networkx. Meant for small designs, the graph holds Python objects
+        for every cell and edge """
+        import networkx
+        (indptr, indices) = self.adjacency()
+        names = self.__cellNames
+        graph = networkx.DiGraph()
+        graph.add_nodes_from(names)
+        rows = numpy.repeat(numpy.arange(len(names)), numpy.diff(indptr))
+        graph.add_edges_from([ (names[a], names[b])
+                               for (a, b) in zip(rows.tolist(), indices.tolist()) ])
+        return graph
+
+
+def _ids(names):
+    " {name: id} of a list of names "
+    return dict([ (name, i) for (i, name) in enumerate(names) ])
+
+def _csr(src, dst, n):
+    " (indptr, indices) of the unique (src, dst) pairs of an n x n matrix "
+    keys = numpy.unique(src * n + dst)
+    indptr = numpy.zeros(n + 1, dtype=numpy.int32)
+    numpy.cumsum(numpy.bincount(keys // n, minlength=n), out=indptr[1:])
+    return (indptr, (keys % n).astype(numpy.int32))
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
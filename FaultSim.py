@@ -0,0 +1,419 @@
+#
+# FaultSim.py
+#
+# Stuck-at fault simulation on top of the bit-parallel Simulator.
+#
+# Every pin of the cells of the top module that the cell primitive uses
+# gets a stuck-at-0 and a stuck-at-1 fault. The design is treated as full
+# scan: the sequential cells are cut, their outputs are driven like the
+# primary inputs and their inputs are observed like the primary outputs.
+#
+# Patterns are simulated in blocks of 64 * words random patterns. For each
+# block the good circuit is simulated once, then the undetected faults are
+# simulated in batches, one fault per slot of a (rows, batch, words)
+# value array. Only the signals that differ from the good circuit in some
+# slot are stored, so a batch only costs as much as the union of the
+# fanout cones its faults actually disturb. Detected faults are dropped
+# and not simulated again.
+#
+# Faults on the output pin of a cell that drives a net with a single load
+# are equivalent to the faults on that load pin, collapsing keeps only the
+# latter.
+#
+import os
+import tempfile
+import multiprocessing
+import cPickle as pickle
+import numpy
+from ordereddict import OrderedDict
+import PortClk
+import Simulator
+
+
+_ONES = numpy.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+class FaultSimulator(object):
+    """
+    Grades random patterns against the stuck-at faults of a linked module.
+
+    >>> import Netlist
+    >>> nl = Netlist.Netlist()
+    >>> nl.readYAML("test/gates.yml")
+    >>> nl.readVerilog("test/adder_test.gv")
+    >>> nl.link("half_adder")
+    >>> fs = FaultSimulator(nl, "half_adder")
+    >>> (fs.uncollapsed, fs.faults)
+    (12, 12)
+    >>> fs.run(blocks=1)
+    >>> report = fs.report()
+    >>> (report["detected"], report["coverage"])
+    (12, 100.0)
+
+    Faults on an output pin that feeds a single cell collapse into the fault
+    on that input pin:
+
+    >>> nl.readVerilog("test/counter_test.gv")
+    >>> nl.link("counter")
+    >>> fs = FaultSimulator(nl, "counter")
+    >>> (fs.uncollapsed, fs.faults)
+    (26, 20)
+    >>> fs.run(blocks=2)
+    >>> fs.report()["undetected"], fs.blocks
+    (0, 1)
+    """
+
+    words       = property(lambda self: self.__sim.words)
+    simulator   = property(lambda self: self.__sim)
+    # number of faults before and after collapsing
+    uncollapsed = property(lambda self: self.__uncollapsed)
+    faults      = property(lambda self: len(self.__value))
+    # number of pattern blocks simulated so far
+    blocks      = property(lambda self: self.__blocks)
+
+    def __init__(self, netlist, topModule=None, words=1, batch=64, collapse=True):
+        self.__sim = Simulator.Simulator(netlist, topModule, words)
+        self.__batch = batch
+        self.__blocks = 0
+        sim = self.__sim
+        mod = sim.module
+        levels = sim.levels
+
+        # the rows driven like primary inputs: the input ports that are not
+        # clocks and the outputs of the sequential cells, and the rows
+        # observed like primary outputs
+        self.__inputRows = [ sim.row(port.name) for port in mod.ports.itervalues()
+                             if port.direction == "in"
+                             and not isinstance(port, PortClk.PortClk) ]
+        observe = [ sim.row(port.name) for port in mod.ports.itervalues()
+                    if port.direction == "out" ]
+        for group in levels[0]:
+            self.__inputRows.extend(group[2].tolist())
+            observe.extend(group[1].ravel().tolist())
+        self.__inputRows = [ r for r in self.__inputRows if r < sim.zeroRow ]
+        self.__observe = numpy.unique(numpy.array(
+            [ r for r in observe if r < sim.zeroRow ], dtype=numpy.intp))
+
+        # number of pins loading every row
+        nrows = sim.sinkRow + 1
+        loads = numpy.zeros(nrows, dtype=numpy.int64)
+        for level in levels:
+            for group in level:
+                loads += numpy.bincount(group[1].ravel(), minlength=nrows)
+        nports = len(mod.ports)
+
+        # the fault list: level, group, position in the group, argument
+        # (-1 for the output pin) and stuck-at value of every fault
+        cols = ([], [], [], [], [])
+        self.__uncollapsed = 0
+        for (l, level) in enumerate(levels):
+            for (g, group) in enumerate(level):
+                (function, ins, outs, submodname, cells) = group
+                n = len(outs)
+                nargs = ins.shape[1]
+                keepOut = numpy.ones(n, dtype=bool)
+                if collapse:
+                    keepOut = ~((loads[outs] == 1) & (outs >= nports) &
+                                (outs < sim.zeroRow))
+                self.__uncollapsed += 2 * n * (nargs + 1)
+                pos = numpy.concatenate([ numpy.repeat(numpy.arange(n), nargs),
+                                          numpy.flatnonzero(keepOut) ])
+                arg = numpy.concatenate([ numpy.tile(numpy.arange(nargs), n),
+                                          -numpy.ones(keepOut.sum(), dtype=numpy.int64) ])
+                for value in (0, 1):
+                    cols[0].append(numpy.repeat(l, len(pos)))
+                    cols[1].append(numpy.repeat(g, len(pos)))
+                    cols[2].append(pos)
+                    cols[3].append(arg)
+                    cols[4].append(numpy.repeat(value, len(pos)))
+        (self.__level, self.__group, self.__pos, self.__arg, self.__value) = \
+            [ numpy.concatenate(c + [ numpy.zeros(0, dtype=numpy.int64) ]).astype(numpy.int32)
+              for c in cols ]
+        self.__detected = numpy.zeros(len(self.__value), dtype=bool)
+
+        # slot of the rows that differ from the good circuit, see __grade
+        self.__slot = -numpy.ones(nrows, dtype=numpy.intp)
+        self.__dirty = numpy.zeros(nrows, dtype=bool)
+
+    #
+    # faults
+    #
+    def faultName(self, i):
+        " cell.pin/sa0 or cell.pin/sa1 of fault i "
+        group = self.__sim.levels[self.__level[i]][self.__group[i]]
+        (function, ins, outs, submodname, cells) = group
+        (function, args, output) = self.__sim.primitive(submodname)
+        cell = cells[self.__pos[i]]
+        if not isinstance(cell, basestring):
+            cell = self.__sim.module.cellName(int(cell))
+        if self.__arg[i] < 0:
+            pin = output
+        else:
+            pin = args[self.__arg[i]]
+        return cell + "." + pin + "/sa" + str(self.__value[i])
+
+    def undetected(self):
+        " the names of the faults not detected so far "
+        return [ self.faultName(i) for i in numpy.flatnonzero(~self.__detected) ]
+
+    def detected(self):
+        " bool array, True for the faults detected so far "
+        return self.__detected.copy()
+
+    def report(self):
+        " the fault coverage so far "
+        detected = int(self.__detected.sum())
+        faults = len(self.__detected)
+        report = OrderedDict()
+        report["faults"] = self.__uncollapsed
+        report["collapsed"] = faults
+        report["detected"] = detected
+        report["undetected"] = faults - detected
+        report["coverage"] = faults and round(100.0 * detected / faults, 2) or 0.0
+        report["patterns"] = self.__blocks * self.__sim.patterns
+        return report
+
+    #
+    # simulation
+    #
+    def applyBlock(self, block, seed=0):
+        """ Drive the inputs with the random patterns of block and simulate
+        the good circuit, the patterns only depend on block and seed """
+        sim = self.__sim
+        rng = numpy.random.RandomState((seed * 1000003 + block) & 0x7FFFFFFF)
+        words = rng.randint(0, 1 << 32, size=(len(self.__inputRows), sim.words, 2))
+        words = words.astype(numpy.uint64)
+        sim.values[self.__inputRows] = (words[:, :, 0] << numpy.uint64(32)) | words[:, :, 1]
+        sim.evaluate()
+
+    def grade(self, faults=None):
+        """ Simulate faults (an array of fault indices, all undetected faults
+        by default) against the patterns applied last. Marks and returns
+        the indices of the faults detected """
+        if faults is None:
+            faults = numpy.flatnonzero(~self.__detected)
+        # faults of neighbouring cells share more of their cones
+        faults = faults[numpy.lexsort((self.__pos[faults], self.__group[faults],
+                                       self.__level[faults]))]
+        found = []
+        for start in xrange(0, len(faults), self.__batch):
+            batch = faults[start:start + self.__batch]
+            found.append(batch[self.__grade(batch)])
+        found = numpy.concatenate(found + [ numpy.zeros(0, dtype=numpy.intp) ])
+        self.__detected[found] = True
+        return found
+
+    def __grade(self, batch):
+        " the bool detection mask of a batch of faults "
+        sim = self.__sim
+        levels = sim.levels
+        good = sim.values
+        nslots = len(batch)
+        shape = (nslots, sim.words)
+        detected = numpy.zeros(nslots, dtype=bool)
+        slot = self.__slot
+        dirty = self.__dirty
+        store = _Store(good, slot, dirty, shape)
+
+        # the faults of every group
+        inject = dict()
+        for (f, i) in enumerate(batch):
+            key = (self.__level[i], self.__group[i])
+            word = self.__value[i] and _ONES or numpy.uint64(0)
+            inject.setdefault(key, []).append((self.__pos[i], self.__arg[i], f, word))
+
+        # faults on the sequential cells: outputs are driven stuck, inputs
+        # are observed directly
+        for (g, group) in enumerate(levels[0]):
+            for (pos, arg, f, word) in inject.get((0, g), ()):
+                if arg < 0:
+                    row = group[2][pos]
+                    if row < sim.zeroRow:
+                        values = store.get(numpy.array([ row ]))
+                        values[0, f] = word
+                        store.put(numpy.array([ row ]), values)
+                else:
+                    detected[f] = (good[group[1][pos, arg]] != word).any()
+
+        first = max(1, self.__level[batch].min())
+        for l in xrange(first, len(levels)):
+            for (g, group) in enumerate(levels[l]):
+                (function, ins, outs, submodname, cells) = group
+                faults = inject.get((l, g), ())
+                if store.empty and not faults:
+                    continue
+                sel = dirty[ins].any(axis=1)
+                for (pos, arg, f, word) in faults:
+                    sel[pos] = True
+                sel = numpy.flatnonzero(sel)
+                if len(sel) == 0:
+                    continue
+                args = [ store.get(ins[sel, i]) for i in xrange(ins.shape[1]) ]
+                local = None
+                if faults:
+                    local = dict([ (p, k) for (k, p) in enumerate(sel) ])
+                    for (pos, arg, f, word) in faults:
+                        if arg >= 0:
+                            args[arg][local[pos], f] = word
+                values = numpy.empty((len(sel),) + shape, dtype=numpy.uint64)
+                values[...] = function(*args)
+                for (pos, arg, f, word) in faults:
+                    if arg < 0:
+                        values[local[pos], f] = word
+                rows = outs[sel]
+                # only store the signals that differ from the good circuit
+                diff = (values != good[rows][:, None, :]).reshape(len(sel), -1).any(axis=1)
+                diff &= rows < sim.zeroRow
+                if diff.any():
+                    store.put(rows[diff], values[diff])
+
+        observed = self.__observe[dirty[self.__observe]]
+        if len(observed):
+            values = store.get(observed)
+            detected |= (values != good[observed][:, None, :]).any(axis=2).any(axis=0)
+        store.clear()
+        return detected
+
+    def run(self, blocks, seed=0, workers=1, checkpoint=None):
+        """ Grade blocks pattern blocks (of 64 * words random patterns each)
+        with fault dropping.
+
+        With workers > 1 (None for one per CPU) the undetected faults of
+        every block are sharded across a pool of forked processes. With a
+        checkpoint file the state is saved after every block, and a run
+        with the same faults and seed continues after the last saved block
+        """
+        if checkpoint is not None:
+            self.__resume(checkpoint, seed)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        pool = None
+        if workers > 1:
+            global _shardSimulator
+            # the workers inherit the simulator when they are forked
+            _shardSimulator = self
+            pool = multiprocessing.Pool(workers)
+        try:
+            for block in xrange(self.__blocks, blocks):
+                if self.__detected.all():
+                    break
+                faults = numpy.flatnonzero(~self.__detected)
+                if pool is None:
+                    self.applyBlock(block, seed)
+                    self.grade(faults)
+                else:
+                    shards = [ (block, seed, shard)
+                               for shard in numpy.array_split(faults, workers) ]
+                    for found in pool.map(_gradeShard, shards):
+                        self.__detected[found] = True
+                self.__blocks = block + 1
+                if checkpoint is not None:
+                    self.__save(checkpoint, seed)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def __state(self, seed):
+        return { "faults": len(self.__value), "seed": seed,
+                 "words": self.__sim.words }
+
+    def __save(self, checkpoint, seed):
+        " atomically write the detected faults and the blocks done "
+        state = self.__state(seed)
+        state["blocks"] = self.__blocks
+        state["detected"] = numpy.packbits(self.__detected)
+        directory = os.path.dirname(os.path.abspath(checkpoint))
+        (fd, tmp) = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            FH = os.fdopen(fd, 'wb')
+            pickle.dump(state, FH, pickle.HIGHEST_PROTOCOL)
+            FH.close()
+            os.rename(tmp, checkpoint)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def __resume(self, checkpoint, seed):
+        " continue from checkpoint if it was written for the same run "
+        if not os.path.exists(checkpoint):
+            return
+        FH = open(checkpoint, 'rb')
+        try:
+            state = pickle.load(FH)
+        finally:
+            FH.close()
+        for (key, value) in self.__state(seed).iteritems():
+            if state.get(key) != value:
+                print "Warning: " + checkpoint + " is for another run, starting over"
+                return
+        n = len(self.__value)
+        self.__detected = numpy.unpackbits(state["detected"])[:n].astype(bool)
+        self.__blocks = state["blocks"]
+
+
+class _Store(object):
+    """ The faulty values of a batch: a slot in buf for every row that
+    differs from the good circuit in some fault slot """
+
+    def __init__(self, good, slot, dirty, shape):
+        self.good = good
+        self.slot = slot
+        self.dirty = dirty
+        self.shape = shape
+        self.rows = []
+        self.buf = numpy.empty((64,) + shape, dtype=numpy.uint64)
+        self.used = 0
+
+    empty = property(lambda self: self.used == 0)
+
+    def get(self, rows):
+        " the (rows, slots, words) values of rows "
+        values = numpy.empty((len(rows),) + self.shape, dtype=numpy.uint64)
+        values[...] = self.good[rows][:, None, :]
+        s = self.slot[rows]
+        faulty = s >= 0
+        if faulty.any():
+            values[faulty] = self.buf[s[faulty]]
+        return values
+
+    def put(self, rows, values):
+        s = self.slot[rows]
+        new = s < 0
+        n = int(new.sum())
+        if n:
+            if self.used + n > len(self.buf):
+                size = max(2 * len(self.buf), self.used + n)
+                buf = numpy.empty((size,) + self.shape, dtype=numpy.uint64)
+                buf[:self.used] = self.buf[:self.used]
+                self.buf = buf
+            s[new] = numpy.arange(self.used, self.used + n)
+            self.slot[rows[new]] = s[new]
+            self.dirty[rows[new]] = True
+            self.rows.append(rows[new])
+            self.used += n
+        self.buf[s] = values
+
+    def clear(self):
+        " reset the slots of all stored rows "
+        for rows in self.rows:
+            self.slot[rows] = -1
+            self.dirty[rows] = False
+        self.rows = []
+        self.used = 0
+
+
+# the FaultSimulator of a run() with workers, inherited by the workers
+_shardSimulator = None
+
+def _gradeShard(job):
+    " run() worker: grade a shard of the faults against a pattern block "
+    (block, seed, faults) = job
+    _shardSimulator.applyBlock(block, seed)
+    return _shardSimulator.grade(faults)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -1,15 +1,22 @@
 class Generic(object):
-    "A generic pyNet object that holds some common code"
-    def __init__(self, attrs):
-        self.__attrs = attrs
-        self.__name   = self.get("name")
-        self.__module = self.get("module")
+    """A generic pyNet object that holds some common code
+
+    Netlists hold millions of these objects, so all classes derived from
+    Generic use __slots__ and only keep the fields they need. The attrs
+    dict passed to the constructor is not retained.
+    """
+    __slots__ = ('__name', '__module')
 
+    def __init__(self, attrs):
+        self.__name   = self.get(attrs, "name")
+        self.__module = self.get(attrs, "module")
 
-    def get(self, name, require=True):
+    @staticmethod
+    def get(attrs, name, require=True):
+        " look up name in a constructor attrs dict "
         ret = None
-        if name in self.__attrs:
-            ret = self.__attrs[name]
+        if name in attrs:
+            ret = attrs[name]
         elif require:
             raise Exception(name + " not defined")
         return ret
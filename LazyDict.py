@@ -0,0 +1,76 @@
+class _Deferred(object):
+    "Placeholder for a LazyDict value that has not been built yet"
+    __slots__ = ('loader',)
+    def __init__(self, loader):
+        self.loader = loader
+
+
+class LazyDict(dict):
+    """
+    A dict whose values can be registered as loader callbacks. The keys are
+    known up front, a value is built by calling its loader the first time it
+    is looked up and then replaces the loader.
+
+    >>> d = LazyDict()
+    >>> d["a"] = 1
+    >>> d.setLazy("b", lambda: 2)
+    >>> sorted(d.keys()), d.isLoaded("b")
+    (['a', 'b'], False)
+    >>> d["b"], d.isLoaded("b")
+    (2, True)
+    """
+
+    def setLazy(self, key, loader):
+        " Register loader() to build the value of key on first access "
+        dict.__setitem__(self, key, _Deferred(loader))
+
+    def isLoaded(self, key):
+        return not isinstance(dict.__getitem__(self, key), _Deferred)
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, _Deferred):
+            value = value.loader()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return dict.pop(self, key, *default)
+
+    def itervalues(self):
+        for key in self.keys():
+            yield self[key]
+
+    def iteritems(self):
+        for key in self.keys():
+            yield (key, self[key])
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def copy(self):
+        return dict(self.iteritems())
+
+    def __reduce__(self):
+        # loaders are not picklable, so build everything first
+        return (LazyDict, (), None, None, self.iteritems())
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -3,43 +3,723 @@ from ordereddict import OrderedDict
 import Cell
 import Net
 import Port
+import PortClk
+import Bus
+import hashlib
+from SymbolTable import symbols
 
 
 class Module(Generic):
-    "Defines a Verilog Module"
+    """Defines a Verilog Module
+
+    After the first link the module keeps track of the cells and nets that
+    changed, so the next link only has to look at those. Every change also
+    bumps the revision, which tells cached results that they are stale.
+
+    >>> import Netlist
+    >>> nl = Netlist.Netlist()
+    >>> nl.readYAML("test/gates.yml")
+    >>> nl.readVerilog("test/adder_test.gv")
+    >>> nl.link("adder4")
+    >>> ha = nl.mods["half_adder"]
+    >>> ha.dirtyCells(), ha.ports["s"].fanin.cell.name
+    ([], 'U1')
+    >>> s0 = ha.new_net({"name": "s0", "width": 1, "busMember": False,
+    ...                  "bitIdx": None, "busName": None})
+    >>> ha.cells["U1"].pins["Z"].connectNet(s0)
+    >>> cell = ha.new_cell({"name": "U3", "submodname": "BUFFD1"})
+    >>> cell.new_pin({"name": "I"}).connectNet(s0)
+    >>> cell.new_pin({"name": "Z"}).connectNet(ha.ports["s"])
+    >>> sorted([ c.name for c in ha.dirtyCells() ])
+    ['U1', 'U3']
+    >>> nl.link("adder4")
+    >>> ha.dirtyCells(), ha.ports["s"].fanin.cell.name, s0.fanin.cell.name
+    ([], 'U3', 'U1')
+
+    Linking again is a no-op:
+
+    >>> nl.link("adder4")
+    >>> [ p.cell.name for p in ha.ports["a"].fanout ]
+    ['U1', 'U2']
+
+    Cells are linked with the pin table of their submodule:
+
+    >>> sorted([ (name, isInput) for (name, (port, isInput))
+    ...          in nl.mods["XOR2D1"].pinTable().items() ])
+    [('A1', True), ('A2', True), ('Z', False)]
+
+    levelize() orders the cells topologically, the registers of a design
+    break its feedback loops:
+
+    >>> nl.readVerilog("test/counter_test.gv")
+    >>> nl.link("counter")
+    >>> counter = nl.mods["counter"]
+    >>> [ [ c.name for c in level ] for level in counter.levelize() ]
+    [['r0', 'r1'], ['U1', 'U2'], ['U3']]
+    >>> counter.levelize() is counter.levelize()
+    True
+
+    The cones of a net are memoized until the next change:
+
+    >>> sorted([ c.name for c in counter.fanoutCone("c0") ])
+    ['U3', 'r1']
+    >>> sorted([ c.name for c in counter.faninCone("n1") ])
+    ['U2', 'U3', 'r0', 'r1']
+    >>> counter.inFanoutCone(counter.cells["U3"], "en")
+    True
+
+    Link keeps every driver of a net, the design rules report the nets
+    with more than one:
+
+    >>> buf = counter.new_cell({"name": "U4", "submodname": "BUFFD1"})
+    >>> buf.new_pin({"name": "I"}).connectNet(counter.ports["en"])
+    >>> buf.new_pin({"name": "Z"}).connectNet(counter.nets["c0"])
+    >>> nl.link("counter")
+    >>> list(counter.violations())
+    [Violation('multiple drivers', 'counter', 'c0', 'driven by 2 pins: U2.Z, U4.Z')]
+    >>> counter.remove_cell("U2").name, counter.nets["c0"].fanin.cell.name
+    ('U2', 'U4')
+    """
+    __slots__ = ('__cells', '__nets', '__ports', '__wires', '__types',
+                 '__typeCounts', '__extraDrivers', '__revision', '__dirtyCells', '__dirtyNets', '__pinTable',
+                 '__pinTableRevision', '__sequential', '__levels',
+                 '__levelsRevision', '__cones', '__conesRevision',
+                 '__digests', '__digestsRevision')
+
+    # see ArrayModule for the columnar backend
+    backend = "object"
+
     def __init__(self, attrs):
         attrs["module"] = self
         Generic.__init__(self, attrs)
-        
+
         # to be linked
         self.__cells = OrderedDict()
         self.__nets  = OrderedDict()
-        self.__ports = OrderedDict()
+        self.__ports = Bus.PortMap()
+        # wire buses by name, they track the range of the bus member nets
+        self.__wires = OrderedDict()
+        # cell types in order of first use, and {cell type: number of cells}
+        self.__types = []
+        self.__typeCounts = dict()
+        # {net: [pin, ...]} the drivers of nets with more than one driver,
+        # besides net.fanin
+        self.__extraDrivers = dict()
+
+        # the dirty sets are None until the first link, everything needs
+        # to be linked until then
+        self.__revision = 0
+        self.__dirtyCells = None
+        self.__dirtyNets = None
+
+        self.__pinTable = None
+        self.__pinTableRevision = None
+
+        # library cells can be marked sequential, cells with a clock port
+        # are sequential anyway
+        self.__sequential = bool(self.get(attrs, "sequential", require=False))
+        self.__levels = None
+        self.__levelsRevision = None
+        # memoized cones, see fanoutCone
+        self.__cones = dict()
+        self.__conesRevision = None
+        # [module hash, cell digests, net digests], each computed on first
+        # use, see structuralHash
+        self.__digests = None
+        self.__digestsRevision = None
 
     cells = property(lambda self: self.__cells)
     nets  = property(lambda self: self.__nets)
     ports = property(lambda self: self.__ports)
+    wires = property(lambda self: self.__wires)
+    revision = property(lambda self: self.__revision)
+    sequential = property(lambda self: self.__sequential or
+                          any([ isinstance(port, PortClk.PortClk)
+                                for port in self.__ports.itervalues() ]))
+
+    def submodnames(self):
+        " the distinct cell types of this module, in order of first use "
+        return list(self.__types)
+
+    def __countType(self, submodname, n):
+        counts = self.__typeCounts
+        count = counts.get(submodname, 0) + n
+        if count == 0:
+            del counts[submodname]
+            self.__types.remove(submodname)
+        else:
+            if submodname not in counts:
+                self.__types.append(submodname)
+            counts[submodname] = count
+
+    def pinTable(self):
+        """ {port name: (port, isInput)} for all ports, bus bits included.
+        link() resolves every pin of the instances of this module with a
+        single lookup. It is computed once per revision and shared, do not
+        modify it """
+        if self.__pinTableRevision != self.__revision:
+            self.__pinTable = dict([ (port.name, (port, port.direction == "in"))
+                                     for port in self.__ports.itervalues() ])
+            self.__pinTableRevision = self.__revision
+        return self.__pinTable
+
+    #
+    # incremental link
+    #
+    def changed(self, cell=None, net=None):
+        " note a change to the module, cell and net need to be linked again "
+        self.__revision += 1
+        if self.__dirtyCells is not None:
+            if cell is not None:
+                self.__dirtyCells.add(cell)
+            if net is not None:
+                self.__dirtyNets.add(net)
+
+    def dirtyCells(self):
+        " the cells to link, all of them before the first link "
+        if self.__dirtyCells is None:
+            return self.__cells.values()
+        cells = self.__cells
+        return [ cell for cell in self.__dirtyCells
+                 if cells.get(cell.name) is cell ]
+
+    def dirtyNets(self):
+        """ the nets whose fanin or fanout changed since the last link, all
+        of them before the first link """
+        if self.__dirtyNets is None:
+            return self.__nets.values()
+        return list(self.__dirtyNets)
+
+    def submodChanged(self, submodname):
+        " the cells of type submodname need to be linked again "
+        for cell in self.__cells.itervalues():
+            if cell.submodname == submodname:
+                self.changed(cell)
+
+    def markLinked(self):
+        " called by link() once all dirty cells have been linked "
+        self.__dirtyCells = set()
+        self.__dirtyNets = set()
+
+    def extraDrivers(self, net):
+        """ the pins driving net besides net.fanin, link() records them
+        instead of failing so checkDesign can report them """
+        return list(self.__extraDrivers.get(net, ()))
+
+    def addExtraDriver(self, net, pin):
+        " called by Net.setFanin for a net that has a driver already "
+        self.__extraDrivers.setdefault(net, []).append(pin)
+
+    def removeExtraDriver(self, net, pin=None):
+        """ take pin (the first one if None) off the extra drivers of net,
+        returns it or None if it is not one of them """
+        pins = self.__extraDrivers.get(net)
+        if not pins:
+            return None
+        if pin is None:
+            pin = pins.pop(0)
+        elif pin in pins:
+            pins.remove(pin)
+        else:
+            return None
+        if not pins:
+            del self.__extraDrivers[net]
+        return pin
+
+    def clearExtraDrivers(self, net):
+        self.__extraDrivers.pop(net, None)
 
     #link!
+    # the names every instance, pin or bus bit repeats are interned in
+    # SymbolTable.symbols, names that are unique anyway are not
+
     def new_cell(self, cellAttr):
         cellAttr["module"] = self
-        # create new cell here     
+        cellAttr["submodname"] = symbols.intern(cellAttr["submodname"])
+        if cellAttr["name"] in self.__cells:
+            self.remove_cell(cellAttr["name"])
+        # create new cell here
         cell = Cell.Cell(cellAttr)
         self.__cells[cell.name] = cell
+        self.__countType(cell.submodname, 1)
+        self.changed(cell)
+        return cell
+
+    def remove_cell(self, name):
+        " remove cell name, taking its pins off their nets "
+        cell = self.__cells.pop(name)
+        for pin in cell.pins.itervalues():
+            pin.unlink()
+        self.__countType(cell.submodname, -1)
+        self.changed()
+        if self.__dirtyCells is not None:
+            self.__dirtyCells.discard(cell)
         return cell
 
     def new_net(self, netAttr):
         netAttr["module"] = self
+        if netAttr.get("busName") is not None:
+            netAttr["busName"] = symbols.intern(netAttr["busName"])
         net = Net.Net(netAttr)
         self.__nets[net.name] = net
+        self.changed(net=net)
+        if net.busName is not None:
+            self.add_net_bit(net.busName, net.bitIdx)
         return net
 
+    def add_net_bit(self, busName, bitIdx):
+        " widen the wire bus busName to include bitIdx "
+        bus = self.__wires.get(busName)
+        if bus is None:
+            bus = self.new_bus({"name": busName, "width": 0})
+        bus.addBit(int(bitIdx))
+
     def new_port(self, portAttr):
         portAttr["module"] = self
-        port = Port.Port(portAttr)
-        self.__ports[port.name] = port
-        return port
+        portAttr["name"] = symbols.intern(portAttr["name"])
+        portAttr["busName"] = symbols.intern(portAttr.get("busName"))
+        return self.add_port(Port.Port(portAttr))
 
     def add_port(self, port):
-        self.__ports[port.name] = port
-        return port
+        self.changed()
+        return self.__ports.add(port)
+
+    #
+    # levelization
+    #
+    def levelize(self):
+        """ The cells of the linked module in topological order, as a list
+        of levels. Level 0 holds the sequential cells (see sequential),
+        which break the feedback loops of the design: their outputs are
+        sources like the input ports. Every other cell is one level above
+        the highest of the cells driving it. Combinational loops raise an
+        Exception. The levels are kept until the module changes """
+        if self.__levelsRevision != self.__revision:
+            self.__levels = self.computeLevels()
+            self.__levelsRevision = self.__revision
+        return self.__levels
+
+    def computeLevels(self):
+        " levelize() without the cache, a list of lists of cells "
+        if self.dirtyCells():
+            raise Exception("levelize " + self.name + " before link")
+        isSeq = dict()
+        sequentialCells = []
+        combCells = []
+        for cell in self.__cells.itervalues():
+            submod = cell.submod
+            seq = isSeq.get(submod)
+            if seq is None:
+                seq = isSeq[submod] = submod.sequential
+            if seq:
+                sequentialCells.append(cell)
+            else:
+                combCells.append(cell)
+        seqSet = set(sequentialCells)
+
+        # number of combinational cells driving every combinational cell,
+        # counted once per connection
+        pending = dict()
+        current = []
+        for cell in combCells:
+            n = 0
+            for pin in cell.pins.itervalues():
+                net = pin.net
+                if net is None or pin.port.direction != "in":
+                    continue
+                driver = net.fanin
+                if driver is not None and driver.cell not in seqSet:
+                    n += 1
+            if n == 0:
+                current.append(cell)
+            else:
+                pending[cell] = n
+
+        # a level is complete once all cells of the level below are placed
+        levels = [ sequentialCells ]
+        while current:
+            levels.append(current)
+            nextLevel = []
+            for cell in current:
+                for pin in cell.pins.itervalues():
+                    if pin.net is None or pin.port.direction == "in":
+                        continue
+                    for load in pin.net.fanout:
+                        n = pending.get(load.cell)
+                        if n is None:
+                            continue
+                        if n == 1:
+                            del pending[load.cell]
+                            nextLevel.append(load.cell)
+                        else:
+                            pending[load.cell] = n - 1
+            current = nextLevel
+        if pending:
+            names = sorted([ cell.name for cell in pending ])
+            raise Exception("combinational loop in " + self.name + " through "
+                            + ", ".join(names[:10]))
+        return levels
+
+    #
+    # cones
+    #
+    def fanoutCone(self, net, stopAtSequential=True):
+        """ The frozenset of cells in the transitive fanout of net (a net,
+        port or name), following the loads of the output pins of every cell
+        reached. With stopAtSequential, sequential cells are part of the
+        cone but not followed. Cones are memoized per start net until the
+        module changes, and the cones of nets met on the way are reused,
+        so is-in-cone queries after the first are set lookups """
+        return self.__cone(net, True, stopAtSequential)
+
+    def faninCone(self, net, stopAtSequential=True):
+        " like fanoutCone, the cells in the transitive fanin of net "
+        return self.__cone(net, False, stopAtSequential)
+
+    def inFanoutCone(self, cell, net, stopAtSequential=True):
+        " True if cell is in the fanoutCone of net "
+        return cell in self.fanoutCone(net, stopAtSequential)
+
+    def inFaninCone(self, cell, net, stopAtSequential=True):
+        " True if cell is in the faninCone of net "
+        return cell in self.faninCone(net, stopAtSequential)
+
+    def __cone(self, net, forward, stopAtSequential):
+        if self.__conesRevision != self.__revision:
+            if self.dirtyCells():
+                raise Exception("cone of " + self.name + " before link")
+            self.__cones = dict()
+            self.__conesRevision = self.__revision
+        if isinstance(net, basestring):
+            name = net
+            net = self.nets.get(name) or self.ports[name]
+        cones = self.__cones
+        key = (net.name, forward, stopAtSequential)
+        cone = cones.get(key)
+        if cone is not None:
+            return cone
+
+        isSeq = dict()
+        cells = set()
+        seen = set([ net.name ])
+        stack = [ net ]
+        while stack:
+            net = stack.pop()
+            if forward:
+                pins = net.fanout
+            elif net.fanin is not None:
+                pins = [ net.fanin ]
+            else:
+                pins = ()
+            for pin in pins:
+                cell = pin.cell
+                if cell in cells:
+                    continue
+                cells.add(cell)
+                if stopAtSequential:
+                    submod = cell.submod
+                    seq = isSeq.get(submod)
+                    if seq is None:
+                        seq = isSeq[submod] = submod.sequential
+                    if seq:
+                        continue
+                for other in cell.pins.itervalues():
+                    nextNet = other.net
+                    if (nextNet is None or nextNet.name in seen or
+                        (other.port.direction == "in") == forward):
+                        continue
+                    seen.add(nextNet.name)
+                    memo = cones.get((nextNet.name, forward, stopAtSequential))
+                    if memo is not None:
+                        cells.update(memo)
+                    else:
+                        stack.append(nextNet)
+        cone = cones[key] = frozenset(cells)
+        return cone
+
+    #
+    # structural hashing, see Netlist.diff
+    #
+    def structuralHash(self):
+        """ A hex digest of the ports, cells and connectivity of this module:
+        the port names, the cell types and which pins share a net. It does
+        not depend on the module name, on the names of the cells and nets or
+        on the order they were added, so identical blocks hash the same. It
+        is kept until the module changes. Needs numpy. See
+        Netlist.structuralHash for the digest of a hierarchy.
+
+        The hash is a fingerprint, not a canonical form: blocks with
+        different hashes differ, but some regular structures that differ
+        hash the same (one ring of six inverters and two rings of three).
+        Compare the blocks before treating equal hashes as identical """
+        digests = self.__structure()
+        if digests[0] is None:
+            digests[0] = self.computeStructuralHash()
+        return digests[0]
+
+    def cellDigests(self):
+        " {cell name: digest of its name, type and pin connections} "
+        digests = self.__structure()
+        if digests[1] is None:
+            digests[1] = self.computeDigests()
+        return digests[1]
+
+    def netDigests(self):
+        " {net name: digest of its name and the pins it connects} "
+        digests = self.__structure()
+        if digests[2] is None:
+            digests[2] = self.computeNetDigests()
+        return digests[2]
+
+    def __structure(self):
+        if self.__digestsRevision != self.__revision:
+            self.__digests = [ None, None, None ]
+            self.__digestsRevision = self.__revision
+        return self.__digests
+
+    def computeStructuralHash(self):
+        " the structural hash of the cells and pins, see _canonicalHash "
+        signals = dict([ (name, i) for (i, name)
+                         in enumerate(self.__ports.keys() + self.__nets.keys()) ])
+        cellTypes = []
+        pinCell = []
+        pinNames = []
+        pinSignal = []
+        for (c, cell) in enumerate(self.cells.itervalues()):
+            cellTypes.append(cell.submodname)
+            for pin in cell.pins.itervalues():
+                net = pin.net
+                pinCell.append(c)
+                pinNames.append(pin.name)
+                pinSignal.append(net is None and -1 or signals[net.name])
+        netWidths = [ net.width for net in self.__nets.itervalues() ]
+        return _canonicalHash(_labels(cellTypes), pinCell, _labels(pinNames),
+                              pinSignal, _signalLabels(self, netWidths))
+
+    def computeDigests(self):
+        """ {cell name: digest} of the name, the type and the pin to net
+        connections of every cell, used by Netlist.diff """
+        sha1 = hashlib.sha1
+        cells = dict()
+        for cell in self.cells.itervalues():
+            pins = []
+            for pin in cell.pins.itervalues():
+                net = pin.net
+                pins.append(net is None and pin.name or pin.name + "=" + net.name)
+            pins.sort()
+            name = cell.name
+            cells[name] = sha1(name + "\0" + cell.submodname + "\0" +
+                               "\0".join(pins)).digest()
+        return cells
+
+    def computeNetDigests(self):
+        connections = dict([ (name, []) for name in self.nets.iterkeys() ])
+        for cell in self.cells.itervalues():
+            for pin in cell.pins.itervalues():
+                pins = pin.net is not None and connections.get(pin.net.name)
+                if pins is not None and pins is not False:
+                    pins.append(cell.name + "." + pin.name)
+        return _netDigests(connections)
+
+    #
+    # design rules, see Netlist.checkDesign
+    #
+    def violations(self):
+        """ Generate the design rule Violations of the linked module in one
+        pass over its ports, nets and pins """
+        name = self.name
+        for v in _portViolations(self):
+            yield v
+        extraDrivers = self.__extraDrivers
+        for net in self.__nets.itervalues():
+            if net.fanin is None:
+                if net.fanout:
+                    yield Violation("undriven", name, net.name, "net has " +
+                                    str(len(net.fanout)) + " loads but no driver")
+                else:
+                    yield Violation("floating", name, net.name,
+                                    "net is not connected")
+            elif extraDrivers and net in extraDrivers:
+                yield _multipleDrivers(name, net.name,
+                                       [ net.fanin ] + extraDrivers[net])
+        for cell in self.__cells.itervalues():
+            for pin in cell.pins.itervalues():
+                port = pin.port
+                if port is None:
+                    continue
+                net = pin.net
+                if net is None:
+                    if port.direction == "in":
+                        yield Violation("floating", name, _pinName(pin),
+                                        "input pin is not connected")
+                elif net.width != port.width:
+                    yield Violation("width", name, _pinName(pin),
+                                    "connects " + net.name + " of width " +
+                                    str(net.width) + " to a port of width " +
+                                    str(port.width))
+
+    def new_bus(self, busAttr):
+        """ Add a multi-bit port (busAttr has a direction) or a wire bus,
+        see Bus """
+        busAttr["module"] = self
+        busAttr["name"] = symbols.intern(busAttr["name"])
+        bus = Bus.Bus(busAttr)
+        self.changed()
+        if bus.isPort:
+            return self.__ports.addBus(bus)
+        self.__wires[bus.name] = bus
+        return bus
+
+
+#
+# structural hashing: the cells and signals are labelled by their type, the
+# signals that are ports by their name, and the labels are refined in rounds
+# (like the Weisfeiler-Lehman graph isomorphism test): the new label of a
+# cell is a digest of its label and the multiset of (pin name, signal label)
+# of its pins, and the other way round for signals. Labels never depend on
+# cell or net names or on the order of anything, so the module hash is the
+# digest of the sorted labels once they stop splitting into more classes.
+#
+# labels are refined at most this many rounds
+HASH_ROUNDS = 32
+
+def _labels(strings):
+    " uint64 labels of a list of strings, from their SHA-1 "
+    import numpy
+    memo = dict()
+    labels = []
+    for s in strings:
+        label = memo.get(s)
+        if label is None:
+            label = memo[s] = int(hashlib.sha1(s).hexdigest()[:16], 16)
+        labels.append(label)
+    return numpy.array(labels, dtype=numpy.uint64)
+
+def _signalLabels(mod, netWidths):
+    " the initial labels of the ports, by name, and of the nets, by width "
+    return _labels([ "port\0" + port.name + "\0" + port.direction + "\0" +
+                     str(port.width) for port in mod.ports.itervalues() ] +
+                   [ "net\0" + str(width) for width in netWidths ])
+
+def _mix(x):
+    " scramble the bits of a uint64 array (the splitmix64 finalizer) "
+    import numpy
+    x = x ^ (x >> numpy.uint64(30))
+    x = x * numpy.uint64(0xbf58476d1ce4e5b9)
+    x = x ^ (x >> numpy.uint64(27))
+    x = x * numpy.uint64(0x94d049bb133111eb)
+    return x ^ (x >> numpy.uint64(31))
+
+def _groups(keys):
+    " (order, keys, first) to sum values by key with _sums "
+    import numpy
+    order = numpy.argsort(keys, kind="mergesort")
+    (keys, first) = numpy.unique(keys[order], return_index=True)
+    return (order, keys, first)
+
+def _sums(values, groups, n):
+    " the sums (modulo 2**64) of values by key, for keys 0..n-1 "
+    import numpy
+    (order, keys, first) = groups
+    sums = numpy.zeros(n, dtype=numpy.uint64)
+    if len(keys):
+        sums[keys] = numpy.add.reduceat(values[order], first)
+    return sums
+
+def _canonicalHash(cellLabels, pinCell, pinLabels, pinSignal, signalLabels):
+    """ The hex digest of a module given the labels of its cells, the cell,
+    the label (pin name) and the signal (-1 if unconnected) of every pin
+    and the labels of its signals """
+    import numpy
+    pinCell = numpy.asarray(pinCell, dtype=numpy.intp)
+    pinSignal = numpy.asarray(pinSignal, dtype=numpy.intp)
+    connected = numpy.flatnonzero(pinSignal >= 0)
+    byCell = _groups(pinCell)
+    bySignal = _groups(pinSignal[connected])
+    # unconnected pins look up the extra label at the end
+    unconnected = _labels([ "unconnected" ])
+    # cells and signals take their neighbours' labels through different
+    # salts, so the two kinds of labels never mix
+    salt = _labels([ "cell", "signal" ])
+    cells = cellLabels
+    signals = signalLabels
+    classes = None
+    for i in xrange(HASH_ROUNDS):
+        signalsAt = numpy.concatenate([ signals, unconnected ])[pinSignal]
+        cellIn = _mix(pinLabels ^ _mix(signalsAt + salt[0]))
+        signalIn = _mix(pinLabels[connected] ^ _mix(cells[pinCell[connected]] + salt[1]))
+        cells = _mix(cells ^ _mix(_sums(cellIn, byCell, len(cells))))
+        signals = _mix(signals ^ _mix(_sums(signalIn, bySignal, len(signals))))
+        n = len(numpy.unique(cells)) + len(numpy.unique(signals))
+        if n == classes:
+            break
+        classes = n
+    digest = hashlib.sha1()
+    for labels in (cells, signals):
+        digest.update(numpy.sort(labels).astype("<u8").tostring())
+    return digest.hexdigest()
+
+def _netDigests(connections):
+    " {net name: digest} from {net name: [cell.pin, ...]} "
+    digests = dict()
+    for (name, pins) in connections.iteritems():
+        pins.sort()
+        digests[name] = hashlib.sha1(name + "\0" + "\0".join(pins)).digest()
+    return digests
+
+def _pinName(pin):
+    return pin.cell.name + "." + pin.name
+
+def _multipleDrivers(modname, name, pins):
+    names = sorted([ _pinName(pin) for pin in pins ])
+    return Violation("multiple drivers", modname, name, "driven by " +
+                     str(len(names)) + " pins: " + ", ".join(names))
+
+def _portViolations(mod):
+    " the Violations of the ports of a linked module "
+    for port in mod.ports.itervalues():
+        if port.direction == "in":
+            if port.fanin is not None:
+                yield Violation("direction", mod.name, port.name,
+                                "input port driven by " + _pinName(port.fanin))
+        elif port.fanin is None:
+            yield Violation("undriven", mod.name, port.name,
+                            "output port has no driver")
+            continue
+        extra = mod.extraDrivers(port)
+        if extra:
+            yield _multipleDrivers(mod.name, port.name, [ port.fanin ] + extra)
+
+
+class Violation(object):
+    """ A design rule violation found by Netlist.checkDesign: the rule, the
+    module and the port, net or pin (as cell.pin) that breaks it """
+    __slots__ = ('__rule', '__module', '__name', '__message')
+
+    def __init__(self, rule, module, name, message):
+        self.__rule = rule
+        self.__module = module
+        self.__name = name
+        self.__message = message
+
+    rule    = property(lambda self: self.__rule)
+    module  = property(lambda self: self.__module)
+    name    = property(lambda self: self.__name)
+    message = property(lambda self: self.__message)
+
+    def __eq__(self, other):
+        return (isinstance(other, Violation) and
+                (self.__rule, self.__module, self.__name, self.__message) ==
+                (other.rule, other.module, other.name, other.message))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Violation(%r, %r, %r, %r)" % (self.__rule, self.__module,
+                                              self.__name, self.__message)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
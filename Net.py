@@ -2,15 +2,22 @@ from Generic import *
 
 class Net(Generic):
     "A Verilog net"
+    __slots__ = ('__width', '__msb', '__lsb', '__busName', '__bitIdx',
+                 '__fanin', '__fanout')
+
     def __init__(self, attrs):
         Generic.__init__(self, attrs)
 
-        self.__width = self.get("width")
-        self.__msb = self.get("msb", require=False)
-        self.__lsb = self.get("lsb", require=False)
-        self.__busMember = self.get("busMember")
-        self.__busName = self.get("busName")
-        self.__bitIdx  = self.get("bitIdx")
+        self.__width = self.get(attrs, "width")
+        self.__msb = self.get(attrs, "msb", require=False)
+        self.__lsb = self.get(attrs, "lsb", require=False)
+        busMember = self.get(attrs, "busMember")
+        self.__busName = self.get(attrs, "busName")
+        self.__bitIdx  = self.get(attrs, "bitIdx")
+
+        # busMember is not stored, a net is a bus member iff it has a busName
+        if bool(busMember) != (self.__busName != None):
+            raise Exception("busMember and busName disagree on " + self.name)
 
         if self.__width > 1:          
             if self.__msb == None or self.__lsb == None:
@@ -24,9 +31,9 @@ class Net(Generic):
                 raise Exception("inconsistent msb and lsb")
 
 
-        #to be linked
+        #to be linked, the fanout list is only created for the first pin
         self.__fanin = None
-        self.__fanout = []
+        self.__fanout = ()
 
     width   = property(lambda self: self.__width)
     msb     = property(lambda self: self.__msb)
@@ -35,16 +42,38 @@ class Net(Generic):
     fanout  = property(lambda self: self.__fanout)
     bitIdx  = property(lambda self: self.__bitIdx)
     busName = property(lambda self: self.__busName)
-    busMember = property(lambda self: self.__busMember)
+    busMember = property(lambda self: self.__busName != None)
     
 
     def setFanin(self, pin):
         if self.__fanin != None and self.__fanin != pin:
-            raise Exception("different fanin already set on net " + self.name)
+            # the module keeps the other drivers, see Module.extraDrivers
+            self.module.addExtraDriver(self, pin)
+            return
         self.__fanin = pin
 
     def addFanout(self, pin):
-        self.__fanout.append(pin)
+        if not self.__fanout:
+            self.__fanout = [ pin ]
+        else:
+            self.__fanout.append(pin)
+
+    def removeFanout(self, pin):
+        if pin in self.__fanout:
+            self.__fanout.remove(pin)
+
+    def removeFanin(self, pin):
+        if self.__fanin == pin:
+            # another driver takes over, if there is one
+            self.__fanin = self.module.removeExtraDriver(self)
+        else:
+            self.module.removeExtraDriver(self, pin)
+
+    def clearLinks(self):
+        " forget fanin and fanout "
+        self.__fanin = None
+        self.__fanout = ()
+        self.module.clearExtraDrivers(self)
 
     
     
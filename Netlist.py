@@ -1,15 +1,26 @@
 import Module
+import Bus
 import PortIn
 import PortOut
 import PortClk
 import ConfigParser
 from ordereddict import OrderedDict
 import os
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import time
+import itertools
+import hashlib
 import yaml
 import pickle
 import re
 import verilogParse
+import verilogScan
 import myutils
+import ParseCache
+import binaryNetlist
+from LazyDict import LazyDict
+from SymbolTable import symbols
 ################################################################################
 ################################################################################
 class Netlist:
@@ -41,83 +52,603 @@ class Netlist:
     'Iface_test'
     >>> mod1 = nl1.mods[nl1.topMod]
     >>> mod2 = nl2.mods[nl2.topMod]
-    >>> set(mod1.ports.keys()) == set(mod2.ports.keys())
+    >>> mod1.structuralHash() == mod2.structuralHash()
     True
-    >>> set(mod1.cells.keys()) == set(mod2.cells.keys())
+
+    Modules read from YAML are only built when they are needed, so only
+    the library cells the design uses have been built:
+
+    >>> nl2.mods.isLoaded("MUX4D1"), nl2.mods.isLoaded("XNR4D1")
+    (True, False)
+
+    The "fast" Verilog engine only understands gate-level netlists but
+    builds exactly the same modules:
+
+    >>> nl3 = Netlist()
+    >>> nl3.readYAML("test/gates.yml")
+    >>> nl3.readVerilog("test/Iface_test.gv", engine="fast")
+    >>> nl3.link("Iface_test")
+    >>> mod3 = nl3.mods[nl3.topMod]
+    >>> mod3.ports.keys() == mod1.ports.keys()
+    True
+    >>> mod3.cells.keys() == mod1.cells.keys()
+    True
+    >>> mod3.nets.keys() == mod1.nets.keys()
+    True
+    >>> pins1 = [ (p.name, p.net.name) for p in mod1.cells["U138"].pins.values() ]
+    >>> pins3 = [ (p.name, p.net.name) for p in mod3.cells["U138"].pins.values() ]
+    >>> pins1 == pins3
+    True
+    >>> nl3.readVerilog("test/Iface_test.gv", engine="fast", workers=2)
+    Warning: Iface_test has been multiply defined
+    >>> nl3.mods["Iface_test"].nets.keys() == mod1.nets.keys()
+    True
+
+    Many files can be read at once in a process pool. Modules are added in
+    file order with the same warnings as reading the files one by one:
+
+    >>> nl4 = Netlist()
+    >>> nl4.readVerilogMany(["test/Iface_test.gv"] * 2, workers=2, engine="fast")
+    Warning: Iface_test has been multiply defined
+    >>> nl4.mods["Iface_test"].cells.keys() == mod1.cells.keys()
+    True
+
+    dump() writes a compact binary file, load() maps it back in and builds
+    each module on first access:
+
+    >>> import tempfile, os
+    >>> (fd, dumpFile) = tempfile.mkstemp()
+    >>> nl1.dump(dumpFile)
+    >>> nl5 = Netlist()
+    >>> nl5.load(dumpFile)
+    >>> nl5.topMod
+    'Iface_test'
+    >>> mod5 = nl5.mods[nl5.topMod]
+    >>> mod5.nets.keys() == mod1.nets.keys()
     True
-    >>> set(mod1.nets.keys()) == set(mod2.nets.keys())
+    >>> mod5.cells["U138"].pins["Z"].net.fanin.cell.name
+    'U138'
+    >>> os.remove(dumpFile)
+
+    A cell library can be compiled once and then attached by any number
+    of netlists and processes:
+
+    >>> (fd, libFile) = tempfile.mkstemp()
+    >>> compileLibrary("test/gates.yml", libFile)
+    >>> nl7 = Netlist()
+    >>> nl7.readLibrary(libFile)
+    >>> nl7.readVerilog("test/Iface_test.gv", engine="fast")
+    >>> nl7.link("Iface_test")
+    >>> nl7.mods["Iface_test"].cells["U138"].submod.ports["Z"].direction
+    'out'
+    >>> nl7.mods.isLoaded("XNR4D1"), sorted(nl7.yaml.keys()) == sorted(nl1.yaml.keys())
+    (False, True)
+    >>> os.remove(libFile)
+
+    link() links the whole instance hierarchy, every module only once:
+
+    >>> nl6 = Netlist()
+    >>> nl6.readYAML("test/gates.yml")
+    >>> nl6.readVerilog("test/adder_test.gv")
+    >>> nl6.link("adder4", workers=2)
+    >>> nl6.linkReport.keys()
+    ['adder4', 'full_adder', 'half_adder']
+    >>> ha = nl6.mods["half_adder"]
+    >>> ha.ports["s"].fanin.cell.submodname
+    'XOR2D1'
+    >>> [ p.cell.name for p in nl6.mods["adder4"].ports["a[2]"].fanout ]
+    ['fa2']
+
+    checkDesign() checks the linked design against the design rules:
+
+    >>> nl6.checkDesign()
+    []
+    >>> ha.new_net({"name": "spare", "width": 1, "busMember": False,
+    ...             "bitIdx": None, "busName": None}).name
+    'spare'
+    >>> nl6.link("adder4")
+    >>> nl6.checkDesign()
+    [Violation('floating', 'half_adder', 'spare', 'net is not connected')]
+
+    Structural hashes fingerprint modules, diff() tells what changed in
+    them:
+
+    >>> nl8 = Netlist()
+    >>> nl8.readYAML("test/gates.yml")
+    >>> nl8.readVerilog("test/adder_test.gv")
+    >>> nl8.structuralHash("adder4") == nl6.structuralHash("adder4")
+    False
+    >>> fa = nl8.mods["full_adder"]
+    >>> fa.structuralHash() == nl6.mods["full_adder"].structuralHash()
     True
+    >>> fa.cells["U1"].pins["A2"].connectNet(fa.nets["c1"])
+    >>> nl6.diff(nl8, "adder4")
+    [('rewired', 'full_adder', 'U1'), ('rewired net', 'full_adder', 'c1'), ('rewired net', 'full_adder', 'c2'), ('removed net', 'half_adder', 'spare')]
+
+    The hashes do not depend on the names of instances and nets, a copy of
+    full_adder with other names hashes the same:
+
+    >>> nl8.readVerilog("test/renamed_test.gv")
+    >>> renamed = nl8.mods["fa_renamed"]
+    >>> renamed.structuralHash() == nl6.mods["full_adder"].structuralHash()
+    True
+
+    diff() compares by name, so it still sees renamed instances, and
+    changes that keep the hash: the hash of a ring of six inverters is the
+    same as that of two rings of three.
+
+    >>> nl10 = Netlist()
+    >>> nl10.readYAML("test/gates.yml")
+    >>> nl10.readVerilog("test/ring_test.gv")
+    >>> nl11 = Netlist()
+    >>> nl11.readYAML("test/gates.yml")
+    >>> nl11.readVerilog("test/ring_test.gv")
+    >>> ring = nl11.mods["ring"]
+    >>> ring.cells["U3"].pins["ZN"].connectNet(ring.nets["n6"])
+    >>> ring.cells["U6"].pins["ZN"].connectNet(ring.nets["n3"])
+    >>> ring.structuralHash() == nl10.mods["ring"].structuralHash()
+    True
+    >>> nl10.diff(nl11, "ring")
+    [('rewired', 'ring', 'U3'), ('rewired', 'ring', 'U6'), ('rewired net', 'ring', 'n3'), ('rewired net', 'ring', 'n6')]
+    >>> cell = ring.remove_cell("U2")
+    >>> copy = ring.new_cell({"name": "U9", "submodname": "INVD1"})
+    >>> copy.new_pin({"name": "I"}).connectNet(ring.nets["n1"])
+    >>> copy.new_pin({"name": "ZN"}).connectNet(ring.nets["n2"])
+    >>> nl10.diff(nl11, "ring")[:2]
+    [('added', 'ring', 'U9'), ('removed', 'ring', 'U2')]
+
+    flatten() builds a flat copy of a hierarchy, the names of the cells
+    and nets of every instance start with its path:
+
+    >>> nl9 = Netlist()
+    >>> nl9.readYAML("test/gates.yml")
+    >>> nl9.readVerilog("test/adder_test.gv")
+    >>> flat = nl9.flatten("adder4", name="adder4_flat")
+    >>> len(flat.cells), flat.cells["fa1/ha0/U1"].pins["Z"].net.name
+    (20, 'fa1/s1')
+    >>> nl9.addModule(flat)
+    >>> nl9.link("adder4_flat")
+    >>> [ p.cell.name for p in flat.ports["a[2]"].fanout ]
+    ['fa2/ha0/U1', 'fa2/ha0/U2']
+    >>> import Simulator
+    >>> sim = Simulator.Simulator(nl9)
+    >>> for (name, value) in [ ("a[0]", 1), ("a[1]", 1), ("b[0]", 1), ("cin", 1) ]:
+    ...     sim.set(name, value)
+    >>> [ sim.get(name)[0] for name in ("sum[0]", "sum[1]", "sum[2]", "cout") ]
+    [1, 0, 1, 0]
+
+    Names that are not Verilog identifiers are written escaped, so the flat
+    design reads back:
+
+    >>> (fd, flatFile) = tempfile.mkstemp()
+    >>> nl9.writeVerilog(flatFile)
+    >>> "wire \\\\fa0/s1 ;" in open(flatFile).read()
+    True
+    >>> for engine in ("full", "fast"):
+    ...     nl14 = Netlist()
+    ...     nl14.readYAML("test/gates.yml")
+    ...     nl14.readVerilog(flatFile, engine=engine)
+    ...     nl14.link("adder4_flat")
+    ...     mod14 = nl14.mods["adder4_flat"]
+    ...     print mod14.cellDigests() == flat.cellDigests(), nl14.checkDesign()
+    True []
+    True []
+    >>> os.remove(flatFile)
+
+    Buses keep their declared range, with both engines:
+
+    >>> for engine in ("full", "fast"):
+    ...     nl12 = Netlist()
+    ...     nl12.readYAML("test/gates.yml")
+    ...     nl12.readVerilog("test/offset_test.gv", engine=engine)
+    ...     nl12.link("offset")
+    ...     print nl12.mods["offset"].ports.keys(), nl12.checkDesign()
+    ['a[4]', 'a[5]', 'a[6]', 'a[7]', 'y'] []
+    ['a[4]', 'a[5]', 'a[6]', 'a[7]', 'y'] []
+    >>> bus = nl12.mods["offset"].ports.bus("a")
+    >>> (bus.msb, bus.lsb)
+    (7, 4)
+
+    A module defined again replaces the old one in the next link:
+
+    >>> cell = nl12.mods["offset"].cells["U1"]
+    >>> old = cell.submod
+    >>> nl13 = Netlist()
+    >>> nl13.readYAML("test/gates.yml")
+    >>> nl12.addModule(nl13.mods["AN2D1"])
+    Warning: AN2D1 has been multiply defined
+    >>> nl12.link("offset")
+    >>> (cell.submod is nl13.mods["AN2D1"], cell.submod is old)
+    (True, False)
     """
     
     mods = property(lambda self: self.__mods)
     yaml = property(lambda self: self.__yaml)
     topMod = property(lambda self: self.__topMod)
+    # {module name: link time in seconds} of the last link()
+    linkReport = property(lambda self: self.__linkReport)
+    # the names shared by all netlists, see SymbolTable
+    symbols = property(lambda self: symbols)
     
     def __init__(self):
-        self.__mods = dict()
+        self.__mods = LazyDict()
         self.__topMod = None
         self.__yaml = dict()
+        self.__linkReport = OrderedDict()
     
-    def link(self, topModule):
-        " link the design together"
+    def link(self, topModule, workers=1):
+        """ link the design together
+
+        Every module in the instance hierarchy below topModule is linked,
+        and each distinct module only once, however often it is
+        instantiated. Linking a module only needs the ports of its
+        submodules, so with workers > 1 (None for one per CPU) the modules
+        are linked concurrently in a thread pool. linkReport holds the link
+        time of every module afterwards.
+        
+        Linking is incremental: after the first link, only the cells that
+        changed since (see Module.dirtyCells) are linked again, so calling
+        link again on an unchanged design does nothing.
+        """
         if topModule not in self.__mods:
             raise Exception(str("link error, " + topModule + 
                                 " has not been defined"))
         
-        mod = self.__mods[topModule]
+        mods = self.hierarchy(topModule)
         
         missing = set()
         # check all cells
-        for cell in mod.cells:
-            if mod.cells[cell].submodname not in self.__mods:
-                missing.add(mod.cells[cell].submodname)
+        for mod in mods:
+            for submodname in mod.submodnames():
+                if submodname not in self.__mods:
+                    missing.add(submodname)
         
         if len(missing) > 0:
             raise Exception(str("link error, " +  
                                 str(missing) + 
                                 " have not been defined"))
         
-        for cell in mod.cells:
-            submod = self.__mods[mod.cells[cell].submodname]
-            mod.cells[cell].linkMod(submod)
-            for pin in mod.cells[cell].pins:
-                if pin not in submod.ports:
-                    raise Exception(str("port " + pin + " not in " 
-                                        + submod.name))
-                mod.cells[cell].pins[pin].connectPort(submod.ports[pin])
-                net =  mod.cells[cell].pins[pin].net
-                if submod.ports[pin].direction == "in":
-                    net.addFanout(mod.cells[cell].pins[pin])
-                else:
-                    net.setFanin(mod.cells[cell].pins[pin])
-                
+        # library cells have nothing to link
+        mods = [ mod for mod in mods if len(mod.cells) > 0 ]
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        # linking only adds references between objects that already exist,
+        # collecting in between finds nothing to free. The pause covers the
+        # pool threads too and nests with the pauses of other threads
+        with myutils.gcPaused():
+            if workers > 1 and len(mods) > 1:
+                pool = ThreadPool(min(workers, len(mods)))
+                try:
+                    times = pool.map(self.__linkModule, mods)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                times = [ self.__linkModule(mod) for mod in mods ]
+        
+        self.__linkReport = OrderedDict(zip([ mod.name for mod in mods ], times))
         self.__topMod = topModule
     
-    def checkDesign(self):
-        "verify the design has legal connections (post-linking)"
-        
-        # make sure input ports ONLY connect to input ports
-        
-        
-        # make sure the output ports ONLY connect to output ports
-        
-        
-        # make sure all connections have 1 and only 1 driver
+    def hierarchy(self, topModule):
+        """ The distinct modules instantiated below topModule (and
+        topModule itself), parents before their children. Cell types that
+        are not defined are left out """
+        mods = [ self.__mods[topModule] ]
+        seen = set([ topModule ])
+        i = 0
+        while i < len(mods):
+            for submodname in mods[i].submodnames():
+                if submodname not in seen and submodname in self.__mods:
+                    seen.add(submodname)
+                    mods.append(self.__mods[submodname])
+            i += 1
+        return mods
+    
+    def __linkModule(self, mod):
+        " link the cells of mod to their submodules, returns the time taken "
+        start = time.time()
+        if mod.backend == "array":
+            # links all cells at once on the arrays
+            mod.link(self.__mods)
+            return time.time() - start
         
+        # after the first link only the cells changed since are linked,
+        # pins that are still linked are left alone. Pins are resolved with
+        # the pin table of their submodule, fetched once per cell type
+        tables = dict()
+        for cell in mod.dirtyCells():
+            submodname = cell.submodname
+            entry = tables.get(submodname)
+            if entry is None:
+                submod = self.__mods[submodname]
+                entry = tables[submodname] = (submod, submod.pinTable())
+            (submod, table) = entry
+            if cell.submod is not submod:
+                if cell.submod is not None:
+                    # the submodule has been redefined
+                    for pin in cell.pins.itervalues():
+                        pin.unlink()
+                    cell.unlinkMod()
+                cell.linkMod(submod)
+            for pin in cell.pins.itervalues():
+                if pin.port is not None:
+                    continue
+                portDir = table.get(pin.name)
+                if portDir is None:
+                    raise Exception(str("port " + pin.name + " not in " 
+                                        + submod.name))
+                pin.bind(*portDir)
+        mod.markLinked()
+        return time.time() - start
+    
+    def checkDesign(self, limit=None):
+        """ verify the design has legal connections (post-linking)
+
+        Every module of the linked hierarchy is checked in a single pass
+        over its ports, nets and pins (see Module.violations). Returns the
+        list of Module.Violation records found; with limit set, checking
+        stops as soon as limit violations have been found. The rules are
+
+          direction         an input port is driven from inside its module
+          undriven          an output port, or a net with loads, has no driver
+          floating          a net, or an input pin, is not connected at all
+          width             a pin connects a net of another width than its port
+          multiple drivers  a net or a port is driven by more than one pin,
+                            link keeps the first one as its fanin
+        """
+        if self.__topMod is None:
+            raise Exception("checkDesign needs a linked design")
         
-        # sanity check all connection widths
-        pass
+        violations = itertools.chain.from_iterable(
+            [ mod.violations() for mod in self.hierarchy(self.__topMod)
+              if len(mod.cells) > 0 ])
+        return list(itertools.islice(violations, limit))
     
+    def structuralHash(self, topModule=None):
+        """ The Merkle hash of topModule (the top module by default): the
+        structural hash of the module (see Module.structuralHash) combined
+        with the hashes of its cell types, so it changes with any module
+        of the hierarchy below. Identical blocks have the same hash, in this
+        netlist and in others. It is a fingerprint, see
+        Module.structuralHash """
+        if topModule is None:
+            topModule = self.__topMod
+        return self.__merkleHash(topModule, dict())
+
+    def __merkleHash(self, modname, memo):
+        digest = memo.get(modname)
+        if digest is None:
+            mod = self.__mods[modname]
+            digest = hashlib.sha1(mod.structuralHash())
+            for submodname in sorted(mod.submodnames()):
+                digest.update(submodname)
+                if submodname in self.__mods:
+                    digest.update(self.__merkleHash(submodname, memo))
+            digest = memo[modname] = digest.hexdigest()
+        return digest
+
+    def diff(self, other, topModule=None):
+        """ The changes from this netlist to netlist other in the hierarchy
+        below topModule (the top module by default), as a list of
+        (change, module name, name) tuples. The changes are
+
+          added, removed, rewired              instances
+          added net, removed net, rewired net  nets
+          ports                                the ports of the module
+          added module, removed module         whole modules (name None)
+
+        Rewired instances have another type or connect another net to a
+        pin. Modules are compared by the digests of the names and
+        connections of their cells and nets (see Module.cellDigests), not
+        by structural hash, which ignores names """
+        if topModule is None:
+            topModule = self.__topMod
+        if topModule is None:
+            raise Exception("diff needs a top module")
+        mods = OrderedDict()
+        for netlist in (self, other):
+            if topModule in netlist.mods:
+                for mod in netlist.hierarchy(topModule):
+                    mods.setdefault(mod.name, None)
+        changes = []
+        for modname in mods:
+            if modname not in other.mods:
+                changes.append(("removed module", modname, None))
+                continue
+            if modname not in self.__mods:
+                changes.append(("added module", modname, None))
+                continue
+            (mod1, mod2) = (self.__mods[modname], other.mods[modname])
+            ports = [ set([ (port.name, port.direction, port.width)
+                            for port in mod.ports.itervalues() ])
+                      for mod in (mod1, mod2) ]
+            if ports[0] != ports[1]:
+                changes.append(("ports", modname, None))
+            for (kind, digests1, digests2) in \
+                    (("", mod1.cellDigests(), mod2.cellDigests()),
+                     (" net", mod1.netDigests(), mod2.netDigests())):
+                rewired = [ name for (name, digest) in digests1.iteritems()
+                            if name in digests2 and digests2[name] != digest ]
+                for (change, names) in (("added", set(digests2).difference(digests1)),
+                                        ("removed", set(digests1).difference(digests2)),
+                                        ("rewired", rewired)):
+                    changes.extend([ (change + kind, modname, name)
+                                     for name in sorted(names) ])
+        return changes
+
+    def flatten(self, topModule=None, sep="/", name=None):
+        """ A flat copy of the hierarchy below topModule (the top module by
+        default): a module of the same backend, named name (topModule by
+        default) and not added to the netlist, that holds the library
+        cells of every instance. The cells and nets of an instance are
+        named after its path, like fa0/ha1/U1, with sep between the names.
+        The ports of an instance stand for the nets they are connected to,
+        so the nets of the instance connect straight to the nets of its
+        parent, and the ports of topModule are the ports of the copy.
+
+        One pass over the instances: the path of an instance is built once,
+        then every cell and net name is a new string of the path and the
+        name in its module. Pin and cell type names are shared with the
+        hierarchy (see SymbolTable) """
+        if topModule is None:
+            topModule = self.__topMod
+        top = self.__mods[topModule]
+        flat = top.__class__({"name": name or topModule})
+        for port in top.ports.entries():
+            if isinstance(port, Bus.Bus):
+                flat.new_bus({"name": port.name, "width": port.width,
+                              "lsb": port.lsb, "direction": port.direction,
+                              "portClass": port.portClass})
+            else:
+                flat.add_port(port.__class__(_flatNetAttrs(port, "", module=flat,
+                                                           direction=port.direction)))
+        templates = dict()
+        self.__flatten(self.__template(top, templates), "",
+                       list(flat.ports.itervalues()), flat, sep, templates)
+        return flat
+
+    def __template(self, mod, templates):
+        """ (nets, cells, instances) of mod for flatten: the signals of mod
+        are numbered ports first, nets are (name, attrs) to copy, cells are
+        (name, type, [(pin, signal)]) for library cells and instances
+        (name, template, [signal of every port]) for the others, signal
+        -1 where a pin is unconnected """
+        template = templates.get(mod.name)
+        if template is not None:
+            return template
+        index = dict([ (name, i) for (i, name) in
+                       enumerate(mod.ports.keys() + mod.nets.keys()) ])
+        nets = [ (net.name, _flatNetAttrs(net, "")) for net in mod.nets.itervalues() ]
+        cells = []
+        instances = []
+        for cell in mod.cells.itervalues():
+            pins = [ (pin.name, pin.net is None and -1 or index[pin.net.name])
+                     for pin in cell.pins.itervalues() ]
+            submod = self.__mods.get(cell.submodname)
+            if submod is None or len(submod.cells) == 0:
+                # a library cell
+                cells.append((cell.name, cell.submodname, pins))
+                continue
+            pins = dict(pins)
+            ports = [ (port, pins.get(port.name, -1)) for port in submod.ports.itervalues() ]
+            instances.append((cell.name, self.__template(submod, templates), ports))
+        template = templates[mod.name] = (nets, cells, instances)
+        return template
+
+    def __flatten(self, template, path, signals, flat, sep, templates):
+        """ copy the instance at path of the module of template into flat.
+        signals are the signals of flat the ports of the instance stand for,
+        the nets of the instance are added to them """
+        (nets, cells, instances) = template
+        for (name, attrs) in nets:
+            attrs = dict(attrs)
+            attrs["name"] = path + name
+            if attrs["busName"] is not None:
+                attrs["busName"] = path + attrs["busName"]
+            signals.append(flat.new_net(attrs))
+        for (name, submodname, pins) in cells:
+            copy = flat.new_cell({"name": path + name, "submodname": submodname})
+            for (pinName, s) in pins:
+                pin = copy.new_pin({"name": pinName})
+                if s >= 0:
+                    pin.connectNet(signals[s])
+        for (name, subTemplate, ports) in instances:
+            inner = path + name + sep
+            subSignals = []
+            for (port, s) in ports:
+                if s >= 0:
+                    subSignals.append(signals[s])
+                else:
+                    # an unconnected port still connects the cells inside
+                    subSignals.append(flat.new_net(_flatNetAttrs(port, inner)))
+            self.__flatten(subTemplate, inner, subSignals, flat, sep, templates)
+
     def addModule(self, mod):
         modname = mod.name
         if modname in self.__mods:
-            print "Warning: " + modname + " has been multiply defined"
+            self.__redefine(modname)
         self.__mods[modname] = mod
+
+    def __redefine(self, modname):
+        """ warn that modname is defined again, the cells of the modules
+        built so far that instantiate it are linked again """
+        print "Warning: " + modname + " has been multiply defined"
+        for name in self.__mods.keys():
+            if self.__mods.isLoaded(name):
+                mod = self.__mods[name]
+                if modname in mod.submodnames():
+                    mod.submodChanged(modname)
     
-    def readVerilog(self, verilogFile):
-        """ Parse a Gate-level Verilog file using Python"""
-        mod = verilogParse.parseFile(verilogFile)
-        self.__mods[mod.name] = mod
+    def readVerilog(self, verilogFile, engine="full", workers=1, cache=None,
+                    backend="object"):
+        """ Parse a Gate-level Verilog file using Python
+
+        engine="full" runs the complete Verilog grammar from verilogParse,
+        engine="fast" uses the much faster gate-level reader from verilogScan
+        and falls back to the full grammar for anything it does not support.
+        With the fast engine, workers > 1 (or None for one per CPU) parses
+        the cell instances of the file in chunks in a process pool.
+        
+        cache is a ParseCache or a directory; the modules are loaded from a
+        snapshot when the file has been read before and saved otherwise.
+        
+        backend="array" builds ArrayModules, which keep the cells, pins and
+        nets in NumPy arrays instead of one object each (needs numpy).
+        """
+        if cache is None:
+            mods = parseVerilog(verilogFile, engine, workers, backend)
+        else:
+            cache = _getCache(cache)
+            mods = cache.cached(verilogFile, _verilogCacheOptions + (backend,),
+                                lambda: parseVerilog(verilogFile, engine,
+                                                     workers, backend))
+        for mod in mods:
+            self.addModule(mod)
+    
+    def readVerilogMany(self, verilogFiles, workers=None, engine="full",
+                        cache=None, backend="object"):
+        """ Parse many Verilog files in a pool of worker processes
+
+        The modules are added in the order of verilogFiles, exactly as if
+        readVerilog had been called on each file in turn. workers defaults
+        to the number of CPUs, workers=1 parses in this process. Files found
+        in the cache are not sent to the pool.
+        """
+        verilogFiles = list(verilogFiles)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        workers = min(workers, len(verilogFiles))
+        
+        if workers <= 1:
+            for verilogFile in verilogFiles:
+                self.readVerilog(verilogFile, engine, cache=cache,
+                                 backend=backend)
+            return
+        
+        results = [ None ] * len(verilogFiles)
+        keys = [ None ] * len(verilogFiles)
+        if cache is not None:
+            cache = _getCache(cache)
+            for (i, verilogFile) in enumerate(verilogFiles):
+                keys[i] = cache.key(verilogFile, *(_verilogCacheOptions + (backend,)))
+                results[i] = cache.load(keys[i])
+        
+        pool = multiprocessing.Pool(workers)
+        try:
+            jobs = [ (verilogFiles[i], engine, 1, backend)
+                     for i in range(len(verilogFiles)) if results[i] is None ]
+            parsed = pool.imap(_parseVerilogJob, jobs)
+            for i in range(len(verilogFiles)):
+                if results[i] is None:
+                    results[i] = parsed.next()
+                    if cache is not None:
+                        cache.store(keys[i], results[i])
+                for mod in results[i]:
+                    self.addModule(mod)
+                results[i] = None
+        finally:
+            pool.close()
+            pool.join()
     
     def writeVerilog(self, vFileName):
         """ Write a gate-level verilog file """
@@ -125,82 +656,47 @@ class Netlist:
         tm = self.mods[ self.topMod ]
         lines = []
         
-        # -- ?? -- "busMember":False, "bitIdx":None,   "busName":None    })
+        # names that are no Verilog identifiers (like the paths of a
+        # flattened design) are written escaped
+        name = _verilogName
         
         # declare the module
-        ports = set()
-        minBit = {}
-        maxBit = {}
-        for p in tm.ports.values():
-            if p.busMember:
-                ports.add( ( p.busName, p.direction ) )
-                if p.busName in minBit:
-                    l = minBit[ p.busName ]
-                    r = maxBit[ p.busName ]
-                    assert p.bitIdx != l
-                    assert p.bitIdx != r
-                    if p.bitIdx < l: minBit[ p.busName ] = p.bitIdx
-                    if p.bitIdx > r: maxBit[ p.busName ] = p.bitIdx
-                else:
-                    minBit[ p.busName ] = p.bitIdx
-                    maxBit[ p.busName ] = p.bitIdx
-            else:
-                ports.add( ( p.name, p.direction ) )
-        portsCsv = ', '.join( [ x[0] for x in list( ports ) ] )
-        lines.append( 'module %s( %s );' % ( self.topMod, portsCsv ) )
+        ports = tm.ports.entries()
+        portsCsv = ', '.join( [ name( p.name ) for p in ports ] )
+        lines.append( 'module %s( %s );' % ( name( self.topMod ), portsCsv ) )
         lines.append( '' )
         
-        # declare i/o ports
-        for ( portName, dirxn ) in ports:
-            if portName in minBit:
-                assert minBit[ portName ] == 0
-                l = minBit[ portName ]
-                r = maxBit[ portName ]
-                if   dirxn == 'in':  lines.append( '    input  [ %2d:%2d ] %s;' % ( r, l, portName ))
-                elif dirxn == 'out': lines.append( '    output [ %2d:%2d ] %s;' % ( r, l, portName ))
+        # declare i/o ports, buses are declared with their range
+        for p in ports:
+            if   p.direction == 'in':  dirxn = 'input '
+            elif p.direction == 'out': dirxn = 'output'
+            else: assert False
+            if isinstance( p, Bus.Bus ):
+                lines.append( '    %s [ %2d:%2d ] %s;' % ( dirxn, p.msb, p.lsb, name( p.name ) ))
             else:
-                if   dirxn == 'in':  lines.append( '    input  %s;' % ( portName ))
-                elif dirxn == 'out': lines.append( '    output %s;' % ( portName ))
-                else: assert False
+                lines.append( '    %s %s;' % ( dirxn, name( p.name ) ))
         lines.append( '' )
         
-        # declare the wires
-        minBit = {}
-        maxBit = {}
-        nets = set()
+        # declare the wires, bus members are covered by their bus
+        for bus in tm.wires.values():
+            lines.append( '    wire [ %2d:%2d ] %s;' % ( bus.msb, bus.lsb, name( bus.name ) ) )
         for n in tm.nets.values():
-              if n.busMember:
-                  nets.add( n.busName )
-                  if n.busName in minBit:
-                      l = minBit[ n.busName ]
-                      r = maxBit[ n.busName ]
-                      assert int( n.bitIdx ) != l
-                      assert int( n.bitIdx ) != r
-                      if int( n.bitIdx ) < l: minBit[ n.busName ] = int ( n.bitIdx )
-                      if int( n.bitIdx ) > r: maxBit[ n.busName ] = int ( n.bitIdx )
-                  else:
-                      minBit[ n.busName ] = int( n.bitIdx )
-                      maxBit[ n.busName ] = int( n.bitIdx )
-              else:
-                  nets.add( n.name )
-        
-        for netName in nets:
-            if netName in minBit:
-                #assert minBit[ netName ] == 0
-                l = minBit[ netName ]
-                r = maxBit[ netName ]
-                lines.append( '    wire [ %2d:%2d ] %s;' % ( r, l, netName ) )
-            else:
-                lines.append( '    wire %s;' % ( netName ))
+            if not n.busMember:
+                lines.append( '    wire %s;' % ( name( n.name ) ))
         lines.append( '' )
         
         # instantiate the cells        
         for c in tm.cells.values():
             ports = []
             for p in c.pins.values():
-                ports.append( '.%s( %s )' % ( p.name, p.net.name ))
+                net = p.net
+                if net.busMember:
+                    netName = '%s[%s]' % ( name( net.busName ), net.bitIdx )
+                else:
+                    netName = name( net.name )
+                ports.append( '.%s( %s )' % ( p.name, netName ))
             ports = ', '.join( ports )
-            lines.append( '    %s %s( %s );' % ( c.submodname, c.name, ports ))
+            lines.append( '    %s %s( %s );' % ( name( c.submodname ), name( c.name ), ports ))
         lines.append( 'endmodule' )
         VFH = open( vFileName, 'w' )
         for line in lines:
@@ -210,87 +706,224 @@ class Netlist:
     def dumpPickle(self, piklFile):
         " Dump self to a pickle file"
         
-        FH = open( piklFile, 'w' )
-        pickle.dump( self, FH )
+        FH = open( piklFile, 'wb' )
+        pickle.dump( self, FH, pickle.HIGHEST_PROTOCOL )
         FH.close()
     
-    def readYAML(self, yamlFile):
-        " Read a YAML config file, build a netlist"
+    def dump(self, fileName):
+        """ Write all modules to a binary netlist file (see binaryNetlist),
+        which is much smaller and faster to load than dumpPickle """
+        binaryNetlist.dump(fileName, self.__mods, self.__topMod, self.__yaml)
+    
+    def load(self, fileName, link=True):
+        """ Read the modules of a file written by dump(). The file is
+        mapped into memory and every module is only built when it is first
+        looked up in mods. If the dumped netlist was linked, the top module
+        is linked again unless link is False.
+        """
+        meta = self.__attach(binaryNetlist.Reader(fileName))
+        if link and meta["topMod"] is not None:
+            self.link(meta["topMod"])
+    
+    def readLibrary(self, libFile):
+        """ Add the modules of a library written by compileLibrary (or of
+        any dump() file) without linking. The file is opened once per
+        process and mapped read-only, so all netlists and worker processes
+        using the library share it, and each module is only built when it
+        is first looked up. Linking resolves the cells against the library
+        modules like against modules read from YAML.
+        """
+        self.__attach(binaryNetlist.getReader(libFile))
+    
+    def __attach(self, reader):
+        " add the modules of a binaryNetlist.Reader lazily, returns its meta "
+        for (i, modname) in enumerate(reader.names):
+            if modname in self.__mods:
+                self.__redefine(modname)
+            self.__mods.setLazy(modname, reader.loader(i))
         
-        file = open(yamlFile)
-        nl = yaml.safe_load(file)
-        file.close()
+        meta = reader.meta
+        if meta["yaml"]:
+            self.__yaml.update(meta["yaml"])
+        return meta
+    
+    def readYAML(self, yamlFile, cache=None):
+        """ Read a YAML config file, build a netlist
+
+        Only the module names are indexed here, each module is built from
+        its config when it is first looked up in mods (link looks up the
+        modules of the linked hierarchy only). Unused cells of a large
+        library cost nothing but their config.
+
+        cache is a ParseCache or a cache directory, see readVerilog
+        """
+        if cache is None:
+            nl = self.__parseYAML(yamlFile)
+        else:
+            cache = _getCache(cache)
+            nl = cache.cached(yamlFile, ("yaml-config",),
+                              lambda: self.__parseYAML(yamlFile))
         
         # save the config info in case we need it later
         self.__yaml.update(nl)
         
         for modname in nl.keys():
-            mod = Module.Module({"name":modname})
-            
-            inputs = myutils.cleanget(nl.get(modname), "inputs")
-            for name in inputs:
-                #todo: add parsing code to determine width msb/lsb here
-                width = int(inputs.get(name))
-                tuples = self.__makePortTupleList__(name, width)
-                for ( name, width, isBusMember, bitIdx, busName ) in tuples:
-                    mod.add_port(PortIn.PortIn({ "name":name, "width":width, "module":mod, "busMember":isBusMember, "bitIdx":bitIdx, "busName":busName }))
+            if modname in self.__mods:
+                self.__redefine(modname)
+            self.__mods.setLazy(modname, self.__yamlLoader(modname, nl[modname]))
+    
+    def __parseYAML(self, yamlFile):
+        " Load a YAML config file, returns the config dict "
+        
+        file = open(yamlFile)
+        try:
+            if yaml.__with_libyaml__:
+                return yaml.load(file, Loader=yaml.CSafeLoader)
+            return yaml.safe_load(file)
+        finally:
+            file.close()
+    
+    def __yamlLoader(self, modname, entry):
+        " the LazyDict loader of a module of a YAML config "
+        return lambda: self.__yamlModule(modname, entry)
+    
+    def __yamlModule(self, modname, entry):
+        " Build module modname from its YAML config entry "
+        # "sequential: true" marks cells without a clock port as sequential
+        mod = Module.Module({"name":modname,
+                             "sequential":entry.get("sequential", False)})
         
-            outputs = myutils.cleanget(nl.get(modname), "outputs")
-            for name in outputs:
+        inputs = myutils.cleanget(entry, "inputs")
+        for name in inputs:
+            #todo: add parsing code to determine width msb/lsb here
+            width = int(inputs.get(name))
+            self.__addYAMLPort(mod, PortIn.PortIn, "in", name, width)
+    
+        outputs = myutils.cleanget(entry, "outputs")
+        for name in outputs:
+            #todo: add parsing code to determine width msb/lsb here
+            width = int(outputs.get(name))
+            self.__addYAMLPort(mod, PortOut.PortOut, "out", name, width)
+        
+        clocks = myutils.cleanget(entry, "clocks")
+        for name in clocks:
+            name = symbols.intern(name)
+            mod.add_port(PortClk.PortClk({"name":name, "module":mod, "busMember":False, "bitIdx":None, "busName":None }))
+        
+        cells = myutils.cleanget(entry, "cells")
+        for name in cells:
+            submodname = cells.get(name)
+            mod.new_cell({"name":name, "submodname":submodname})
+        
+        conns = myutils.cleanget(entry, "connections")
+        for name in conns:
+            ports = conns.get(name)
+            if name in mod.ports:
+                net = mod.ports.get(name)
+            else:
                 #todo: add parsing code to determine width msb/lsb here
-                width = int(outputs.get(name))
-                tuples = self.__makePortTupleList__(name, width)
-                for ( name, width, isBusMember, bitIdx, busName ) in tuples:
-                    mod.add_port(PortOut.PortOut({ "name":name, "width":width, "module":mod, "busMember":isBusMember, "bitIdx":bitIdx, "busName":busName } ))
-            
-            clocks = myutils.cleanget(nl.get(modname), "clocks")
-            for name in clocks:
-                mod.add_port(PortClk.PortClk({"name":name, "module":mod, "busMember":False, "bitIdx":None, "busName":None }))
-            
-            cells = myutils.cleanget(nl.get(modname), "cells")
-            for name in cells:
-                submodname = cells.get(name)
-                mod.new_cell({"name":name, "submodname":submodname})
-            
-            conns = myutils.cleanget(nl.get(modname), "connections")
-            for name in conns:
-                ports = conns.get(name)
-                if name in mod.ports:
-                    net = mod.ports.get(name)
-                else:
-                    #todo: add parsing code to determine width msb/lsb here
-                    net = mod.new_net({"name":name, "width":1, 
-                                       "busMember": False,
-                                       "bitIdx": None,
-                                       "busName": None})
-                for conn in ports.split():
-                    cellport = conn.split('.')
-                    if len(cellport) != 2:
-                        raise Exception("Bad port: " + conn)
-                    cell  = mod.cells.get(cellport[0])
-                    pname = cellport[1]                
-                    pin = cell.new_pin({"name":pname, "portname":pname})
-                    pin.connectNet(net)
-            
-            if modname in self.__mods:
-                print "Warning: " + modname + " has been multiply defined"
-            
-            self.__mods[mod.name] = mod
+                net = mod.new_net({"name":name, "width":1, 
+                                   "busMember": False,
+                                   "bitIdx": None,
+                                   "busName": None})
+            for conn in ports.split():
+                cellport = conn.split('.')
+                if len(cellport) != 2:
+                    raise Exception("Bad port: " + conn)
+                cell  = mod.cells.get(cellport[0])
+                pname = cellport[1]                
+                pin = cell.new_pin({"name":pname, "portname":pname})
+                pin.connectNet(net)
+        
+        return mod
     
-    def __makePortTupleList__(self, name, width):
-        tuples = []
+    def __addYAMLPort(self, mod, portClass, direction, name, width):
+        " add a port, or a bus of width bits, to mod "
+        name = symbols.intern(name)
         
         if width == 1:
-            tuples.append((name, width, False, None, None ))
+            mod.add_port(portClass({ "name":name, "width":width, "module":mod, "busMember":False, "bitIdx":None, "busName":None }))
         elif width > 1:
-            for i in range(0,width):
-                tuples.append((name + "[" + str(i) + "]", 1, True, i, name ))
+            mod.new_bus({ "name":name, "width":width, "direction":direction, "portClass":portClass })
         else:
-            raise Exception("Bad width parameter: " + width)
-        
-        return tuples
+            raise Exception("Bad width parameter: " + str(width))
     
 
+################################################################################
+################################################################################
+def parseVerilog(verilogFile, engine="full", workers=1, backend="object"):
+    """ Parse a Verilog file with the given engine, returns its modules
+    built for the given backend """
+    moduleClass = _moduleClass(backend)
+    if engine == "fast":
+        try:
+            return verilogScan.parseFileModules(verilogFile, workers, moduleClass)
+        except verilogScan.Unsupported, err:
+            print "Warning: " + verilogFile + ": " + str(err) + \
+                ", using the full Verilog grammar"
+    elif engine != "full":
+        raise Exception("Unknown Verilog engine " + str(engine))
+    return verilogParse.parseFileModules(verilogFile, moduleClass)
+
+_identifierRe = re.compile(r"[A-Za-z_][\w$]*\Z")
+
+def _verilogName(name):
+    " name as a Verilog identifier, escaped unless it is a plain one "
+    if _identifierRe.match(name):
+        return name
+    return "\\" + name + " "
+
+def _flatNetAttrs(net, path, **extra):
+    " the attributes of the copy of net of the instance at path "
+    busName = net.busName
+    if busName is not None:
+        busName = path + busName
+    attrs = { "name": path + net.name, "width": net.width,
+              "msb": net.msb, "lsb": net.lsb,
+              "busMember": busName is not None, "busName": busName,
+              "bitIdx": net.bitIdx }
+    attrs.update(extra)
+    return attrs
+
+def _moduleClass(backend):
+    " the Module class of a backend name "
+    if backend == "object":
+        return Module.Module
+    elif backend == "array":
+        # only the array backend needs numpy
+        import ArrayModule
+        return ArrayModule.ArrayModule
+    raise Exception("Unknown netlist backend " + str(backend))
+
+# the version of the modules the Verilog readers build, bump it whenever
+# verilogParse or verilogScan build them differently so that cached
+# snapshots are parsed again
+VERILOG_READER_VERSION = 3
+
+# every Verilog engine builds the same modules, so the engine is not part of
+# the cache key (the backend is added by the readers)
+_verilogCacheOptions = ("verilog", VERILOG_READER_VERSION)
+
+def compileLibrary(yamlFiles, libFile):
+    """ Compile cell library YAML files into libFile, a binary netlist that
+    Netlist.readLibrary attaches with almost no startup cost """
+    if isinstance(yamlFiles, basestring):
+        yamlFiles = [ yamlFiles ]
+    nl = Netlist()
+    for yamlFile in yamlFiles:
+        nl.readYAML(yamlFile)
+    nl.dump(libFile)
+
+def _getCache(cache):
+    " a ParseCache for cache, which may also be a directory name "
+    if isinstance(cache, basestring):
+        return ParseCache.getCache(cache)
+    return cache
+
+def _parseVerilogJob(job):
+    " readVerilogMany worker "
+    return parseVerilog(*job)
+
 ################################################################################
 ################################################################################
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+import os
+import hashlib
+import tempfile
+import cStringIO
+import cPickle as pickle
+from SymbolTable import symbols
+
+class ParseCache(object):
+    """
+    An on-disk cache of parsed netlists, shared between runs (and hosts, if
+    the directory lives on a shared file system).
+
+    Snapshots are keyed by the SHA-1 of the source file contents, the
+    snapshot format version and the reader options, so a changed file or a
+    new reader never returns stale modules. Snapshots are written to a
+    temporary file and renamed into place, so concurrent jobs never see a
+    partial snapshot. Snapshots are readable by everybody the umask allows,
+    like any other file the writer creates. With maxBytes set, the least recently used snapshots
+    are removed whenever the cache grows beyond that budget.
+
+    A snapshot starts with the interned names (see SymbolTable) it uses,
+    the pickled modules refer to them by their index. Loading a snapshot
+    interns these names, so the cell types and pin names of a cached module
+    are the same strings as those of a freshly parsed one.
+
+    >>> import shutil, Netlist
+    >>> cacheDir = tempfile.mkdtemp()
+    >>> cache = ParseCache(cacheDir)
+    >>> nl = Netlist.Netlist()
+    >>> nl.readYAML("test/gates.yml", cache=cache)
+    >>> nl.readVerilog("test/Iface_test.gv", engine="fast", cache=cache)
+    >>> (cache.hits, cache.misses)
+    (0, 2)
+    >>> nl2 = Netlist.Netlist()
+    >>> nl2.readYAML("test/gates.yml", cache=cache)
+    >>> nl2.readVerilog("test/Iface_test.gv", engine="fast", cache=cache)
+    >>> (cache.hits, cache.misses)
+    (2, 2)
+    >>> nl2.mods["Iface_test"].cells.keys() == nl.mods["Iface_test"].cells.keys()
+    True
+    >>> nl2.link("Iface_test")
+    >>> cell = nl2.mods["Iface_test"].cells.values()[0]
+    >>> cell.submodname is symbols.intern(cell.submodname)
+    True
+    >>> umask = os.umask(022)
+    >>> cache.store("perms", [])
+    >>> oct(os.stat(os.path.join(cacheDir, "perms.snap")).st_mode & 0777)
+    '0644'
+    >>> umask = os.umask(umask)
+    >>> shutil.rmtree(cacheDir)
+    """
+
+    # bump this whenever the pickled object model changes
+    version = 7
+
+    suffix = ".snap"
+
+    hits      = property(lambda self: self.__hits)
+    misses    = property(lambda self: self.__misses)
+    evictions = property(lambda self: self.__evictions)
+    directory = property(lambda self: self.__dir)
+    maxBytes  = property(lambda self: self.__maxBytes)
+
+    def __init__(self, directory, maxBytes=None):
+        self.__dir = directory
+        self.__maxBytes = maxBytes
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, fileName, *options):
+        " The cache key of a source file parsed with the given options "
+        h = hashlib.sha1()
+        FH = open(fileName, 'rb')
+        block = FH.read(1 << 20)
+        while block:
+            h.update(block)
+            block = FH.read(1 << 20)
+        FH.close()
+        h.update(repr((self.version,) + options))
+        return h.hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.__dir, key + self.suffix)
+
+    def load(self, key):
+        " Returns the object stored under key, None on a miss "
+        path = self.__path(key)
+        try:
+            FH = open(path, 'rb')
+        except IOError:
+            self.__misses += 1
+            return None
+        try:
+            unpickler = pickle.Unpickler(FH)
+            names = [ symbols.name(i) for i in symbols.load(unpickler.load()) ]
+            unpickler.persistent_load = names.__getitem__
+            obj = unpickler.load()
+        except Exception:
+            # damaged or written by an incompatible version
+            FH.close()
+            self.__misses += 1
+            return None
+        FH.close()
+        self.__hits += 1
+        try:
+            # the modification time orders the snapshots for eviction
+            os.utime(path, None)
+        except OSError:
+            pass
+        return obj
+
+    def store(self, key, obj):
+        " Atomically store obj under key, then enforce the size budget "
+        # pickle the object first to find the interned names it uses
+        names = []
+        ids = dict()
+        def persistent_id(name):
+            if type(name) is not str or name not in symbols:
+                return None
+            i = ids.get(name)
+            if i is None:
+                i = ids[name] = len(names)
+                names.append(name)
+            return i
+        buf = cStringIO.StringIO()
+        pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = persistent_id
+        pickler.dump(obj)
+
+        (fd, tmp) = tempfile.mkstemp(dir=self.__dir, suffix=".tmp")
+        try:
+            FH = os.fdopen(fd, 'wb')
+            pickle.dump(names, FH, pickle.HIGHEST_PROTOCOL)
+            FH.write(buf.getvalue())
+            FH.close()
+            # mkstemp creates the file for the owner only
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0666 & ~umask)
+            os.rename(tmp, self.__path(key))
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        if self.__maxBytes is not None:
+            self.evict(self.__maxBytes)
+
+    def evict(self, maxBytes):
+        " Remove least recently used snapshots until at most maxBytes remain "
+        entries = []
+        total = 0
+        for name in os.listdir(self.__dir):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.__dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for (mtime, size, path) in entries:
+            if total <= maxBytes:
+                break
+            try:
+                os.remove(path)
+                self.__evictions += 1
+            except OSError:
+                # somebody else evicted it already
+                pass
+            total -= size
+
+    def cached(self, fileName, options, parse):
+        """ Return the cached result of parse() for fileName, calling parse
+        and storing its result on a miss """
+        key = self.key(fileName, *options)
+        obj = self.load(key)
+        if obj is None:
+            obj = parse()
+            self.store(key, obj)
+        return obj
+
+
+_caches = dict()
+
+def getCache(directory, maxBytes=None):
+    """ The ParseCache of a directory, shared by all readers of this process
+    so that the hit/miss counters add up. maxBytes must agree with the
+    budget the cache was first created with, None keeps that budget.
+
+    >>> import shutil
+    >>> cacheDir = tempfile.mkdtemp()
+    >>> getCache(cacheDir, 1 << 20) is getCache(cacheDir)
+    True
+    >>> getCache(cacheDir, 1 << 10) # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    Exception: ParseCache ... already has maxBytes 1048576, not 1024
+    >>> shutil.rmtree(cacheDir)
+    """
+    directory = os.path.abspath(directory)
+    if directory not in _caches:
+        _caches[directory] = ParseCache(directory, maxBytes)
+    cache = _caches[directory]
+    if maxBytes is not None and maxBytes != cache.maxBytes:
+        raise Exception("ParseCache %s already has maxBytes %s, not %s"
+                        % (directory, cache.maxBytes, maxBytes))
+    return cache
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,558 @@
+#
+# Partition.py
+#
+# Multilevel k-way partitioning of a linked module, so that simulation,
+# timing or checks can run on the parts in separate processes.
+#
+# The module is a hypergraph: the cells are the vertices and every signal
+# is a net connecting the cells it touches (see Connectivity.incidence). A
+# part boundary cuts every net that touches cells of two or more parts, and
+# the partitioner keeps the number of cut nets small while every part gets
+# its share of the cells.
+#
+# k parts are made by recursive bisection. A bisection is multilevel:
+#
+#   coarsening   cells connected by small nets are matched in pairs and
+#                contracted, repeatedly, down to a few hundred vertices
+#   initial      the coarsest hypergraph is bisected at random a few times,
+#                each refined, and the best bisection is kept
+#   refinement   the bisection is projected back level by level and refined
+#                with Fiduccia-Mattheyses (FM) passes at every level
+#
+# Coarsening and projection work on whole NumPy arrays. An FM pass moves
+# one vertex at a time; it starts from the vertices on cut nets and gives
+# up after a run of moves that do not improve the cut, so it only touches
+# the neighbourhood of the boundary.
+#
+import array
+import heapq
+import numpy
+from ordereddict import OrderedDict
+import ArrayModule
+import Connectivity
+import PortClk
+import PortIn
+import PortOut
+
+
+# nets with more pins than this do not pull cells together while coarsening
+MATCH_NET_SIZE = 32
+# coarsening stops at this many vertices
+COARSEST = 160
+# random initial bisections tried on the coarsest hypergraph
+INITIAL_TRIES = 8
+
+
+class Partitioner(object):
+    """
+    Splits a linked module into k parts of about the same number of cells,
+    cutting few nets.
+
+    >>> import Netlist
+    >>> nl = Netlist.Netlist()
+    >>> nl.readYAML("test/gates.yml")
+    >>> nl.readVerilog("test/counter_test.gv")
+    >>> nl.link("counter")
+    >>> parts = Partitioner(nl.mods["counter"], 2)
+    >>> sorted([ sorted(parts.cells(p)) for p in range(2) ])
+    [['U1', 'U2', 'r0'], ['U3', 'r1']]
+    >>> parts.cutNets
+    ['clk', 'c0']
+
+    Every part can be made a module of its own, whose ports are the nets
+    it shares with the rest of the design:
+
+    >>> p = parts.part("U3")
+    >>> parts.boundary(p)
+    OrderedDict([('clk', ('clk', 'in')), ('q[1]', ('q[1]', 'out')), ('c0', ('c0', 'in'))])
+    >>> nl.addModule(parts.module(p, "counter_msb"))
+    >>> nl.link("counter_msb")
+    >>> nl.checkDesign()
+    []
+
+    Bus bits that are not next to each other become scalar ports:
+
+    >>> nl.readVerilog("test/scatter_test.gv")
+    >>> nl.link("scatter")
+    >>> Partitioner(nl.mods["scatter"], 1).boundary(0)
+    OrderedDict([('a', ('a', 'in')), ('b', ('b', 'in')), ('z_1_', ('z[1]', 'out')), ('z_7_', ('z[7]', 'out'))])
+    >>> nl.addModule(Partitioner(nl.mods["scatter"], 1).module(0, "scatter_part"))
+    >>> nl.link("scatter_part")
+    >>> nl.mods["scatter_part"].ports.keys(), nl.checkDesign()
+    (['a', 'b', 'z_1_', 'z_7_'], [])
+    """
+
+    module = property(lambda self: self.__mod)
+    k      = property(lambda self: self.__k)
+    # the part of every cell, by cell id (see Connectivity.cellNames)
+    parts  = property(lambda self: self.__parts)
+    connectivity = property(lambda self: self.__conn)
+
+    def __init__(self, mod, k=2, imbalance=0.05, seed=0):
+        """ Partition mod into k parts of at most (1 + imbalance) times the
+        average number of cells """
+        self.__mod = mod
+        self.__k = k
+        self.__conn = Connectivity.Connectivity(mod)
+        ncells = len(self.__conn.cellNames)
+        (netStart, netPins) = _nets(self.__conn.incidence(),
+                                    len(self.__conn.signalNames))
+        self.__netStart = netStart
+        self.__netPins = netPins
+        self.__parts = numpy.zeros(ncells, dtype=numpy.int32)
+        if k > 1 and ncells > 0:
+            # the imbalance of every bisection, so that the parts of the
+            # last one are within imbalance of the average
+            depth = int(numpy.ceil(numpy.log2(k)))
+            epsilon = (1.0 + imbalance) ** (1.0 / depth) - 1.0
+            rng = numpy.random.RandomState(seed)
+            _partition(netStart, netPins, numpy.ones(ncells, dtype=numpy.int64),
+                       numpy.arange(ncells), k, 0, epsilon, rng, self.__parts)
+        self.__cut = None
+
+    #
+    # results
+    #
+    def part(self, cell):
+        " the part of cell (a name) "
+        return int(self.__parts[self.__conn.cellId(cell)])
+
+    def cells(self, p):
+        " the names of the cells of part p "
+        names = self.__conn.cellNames
+        return [ names[c] for c in numpy.flatnonzero(self.__parts == p) ]
+
+    def __cutIds(self):
+        if self.__cut is None:
+            self.__cut = _cutNets(self.__netStart, self.__netPins, self.__parts)
+        return self.__cut
+
+    cutNets = property(lambda self: [ self.__conn.signalNames[s]
+                                      for s in self.__cutIds() ])
+
+    def boundary(self, p):
+        """ {port name: (signal name, direction)} of the ports of part p:
+        the module ports its cells use and the cut nets, output ports where
+        the part drives them. A bus keeps its name if the bits the part uses
+        are a contiguous run of ports of one direction, otherwise the bits
+        become scalar ports named like q_0_ """
+        mod = self.__mod
+        conn = self.__conn
+        names = conn.signalNames
+        nports = len(mod.ports)
+        drivers = conn.drivers()
+        (indptr, indices) = conn.incidence()
+        cells = numpy.flatnonzero(self.__parts == p)
+        used = numpy.unique(indices[_rows(indptr, cells)])
+        cut = numpy.zeros(len(names), dtype=bool)
+        cut[self.__cutIds()] = True
+        ports = used[(used < nports) | cut[used]]
+
+        signals = OrderedDict()
+        for s in ports.tolist():
+            d = drivers[s]
+            driven = d >= 0 and self.__parts[d] == p
+            signals[names[s]] = driven and "out" or "in"
+        # buses are kept if their bits in the part are ports of one
+        # direction without gaps, so the part's bus has no bits it does not
+        # connect
+        busDirections = dict()
+        busBits = dict()
+        for s in used.tolist():
+            signal = mod.ports.get(names[s]) or mod.nets[names[s]]
+            if signal.busName is not None:
+                direction = signals.get(signal.name)
+                busDirections.setdefault(signal.busName, set()).add(direction)
+                busBits.setdefault(signal.busName, []).append(int(signal.bitIdx))
+        keep = set()
+        for (busName, bits) in busBits.iteritems():
+            if (len(busDirections[busName]) == 1 and None not in busDirections[busName]
+                and max(bits) - min(bits) + 1 == len(bits)):
+                keep.add(busName)
+        boundary = OrderedDict()
+        for (name, direction) in signals.iteritems():
+            signal = mod.ports.get(name) or mod.nets[name]
+            if signal.busName is not None and signal.busName not in keep:
+                name = signal.busName + "_" + str(signal.bitIdx) + "_"
+            boundary[name] = (signal.name, direction)
+        return boundary
+
+    def module(self, p, name=None):
+        """ Part p as a module of its own (of the same backend), named name
+        or like top_1. Its cells connect to the same nets, the nets in
+        boundary(p) become ports """
+        mod = self.__mod
+        conn = self.__conn
+        if name is None:
+            name = mod.name + "_" + str(p)
+        part = mod.__class__({"name": name})
+
+        signals = dict()
+        for (portName, (signalName, direction)) in self.boundary(p).iteritems():
+            signal = mod.ports.get(signalName) or mod.nets[signalName]
+            if portName == signalName:
+                attrs = ArrayModule._netAttrs(signal, module=part)
+            else:
+                attrs = { "name": portName, "width": 1, "busMember": False,
+                          "busName": None, "bitIdx": None, "module": part }
+            original = mod.ports.get(signalName)
+            if direction == "in" and isinstance(original, PortClk.PortClk):
+                portClass = PortClk.PortClk
+            else:
+                portClass = direction == "in" and PortIn.PortIn or PortOut.PortOut
+            signals[signalName] = part.add_port(portClass(attrs))
+
+        for c in numpy.flatnonzero(self.__parts == p).tolist():
+            cell = mod.cells[conn.cellNames[c]]
+            new = part.new_cell({"name": cell.name, "submodname": cell.submodname})
+            for pin in cell.pins.itervalues():
+                newPin = new.new_pin({"name": pin.name})
+                net = pin.net
+                if net is None:
+                    continue
+                signal = signals.get(net.name)
+                if signal is None:
+                    signal = signals[net.name] = part.new_net(ArrayModule._netAttrs(net))
+                newPin.connectNet(signal)
+        return part
+
+
+#
+# hypergraphs: (netStart, netPins) CSR arrays of the vertices of every net
+#
+def _nets(incidence, nsignals):
+    " the nets of a cells x signals incidence, every cell once per net "
+    (indptr, indices) = incidence
+    ncells = len(indptr) - 1
+    cells = numpy.repeat(numpy.arange(ncells, dtype=numpy.int64), numpy.diff(indptr))
+    keys = numpy.unique(indices.astype(numpy.int64) * max(ncells, 1) + cells)
+    netStart = numpy.zeros(nsignals + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(keys // max(ncells, 1), minlength=nsignals),
+                 out=netStart[1:])
+    return (netStart, (keys % max(ncells, 1)).astype(numpy.int64))
+
+def _rows(start, rows):
+    " the indices of the entries of rows of a CSR array "
+    lens = start[rows + 1] - start[rows]
+    first = numpy.cumsum(lens) - lens
+    return numpy.repeat(start[rows] - first, lens) + numpy.arange(lens.sum())
+
+def _compact(netStart, netPins, nverts):
+    """ the nets with two or more distinct vertices, duplicate vertices of a
+    net removed """
+    sizes = numpy.diff(netStart)
+    nets = numpy.repeat(numpy.arange(len(sizes), dtype=numpy.int64), sizes)
+    keys = numpy.unique(nets * max(nverts, 1) + netPins)
+    nets = keys // max(nverts, 1)
+    sizes = numpy.bincount(nets, minlength=len(sizes))
+    keep = sizes[nets] >= 2
+    keys = keys[keep]
+    (unused, nets) = numpy.unique(keys // max(nverts, 1), return_inverse=True)
+    start = numpy.zeros(len(unused) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(nets, minlength=len(unused)), out=start[1:])
+    return (start, keys % max(nverts, 1))
+
+def _cutNets(netStart, netPins, part):
+    " the nets whose vertices are in more than one part "
+    sizes = numpy.diff(netStart)
+    nonEmpty = numpy.flatnonzero(sizes > 0)
+    if len(nonEmpty) == 0:
+        return nonEmpty
+    parts = part[netPins]
+    first = netStart[nonEmpty]
+    low = numpy.minimum.reduceat(parts, first)
+    high = numpy.maximum.reduceat(parts, first)
+    return nonEmpty[low != high]
+
+def _induce(netStart, netPins, vertices, nverts):
+    " the hypergraph of a subset of the vertices, renumbered in order "
+    index = -numpy.ones(nverts, dtype=numpy.int64)
+    index[vertices] = numpy.arange(len(vertices))
+    sizes = numpy.diff(netStart)
+    nets = numpy.repeat(numpy.arange(len(sizes), dtype=numpy.int64), sizes)
+    pins = index[netPins]
+    inside = pins >= 0
+    start = numpy.zeros(len(sizes) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(nets[inside], minlength=len(sizes)), out=start[1:])
+    return _compact(start, pins[inside], len(vertices))
+
+
+#
+# recursive bisection
+#
+def _partition(netStart, netPins, weights, cells, k, first, epsilon, rng, parts):
+    " assign parts first .. first + k - 1 to cells, the vertices of the hypergraph "
+    if k == 1:
+        parts[cells] = first
+        return
+    k0 = k // 2
+    (netStart, netPins) = _compact(netStart, netPins, len(weights))
+    side = _bisect(netStart, netPins, weights, float(k0) / k, epsilon, rng)
+    for (s, kk, f) in ((0, k0, first), (1, k - k0, first + k0)):
+        vertices = numpy.flatnonzero(side == s)
+        (start, pins) = _induce(netStart, netPins, vertices, len(weights))
+        _partition(start, pins, weights[vertices], cells[vertices], kk, f,
+                   epsilon, rng, parts)
+
+def _bisect(netStart, netPins, weights, fraction, epsilon, rng):
+    """ multilevel bisection, vertex weights split fraction : 1 - fraction,
+    returns the side (0 or 1) of every vertex """
+    total = weights.sum()
+    targets = (total * fraction, total * (1.0 - fraction))
+    maxWeight = max(1, int(1.5 * total / COARSEST))
+
+    # coarsen
+    levels = []
+    while len(weights) > COARSEST:
+        cmap = _match(netStart, netPins, weights, maxWeight, rng)
+        ncoarse = int(cmap.max()) + 1
+        if ncoarse > 0.95 * len(weights):
+            break
+        levels.append((netStart, netPins, weights, cmap))
+        (netStart, netPins) = _compact(netStart, cmap[netPins], ncoarse)
+        weights = numpy.bincount(cmap, weights, minlength=ncoarse).astype(numpy.int64)
+
+    # initial bisections of the coarsest hypergraph
+    fm = _FM(netStart, netPins, weights, targets, epsilon)
+    best = None
+    for i in xrange(INITIAL_TRIES):
+        order = rng.permutation(len(weights))
+        side = numpy.ones(len(weights), dtype=numpy.int8)
+        side[order[numpy.cumsum(weights[order]) <= targets[0]]] = 0
+        side = fm.refine(side, rng)
+        score = fm.score(side)
+        if best is None or score > best[0]:
+            best = (score, side)
+    side = best[1]
+
+    # uncoarsen and refine
+    for (netStart, netPins, weights, cmap) in reversed(levels):
+        side = side[cmap]
+        side = _FM(netStart, netPins, weights, targets, epsilon).refine(side, rng)
+    return side
+
+def _match(netStart, netPins, weights, maxWeight, rng):
+    """ Pair vertices connected by small nets, the heavier the connection
+    the better (a net of n vertices adds 1 / (n - 1) to every pair along a
+    random path through it). Vertices that point at each other are paired,
+    a few rounds, and the vertices still alone join a neighbouring pair.
+    Returns the coarse vertex of every vertex """
+    n = len(weights)
+    sizes = numpy.diff(netStart)
+    nets = numpy.repeat(numpy.arange(len(sizes), dtype=numpy.int64), sizes)
+    # the pins of every net in random order
+    order = numpy.argsort(nets + rng.random_sample(len(netPins)))
+    pins = netPins[order]
+    nets = nets[order]
+    same = (nets[:-1] == nets[1:]) & (sizes[nets[:-1]] <= MATCH_NET_SIZE)
+    a = pins[:-1][same]
+    b = pins[1:][same]
+    w = 1.0 / (sizes[nets[:-1][same]] - 1)
+    (keys, inverse) = numpy.unique(numpy.minimum(a, b) * n + numpy.maximum(a, b),
+                                   return_inverse=True)
+    w = numpy.bincount(inverse, w)
+    a = numpy.concatenate([ keys // n, keys % n ])
+    b = numpy.concatenate([ keys % n, keys // n ])
+    # random tie breaks
+    w = numpy.concatenate([ w, w ]) * (1.0 + 1e-6 * rng.random_sample(2 * len(w)))
+
+    mate = -numpy.ones(n, dtype=numpy.int64)
+    edges = (a, b, w)
+    for i in xrange(4):
+        live = (mate[a] < 0) & (mate[b] < 0) & (weights[a] + weights[b] <= maxWeight)
+        if not live.any():
+            break
+        (a, b, w) = (a[live], b[live], w[live])
+        best = _heaviest(a, b, w, n)
+        chosen = numpy.flatnonzero(best >= 0)
+        mutual = chosen[best[best[chosen]] == chosen]
+        mate[mutual] = best[mutual]
+    leader = numpy.where(mate >= 0, numpy.minimum(mate, numpy.arange(n)), numpy.arange(n))
+
+    # the vertices left alone join the pair of their heaviest neighbour
+    (a, b, w) = edges
+    pairWeight = weights + numpy.where(mate >= 0, weights[numpy.maximum(mate, 0)], 0)
+    live = (mate[a] < 0) & (mate[b] >= 0) & (weights[a] + pairWeight[b] <= maxWeight)
+    if live.any():
+        best = _heaviest(a[live], b[live], w[live], n)
+        alone = numpy.flatnonzero(best >= 0)
+        leader[alone] = leader[best[alone]]
+    return numpy.unique(leader, return_inverse=True)[1]
+
+
+def _heaviest(a, b, w, n):
+    " the b of the heaviest edge (a, b) of every vertex a, -1 if it has none "
+    order = numpy.argsort(a + 0.5 - 0.25 * w / w.max())
+    firsts = order[numpy.concatenate([ [ True ], a[order][1:] != a[order][:-1] ])]
+    best = -numpy.ones(n, dtype=numpy.int64)
+    best[a[firsts]] = b[firsts]
+    return best
+
+
+class _FM(object):
+    " Fiduccia-Mattheyses refinement of the bisections of one hypergraph "
+
+    def __init__(self, netStart, netPins, weights, targets, epsilon):
+        self.netStart = netStart
+        self.netPins = netPins
+        self.weights = weights
+        self.limits = [ max(t * (1.0 + epsilon), t + weights.max()) for t in targets ]
+        self.targets = targets
+        # the nets of every vertex
+        sizes = numpy.diff(netStart)
+        nets = numpy.repeat(numpy.arange(len(sizes), dtype=numpy.int64), sizes)
+        order = numpy.argsort(netPins, kind="mergesort")
+        self.pinOrder = order
+        self.vertexNets = nets[order]
+        self.vertexStart = numpy.zeros(len(weights) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(netPins, minlength=len(weights)),
+                     out=self.vertexStart[1:])
+        self.pinNets = nets
+        # the same as Python sequences for the moves
+        self.netStartList = netStart.tolist()
+        self.netPinsArray = array.array('l', netPins.tolist())
+        self.vertexStartList = self.vertexStart.tolist()
+        self.vertexNetsArray = array.array('l', self.vertexNets.tolist())
+        self.weightList = weights.tolist()
+
+    def score(self, side):
+        " (balanced, -cut) of a bisection, greater is better "
+        w = numpy.bincount(side, self.weights, minlength=2)
+        balanced = w[0] <= self.limits[0] and w[1] <= self.limits[1]
+        cut = len(_cutNets(self.netStart, self.netPins, side))
+        return (balanced, -cut)
+
+    def refine(self, side, rng, passes=8):
+        for i in xrange(passes):
+            (side, improved) = self.refinePass(side, rng)
+            if not improved:
+                break
+        return side
+
+    def refinePass(self, side, rng):
+        """ One FM pass: move the vertex with the best gain, lock it, repeat,
+        and keep the best bisection seen on the way """
+        nverts = len(self.weights)
+        nnets = len(self.netStart) - 1
+        side = side.astype(numpy.int8)
+        pinSide = side[self.netPins]
+        count1 = numpy.bincount(self.pinNets, pinSide, minlength=nnets).astype(numpy.int64)
+        count0 = numpy.diff(self.netStart) - count1
+        # gain of moving a vertex: the nets it alone holds on its side, less
+        # the nets that do not reach the other side yet
+        byVertex = self.pinOrder
+        own = numpy.where(pinSide == 1, count1[self.pinNets], count0[self.pinNets])[byVertex]
+        other = numpy.where(pinSide == 1, count0[self.pinNets], count1[self.pinNets])[byVertex]
+        vertexOf = numpy.repeat(numpy.arange(nverts), numpy.diff(self.vertexStart))
+        gains = (numpy.bincount(vertexOf, own == 1, minlength=nverts) -
+                 numpy.bincount(vertexOf, other == 0, minlength=nverts)).astype(numpy.int64)
+        # the vertices on cut nets start in the heaps
+        onCut = numpy.zeros(nverts, dtype=bool)
+        cutNets = (count0 > 0) & (count1 > 0)
+        onCut[vertexOf[cutNets[self.vertexNets]]] = True
+        if not onCut.any():
+            return (side, False)
+
+        count = [ array.array('l', count0.tolist()), array.array('l', count1.tolist()) ]
+        gain = gains.tolist()
+        part = bytearray(side.tostring())
+        locked = bytearray(nverts)
+        netStart = self.netStartList
+        netPins = self.netPinsArray
+        vertexStart = self.vertexStartList
+        vertexNets = self.vertexNetsArray
+        weight = self.weightList
+        limits = self.limits
+        w = numpy.bincount(side, self.weights, minlength=2).tolist()
+
+        ties = rng.random_sample(nverts).tolist()
+        heaps = ([], [])
+        for v in numpy.flatnonzero(onCut).tolist():
+            heaps[part[v]].append((-gain[v], ties[v], v))
+        for heap in heaps:
+            heapq.heapify(heap)
+
+        def balanced(w):
+            return w[0] <= limits[0] and w[1] <= limits[1]
+
+        moves = []
+        total = 0
+        best = (balanced(w), 0, -abs(w[0] - self.targets[0]))
+        bestMoves = 0
+        stall = max(100, nverts // 100)
+        while len(moves) - bestMoves < stall:
+            # the best feasible move from either side
+            choice = None
+            for s in (0, 1):
+                heap = heaps[s]
+                while heap:
+                    (g, tie, v) = heap[0]
+                    if locked[v] or part[v] != s or -g != gain[v]:
+                        heapq.heappop(heap)
+                        continue
+                    if w[1 - s] + weight[v] > limits[1 - s] and w[s] <= limits[s]:
+                        # would unbalance, and the source side is fine
+                        heapq.heappop(heap)
+                        continue
+                    break
+                if heap and (choice is None or -heap[0][0] > gain[choice] or
+                             (-heap[0][0] == gain[choice] and w[s] > w[1 - s])):
+                    choice = heap[0][2]
+            if choice is None:
+                break
+            v = choice
+            s = part[v]
+            t = 1 - s
+            locked[v] = 1
+            total += gain[v]
+            countS = count[s]
+            countT = count[t]
+            for i in xrange(vertexStart[v], vertexStart[v + 1]):
+                n = vertexNets[i]
+                before = countT[n]
+                if before <= 1:
+                    for j in xrange(netStart[n], netStart[n + 1]):
+                        u = netPins[j]
+                        if locked[u]:
+                            continue
+                        if before == 0:
+                            gain[u] += 1
+                        elif part[u] == t:
+                            gain[u] -= 1
+                        else:
+                            continue
+                        heapq.heappush(heaps[part[u]], (-gain[u], ties[u], u))
+                countS[n] -= 1
+                countT[n] += 1
+                after = countS[n]
+                if after <= 1:
+                    for j in xrange(netStart[n], netStart[n + 1]):
+                        u = netPins[j]
+                        if locked[u]:
+                            continue
+                        if after == 0:
+                            gain[u] -= 1
+                        elif part[u] == s:
+                            gain[u] += 1
+                        else:
+                            continue
+                        heapq.heappush(heaps[part[u]], (-gain[u], ties[u], u))
+            part[v] = t
+            w[s] -= weight[v]
+            w[t] += weight[v]
+            moves.append(v)
+            score = (balanced(w), total, -abs(w[0] - self.targets[0]))
+            if score > best:
+                best = score
+                bestMoves = len(moves)
+
+        # undo the moves after the best bisection
+        for v in moves[bestMoves:]:
+            part[v] = 1 - part[v]
+        side = numpy.frombuffer(bytes(part), dtype=numpy.int8).copy()
+        return (side, bestMoves > 0)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
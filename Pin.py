@@ -2,13 +2,13 @@ from Generic import *
 
 class Pin(Generic):
     "Defines a Verilog Pin"
+    __slots__ = ('__cell', '__net', '__port')
+
     def __init__(self, attrs):
         Generic.__init__(self, attrs)
         
         # attrs
-        self.__cell     = self.get("cell")
-        self.__portname = self.get("portname", False)
-        self.__netname  = self.get("netname", False)
+        self.__cell     = self.get(attrs, "cell")
         
         # to be linked
         self.__net  = None
@@ -17,8 +17,9 @@ class Pin(Generic):
     cell = property(lambda self: self.__cell)
     port = property(lambda self: self.__port)
     net  = property(lambda self: self.__net)
-    portname = property(lambda self: self.__portname)
-    netname = property(lambda self: self.__netname)
+    # a pin is named after the port of the submodule it connects to
+    portname = property(lambda self: self.name)
+    netname = property(lambda self: self.__net and self.__net.name)
 
     #link!
     def connect(self, net, port):
@@ -27,11 +28,37 @@ class Pin(Generic):
 
     def connectPort(self, port):
         self.__port     = port
-        self.__portname = port.name
+
+    def bind(self, port, isInput):
+        " connect to port and add the pin to the fanin/fanout of its net "
+        self.__port = port
+        if self.__net is None:
+            # unconnected, see Module.violations
+            return
+        if isInput:
+            self.__net.addFanout(self)
+        else:
+            self.__net.setFanin(self)
 
     def connectNet(self, net):
+        # a linked pin leaves its old net, link() connects it again
+        self.unlink()
+        self.module.changed(self.__cell, net)
         self.__net     = net
-        self.__netname = net.name
+
+    def unlink(self):
+        " take the pin off the fanin/fanout of its net, undoing link "
+        port = self.__port
+        if port is None:
+            return
+        net = self.__net
+        if net is not None:
+            if port.direction == "in":
+                net.removeFanout(self)
+            else:
+                net.removeFanin(self)
+        self.__port = None
+        self.module.changed(self.__cell, net)
         
 
     
@@ -4,11 +4,13 @@ from Net import *
 class Port(Net):
 
     "Defines a Verilog Module Port"
+    __slots__ = ('__dir', '__net')
+
     def __init__(self, attrs):
         Net.__init__(self, attrs)
 
         # properties
-        self.__dir = self.get("direction")
+        self.__dir = self.get(attrs, "direction")
 
         if self.__dir != "in" and self.__dir != "out":
             raise Exception("Bad port direction")
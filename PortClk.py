@@ -1,6 +1,8 @@
 from PortIn import *
 
 class PortClk(PortIn):
+    __slots__ = ()
+
     def __init__(self, attrs):
         attrs['width'] = 1
         PortIn.__init__(self, attrs)
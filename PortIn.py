@@ -1,6 +1,7 @@
 from Port import *
 
 class PortIn(Port):
+    __slots__ = ()
 
     def __init__(self, attrs):
         attrs["direction"] = "in"
@@ -1,6 +1,7 @@
 from Port import *
 
 class PortOut(Port):
+    __slots__ = ()
 
     def __init__(self, attrs):
         attrs["direction"] = "out"
@@ -0,0 +1,304 @@
+#
+# Simulator.py
+#
+# A bit-parallel, levelized logic simulator. Every signal of the simulated
+# module holds one bit per pattern, packed into rows of 64-bit words, so a
+# single NumPy operation evaluates a gate for 64 * words patterns.
+#
+# The function of a library cell is the boolean "primitive" expression of
+# its entry in the YAML library (gates.yml), e.g. not((A1 and A2) or B).
+# Each primitive is compiled once into a Python function that applies the
+# same expression to whole word arrays with the bitwise operators. The
+# cells of the module are levelized (see Module.levelize) and, within a
+# level, grouped by cell type, so a level costs one call per cell type:
+#
+#   values[out] = primitive(values[in1], values[in2], ...)
+#
+# Sequential cells (level 0) hold the state. clock() evaluates their
+# primitive as the next state function and updates all of them at once.
+#
+import ast
+import numpy
+from ordereddict import OrderedDict
+
+
+WORD_BITS = 64
+
+
+class Simulator(object):
+    """
+    Simulates the library cells of a linked module on many patterns at once.
+
+    >>> import Netlist
+    >>> nl = Netlist.Netlist()
+    >>> nl.readYAML("test/gates.yml")
+    >>> nl.readVerilog("test/counter_test.gv")
+    >>> nl.link("counter")
+    >>> sim = Simulator(nl, "counter")
+    >>> sim.set("en", pack([ 0, 1 ]))
+    >>> for i in range(4):
+    ...     sim.clock()
+    ...     print unpack(sim.get("q[1]"), 2), unpack(sim.get("q[0]"), 2)
+    [0, 0] [0, 1]
+    [0, 1] [0, 0]
+    [0, 1] [0, 1]
+    [0, 0] [0, 0]
+
+    The counter only counts in the second pattern, where en is 1.
+    """
+
+    words    = property(lambda self: self.__words)
+    patterns = property(lambda self: self.__words * WORD_BITS)
+    module   = property(lambda self: self.__mod)
+    # the compiled levels, level 0 holds the sequential cells. A level is a
+    # list of (function, input rows, output rows, submodname, cells)
+    # groups, cells are the cell names (cell ids for an ArrayModule)
+    levels   = property(lambda self: [ self.__state ] + self.__logic)
+    # one row of words per signal (see row()), the ports come first. The
+    # last two rows are the constant 0 of unconnected inputs and the sink
+    # of unconnected outputs
+    values   = property(lambda self: self.__values)
+    zeroRow  = property(lambda self: self.__zero)
+    sinkRow  = property(lambda self: self.__sink)
+    # number of gates evaluated so far, times the number of patterns
+    evaluations = property(lambda self: self.__evaluations * self.patterns)
+
+    def __init__(self, netlist, topModule=None, words=1):
+        if topModule is None:
+            topModule = netlist.topMod
+        self.__netlist = netlist
+        self.__mod = netlist.mods[topModule]
+        self.__words = words
+        self.__primitives = dict()
+        self.__evaluations = 0
+        # sorted pin keys of an ArrayModule, see __arrayGroups
+        self.__pinKeys = None
+
+        mod = self.__mod
+        self.__signals = OrderedDict()
+        for port in mod.ports.itervalues():
+            self.__signals[port.name] = len(self.__signals)
+        for name in mod.nets.iterkeys():
+            self.__signals[name] = len(self.__signals)
+        # two extra rows: constant 0 for unconnected inputs and a sink for
+        # unconnected outputs
+        self.__zero = len(self.__signals)
+        self.__sink = self.__zero + 1
+
+        levels = mod.levelize()
+        if mod.backend == "array":
+            groups = [ self.__arrayGroups(level) for level in levels ]
+        else:
+            groups = [ self.__objectGroups(level) for level in levels ]
+        self.__state = groups[0]
+        self.__logic = groups[1:]
+        self.reset()
+
+    #
+    # compilation
+    #
+    def primitive(self, submodname):
+        """ (function, input pin names, output pin name) of a library cell,
+        compiled from its primitive the first time it is used """
+        prim = self.__primitives.get(submodname)
+        if prim is not None:
+            return prim
+        submod = self.__netlist.mods[submodname]
+        if len(submod.cells) > 0:
+            raise Exception("cannot simulate " + self.__mod.name + ", " +
+                            submodname + " is not a library cell")
+        config = self.__netlist.yaml.get(submodname) or dict()
+        if config.get("primitive") is None:
+            raise Exception("no primitive for " + submodname)
+        outputs = [ port.name for port in submod.ports.itervalues()
+                    if port.direction == "out" ]
+        if len(outputs) != 1:
+            raise Exception("cannot simulate " + submodname +
+                            ", it has " + str(len(outputs)) + " outputs")
+        inputs = [ port.name for port in submod.ports.itervalues()
+                   if port.direction == "in" ]
+        (function, args) = compilePrimitive(str(config["primitive"]), inputs)
+        prim = self.__primitives[submodname] = (function, args, outputs[0])
+        return prim
+
+    def __objectGroups(self, cells):
+        " the groups of a level, one per cell type, see levels "
+        byType = OrderedDict()
+        for cell in cells:
+            byType.setdefault(cell.submodname, []).append(cell)
+        groups = []
+        for (submodname, cells) in byType.iteritems():
+            (function, args, output) = self.primitive(submodname)
+            ins = [ [ self.__row(cell.pins.get(a), self.__zero) for a in args ]
+                    for cell in cells ]
+            outs = [ self.__row(cell.pins.get(output), self.__sink)
+                     for cell in cells ]
+            groups.append((function,
+                           numpy.array(ins, dtype=numpy.intp).reshape(len(cells), len(args)),
+                           numpy.array(outs, dtype=numpy.intp),
+                           submodname, [ cell.name for cell in cells ]))
+        return groups
+
+    def __row(self, pin, default):
+        if pin is None or pin.net is None:
+            return default
+        return self.__signals[pin.net.name]
+
+    def __arrayGroups(self, cells):
+        " __objectGroups for the cell id arrays of an ArrayModule "
+        mod = self.__mod
+        if self.__pinKeys is None:
+            # (cell, pin name) of every pin, sorted for searchsorted
+            npn = len(mod.pinNameTable)
+            keys = mod.pinCells().astype(numpy.int64) * npn + mod.pinNameIds()
+            order = numpy.argsort(keys, kind="mergesort")
+            sig = mod.pinSignals()[order].astype(numpy.intp)
+            sig[sig < 0] = -1
+            self.__pinKeys = (npn, keys[order], sig,
+                              dict([ (n, i) for (i, n) in enumerate(mod.pinNameTable) ]))
+        (npn, keys, sig, nameIds) = self.__pinKeys
+
+        def rows(cells, name, default):
+            " the signal rows of pin name of cells "
+            result = numpy.empty(len(cells), dtype=numpy.intp)
+            result.fill(default)
+            if name not in nameIds or len(keys) == 0:
+                return result
+            want = cells.astype(numpy.int64) * npn + nameIds[name]
+            k = numpy.minimum(numpy.searchsorted(keys, want), len(keys) - 1)
+            found = (keys[k] == want) & (sig[k] >= 0)
+            result[found] = sig[k[found]]
+            return result
+
+        types = mod.cellTypes()[cells]
+        typeNames = mod.typeNames
+        groups = []
+        for t in numpy.unique(types):
+            group = cells[types == t]
+            (function, args, output) = self.primitive(typeNames[t])
+            ins = numpy.empty((len(group), len(args)), dtype=numpy.intp)
+            for (i, a) in enumerate(args):
+                ins[:, i] = rows(group, a, self.__zero)
+            groups.append((function, ins, rows(group, output, self.__sink),
+                           typeNames[t], group))
+        return groups
+
+    #
+    # simulation
+    #
+    def reset(self):
+        " set all signals, and so the state of all sequential cells, to 0 "
+        self.__values = numpy.zeros((self.__sink + 1, self.__words), dtype=numpy.uint64)
+        self.__evaluated = False
+
+    def set(self, name, value):
+        """ Set an input port (or any signal) to value, an array of words
+        or a single word for all of them """
+        self.__values[self.__signals[name]] = value
+        self.__evaluated = False
+
+    def row(self, name):
+        " the row of signal name in values "
+        return self.__signals[name]
+
+    def get(self, name):
+        " the words of signal name, evaluated for the current inputs "
+        if not self.__evaluated:
+            self.evaluate()
+        return self.__values[self.__signals[name]].copy()
+
+    def evaluate(self):
+        " propagate the inputs and the state through the logic, level by level "
+        values = self.__values
+        for level in self.__logic:
+            for (function, ins, outs, submodname, cells) in level:
+                values[outs] = function(*[ values[ins[:, i]]
+                                           for i in xrange(ins.shape[1]) ])
+                self.__evaluations += len(outs)
+        values[self.__zero] = 0
+        self.__evaluated = True
+
+    def clock(self):
+        """ One clock cycle: every sequential cell takes the value of its
+        primitive for the current inputs """
+        if not self.__evaluated:
+            self.evaluate()
+        values = self.__values
+        nextState = []
+        for (function, ins, outs, submodname, cells) in self.__state:
+            nextState.append(function(*[ values[ins[:, i]]
+                                         for i in xrange(ins.shape[1]) ]))
+            self.__evaluations += len(outs)
+        for (group, state) in zip(self.__state, nextState):
+            values[group[2]] = state
+        self.__evaluated = False
+
+
+class _BitwiseExpression(object):
+    " translates the AST of a boolean primitive into bitwise Python source "
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.names = []
+
+    def source(self, node):
+        if isinstance(node, ast.BoolOp):
+            op = isinstance(node.op, ast.And) and " & " or " | "
+            return "(" + op.join([ self.source(v) for v in node.values ]) + ")"
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return "(~" + self.source(node.operand) + ")"
+        if isinstance(node, ast.Name):
+            if node.id == "True":
+                return "_ONES"
+            if node.id == "False":
+                return "_ZERO"
+            if node.id not in self.inputs:
+                raise Exception("unknown pin " + node.id + " in primitive")
+            if node.id not in self.names:
+                self.names.append(node.id)
+            return node.id
+        raise Exception("unsupported primitive expression " + ast.dump(node))
+
+
+def compilePrimitive(expr, inputs):
+    """ Compile a primitive (a Python boolean expression over the input pin
+    names) into a function of numpy word arrays. Returns the function and
+    the pin names of its arguments, in the order of inputs.
+
+    >>> (nand, args) = compilePrimitive("not(A1 and A2)", ["A1", "A2"])
+    >>> args, nand(numpy.uint64(12), numpy.uint64(10)) & numpy.uint64(15)
+    (['A1', 'A2'], 7)
+    """
+    translator = _BitwiseExpression(inputs)
+    body = translator.source(ast.parse(expr.strip(), mode="eval").body)
+    args = [ name for name in inputs if name in translator.names ]
+    env = { "_ONES": numpy.uint64(0xFFFFFFFFFFFFFFFF), "_ZERO": numpy.uint64(0) }
+    function = eval("lambda " + ", ".join(args) + ": " + body, env)
+    return (function, args)
+
+
+def pack(bits):
+    """ Pack a list of 0/1 values, one per pattern, into an array of words
+
+    >>> pack([ 1, 0, 1 ])
+    array([5], dtype=uint64)
+    """
+    bits = numpy.asarray(bits, dtype=numpy.uint64)
+    words = numpy.zeros((len(bits) + WORD_BITS - 1) // WORD_BITS, dtype=numpy.uint64)
+    for (i, bit) in enumerate(bits):
+        words[i // WORD_BITS] |= bit << numpy.uint64(i % WORD_BITS)
+    return words
+
+def unpack(words, n):
+    """ The first n patterns of an array of words as a list of 0/1 values
+
+    >>> unpack(pack([ 1, 0, 1 ]), 3)
+    [1, 0, 1]
+    """
+    return [ int((words[i // WORD_BITS] >> numpy.uint64(i % WORD_BITS)) & numpy.uint64(1))
+             for i in xrange(n) ]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
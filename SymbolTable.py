@@ -0,0 +1,82 @@
+class SymbolTable(object):
+    """
+    Interned names with integer symbol ids.
+
+    Gate-level netlists repeat the same few names over and over: every
+    instance of a cell type has the same submodname and pin names, and the
+    bits of a bus all share its name. The readers and the Module
+    constructors pass those names (cell types, pin, port and bus names)
+    through the table, so each one is stored once and all cells and pins
+    refer to the same string object. The strings are the canonical ones, so
+    dict lookups with them only compare pointers. Net and cell names are
+    unique anyway and are not interned, so the table only grows with the
+    vocabulary of the libraries and designs, not with their size.
+
+    >>> table = SymbolTable()
+    >>> cp = table.intern("".join(["C", "P"]))
+    >>> cp is table.intern("CP"), table.id("CP"), table.name(0)
+    (True, 0, 'CP')
+
+    The names can be exported and loaded into another table, load() returns
+    the new id of every exported id. ParseCache stores the names a snapshot
+    uses this way and maps them back to the canonical strings on load:
+
+    >>> other = SymbolTable(["data"])
+    >>> other.load(table.export() + ["data"])
+    [1, 0]
+    """
+
+    names = property(lambda self: self.__names)
+
+    def __init__(self, names=()):
+        self.__ids = dict()
+        self.__names = []
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        " the canonical copy of name, added to the table if it is new "
+        if name is None:
+            return None
+        i = self.__ids.get(name)
+        if i is None:
+            i = len(self.__names)
+            self.__ids[name] = i
+            self.__names.append(name)
+            return name
+        return self.__names[i]
+
+    def id(self, name):
+        " the symbol id of name, added to the table if it is new "
+        i = self.__ids.get(name)
+        if i is None:
+            self.intern(name)
+            i = len(self.__names) - 1
+        return i
+
+    def name(self, i):
+        return self.__names[i]
+
+    def __len__(self):
+        return len(self.__names)
+
+    def __contains__(self, name):
+        return name in self.__ids
+
+    def export(self):
+        " all names, in id order "
+        return list(self.__names)
+
+    def load(self, names):
+        """ Add exported names to the table, returns the list of their ids
+        in this table """
+        return [ self.id(name) for name in names ]
+
+
+# the table shared by all netlists of this process
+symbols = SymbolTable()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,377 @@
+#
+# Timing.py
+#
+# Block-based static timing analysis of a linked module.
+#
+# Every library cell has a single delay, the "delay" entry of its YAML
+# library entry (1.0 when there is none), from any input to any output.
+# Timing paths start at the input ports, which arrive at 0, and at the
+# outputs of the sequential cells, which arrive after the delay of the
+# cell. They end at the output ports and at the inputs of the sequential
+# cells, which are required at the clock period.
+#
+# The module is levelized once (see Module.levelize) and the timing graph
+# is kept as flat arrays: one edge per input pin (input row -> cell) and
+# per output pin (cell -> output row), sorted by level and cell. Arrival
+# times are propagated forward and required times backward one level at a
+# time with NumPy segment reductions, so an analysis costs a few array
+# operations per level.
+#
+import numpy
+import PortClk
+
+
+class TimingAnalyzer(object):
+    """
+    Static timing analysis of a linked module.
+
+    >>> import Netlist
+    >>> nl = Netlist.Netlist()
+    >>> nl.readYAML("test/gates.yml")
+    >>> nl.readVerilog("test/counter_test.gv")
+    >>> nl.link("counter")
+    >>> [ nl.yaml[cell]["delay"] for cell in ("DFQD1", "AN2D1", "XOR2D1") ]
+    [1.0, 1.0, 2.0]
+    >>> sta = TimingAnalyzer(nl, "counter", period=5.0)
+    >>> (sta.arrival("c0"), sta.arrival("n1"), sta.slack("n1"))
+    (2.0, 4.0, 1.0)
+    >>> (slack, path) = sta.criticalPaths(1)[0]
+    >>> slack, [ (cell, signal) for (cell, signal, arrival) in path ]
+    (1.0, [('r0', 'q[0]'), ('U2', 'c0'), ('U3', 'n1')])
+
+    Delays can be changed without analyzing the whole module again:
+
+    >>> sta.setDelay("U2", 3.0)
+    >>> sta.update()
+    >>> (sta.arrival("n1"), sta.worstSlack)
+    (6.0, -1.0)
+    """
+
+    module = property(lambda self: self.__mod)
+    period = property(lambda self: self.__period)
+    # names of the signals (ports, then nets), see slacks()
+    signalNames = property(lambda self: list(self.__names))
+
+    def __init__(self, netlist, topModule=None, period=None, defaultDelay=1.0):
+        if topModule is None:
+            topModule = netlist.topMod
+        self.__netlist = netlist
+        self.__mod = netlist.mods[topModule]
+        self.__fixedPeriod = period
+        self.__defaultDelay = defaultDelay
+        self.__period = None
+        self.__build()
+        self.__analyze()
+
+    #
+    # timing graph
+    #
+    def __delay(self, submod):
+        if len(submod.cells) > 0:
+            raise Exception("cannot time " + self.__mod.name + ", " +
+                            submod.name + " is not a library cell")
+        config = self.__netlist.yaml.get(submod.name) or dict()
+        return float(config.get("delay", self.__defaultDelay))
+
+    def __build(self):
+        mod = self.__mod
+        self.__revision = mod.revision
+        self.__names = mod.ports.keys() + mod.nets.keys()
+        self.__rows = dict([ (name, i) for (i, name) in enumerate(self.__names) ])
+        levels = mod.levelize()
+        if mod.backend == "array":
+            self.__buildArrays(levels)
+        else:
+            self.__buildObjects(levels)
+        ncells = len(self.__level)
+        nrows = len(self.__names)
+
+        # endpoints: output ports and the inputs of sequential cells
+        outPorts = [ i for (i, port) in enumerate(mod.ports.itervalues())
+                     if port.direction == "out" ]
+        self.__outPorts = numpy.array(outPorts, dtype=numpy.intp)
+        self.__seqInRow = self.__inRow[self.__level[self.__inCell] == 0]
+
+        # the edges sorted by (level, cell) with the bounds of every level
+        self.__numLevels = len(levels)
+        (self.__inOrder, self.__inBounds) = self.__sortEdges(self.__inCell)
+        (self.__outOrder, self.__outBounds) = self.__sortEdges(self.__outCell)
+
+        # the input edges by row (the loads of every row), by cell, and the
+        # driver of every row
+        order = numpy.argsort(self.__inRow, kind="mergesort")
+        self.__loadCell = self.__inCell[order]
+        self.__loadStart = numpy.zeros(nrows + 1, dtype=numpy.intp)
+        numpy.cumsum(numpy.bincount(self.__inRow, minlength=nrows),
+                     out=self.__loadStart[1:])
+        order = numpy.argsort(self.__inCell, kind="mergesort")
+        self.__cellInRow = self.__inRow[order]
+        self.__cellInStart = numpy.zeros(ncells + 1, dtype=numpy.intp)
+        numpy.cumsum(numpy.bincount(self.__inCell, minlength=ncells),
+                     out=self.__cellInStart[1:])
+        self.__driver = -numpy.ones(nrows, dtype=numpy.intp)
+        self.__driver[self.__outRow] = self.__outCell
+
+        # the rows loaded by the cells of every level
+        self.__levelRows = []
+        for l in xrange(self.__numLevels):
+            (lo, hi) = self.__inBounds[l:l + 2]
+            self.__levelRows.append(numpy.unique(self.__inRow[self.__inOrder[lo:hi]]))
+
+        self.__arrival = numpy.zeros(nrows)
+        self.__required = numpy.zeros(nrows)
+        self.__cellRequired = numpy.zeros(ncells)
+        self.__changed = set()
+
+    def __sortEdges(self, cell):
+        " edge order by (level, cell) and the first edge of every level "
+        order = numpy.lexsort((cell, self.__level[cell]))
+        bounds = numpy.searchsorted(self.__level[cell][order],
+                                    numpy.arange(self.__numLevels + 1))
+        return (order, bounds)
+
+    def __buildObjects(self, levels):
+        " the timing graph of a Module, cells are numbered in level order "
+        rows = self.__rows
+        cells = []
+        level = []
+        delay = []
+        edges = ([], [], [], [])
+        delays = dict()
+        for (l, cellsOfLevel) in enumerate(levels):
+            for cell in cellsOfLevel:
+                c = len(cells)
+                cells.append(cell.name)
+                level.append(l)
+                submod = cell.submod
+                d = delays.get(submod)
+                if d is None:
+                    d = delays[submod] = self.__delay(submod)
+                delay.append(d)
+                for pin in cell.pins.itervalues():
+                    net = pin.net
+                    if net is None:
+                        continue
+                    port = pin.port
+                    if port.direction == "in":
+                        if not isinstance(port, PortClk.PortClk):
+                            edges[0].append(rows[net.name])
+                            edges[1].append(c)
+                    else:
+                        edges[2].append(c)
+                        edges[3].append(rows[net.name])
+        self.__cellNames = cells
+        self.__cellIndex = dict([ (name, c) for (c, name) in enumerate(cells) ])
+        self.__level = numpy.array(level, dtype=numpy.intp)
+        self.__delays = numpy.array(delay, dtype=float)
+        (self.__inRow, self.__inCell, self.__outCell, self.__outRow) = \
+            [ numpy.array(e, dtype=numpy.intp) for e in edges ]
+
+    def __buildArrays(self, levels):
+        " the timing graph of an ArrayModule, cells keep their ids "
+        mod = self.__mod
+        import ArrayModule
+        ncells = mod.numCells
+        self.__cellNames = None
+        self.__cellIndex = None
+        self.__level = numpy.zeros(ncells, dtype=numpy.intp)
+        for (l, cells) in enumerate(levels):
+            self.__level[cells] = l
+        submods = [ self.__netlist.mods[t] for t in mod.typeNames ]
+        self.__delays = numpy.array([ self.__delay(s) for s in submods ],
+                                    dtype=float)[mod.cellTypes()]
+
+        # clock pins of every (cell type, pin name)
+        names = mod.pinNameTable
+        clock = numpy.zeros((len(submods), len(names)), dtype=bool)
+        for (t, submod) in enumerate(submods):
+            for (n, name) in enumerate(names):
+                port = submod.pinTable().get(name)
+                clock[t, n] = port is not None and isinstance(port[0], PortClk.PortClk)
+        cell = mod.pinCells().astype(numpy.intp)
+        sig = mod.pinSignals().astype(numpy.intp)
+        direction = mod.pinDirections()
+        isClock = clock[mod.cellTypes()[cell], mod.pinNameIds()]
+        ins = (direction == ArrayModule.DIR_IN) & (sig >= 0) & ~isClock
+        outs = (direction == ArrayModule.DIR_OUT) & (sig >= 0)
+        self.__inRow = sig[ins]
+        self.__inCell = cell[ins]
+        self.__outCell = cell[outs]
+        self.__outRow = sig[outs]
+
+    def __cell(self, cell):
+        " the index of a cell name "
+        if self.__cellIndex is None:
+            return self.__mod.cells[cell].id
+        return self.__cellIndex[cell]
+
+    def __cellName(self, c):
+        if self.__cellNames is None:
+            return self.__mod.cellName(int(c))
+        return self.__cellNames[c]
+
+    #
+    # propagation
+    #
+    def __forward(self, first):
+        " arrival times of the rows driven by the cells of levels >= first "
+        arrival = self.__arrival
+        if first == 0:
+            arrival[:] = 0.0
+        for l in xrange(first, self.__numLevels):
+            (lo, hi) = self.__outBounds[l:l + 2]
+            outs = self.__outOrder[lo:hi]
+            if len(outs) == 0:
+                continue
+            outCell = self.__outCell[outs]
+            # the latest input arrival of the cell of every output edge,
+            # only the cells of this level are looked at
+            start = numpy.zeros(len(outs))
+            if l > 0:
+                (lo, hi) = self.__inBounds[l:l + 2]
+                ins = self.__inOrder[lo:hi]
+                if len(ins):
+                    inCell = self.__inCell[ins]
+                    (cells, cellFirst) = numpy.unique(inCell, return_index=True)
+                    latest = numpy.maximum.reduceat(arrival[self.__inRow[ins]], cellFirst)
+                    k = numpy.minimum(numpy.searchsorted(cells, outCell), len(cells) - 1)
+                    hit = cells[k] == outCell
+                    start[hit] = latest[k[hit]]
+            arrival[self.__outRow[outs]] = start + self.__delays[outCell]
+
+    def __rowRequired(self, rows):
+        " the required times of rows from the cells loading them "
+        required = self.__endpointRequired[rows]
+        lens = self.__loadStart[rows + 1] - self.__loadStart[rows]
+        loaded = lens > 0
+        if loaded.any():
+            rows = rows[loaded]
+            lens = lens[loaded]
+            first = numpy.cumsum(lens) - lens
+            edges = numpy.repeat(self.__loadStart[rows] - first, lens) + numpy.arange(lens.sum())
+            cellRequired = self.__cellRequired[self.__loadCell[edges]]
+            required[loaded] = numpy.minimum(required[loaded],
+                                             numpy.minimum.reduceat(cellRequired, first))
+        return required
+
+    def __backward(self, last):
+        " required times of the rows loaded by the cells of levels <= last "
+        required = self.__required
+        cellRequired = self.__cellRequired
+        for l in xrange(last, 0, -1):
+            (lo, hi) = self.__outBounds[l:l + 2]
+            outs = self.__outOrder[lo:hi]
+            if len(outs) == 0:
+                continue
+            outCell = self.__outCell[outs]
+            (cells, first) = numpy.unique(outCell, return_index=True)
+            cellRequired[cells] = numpy.minimum.reduceat(
+                required[self.__outRow[outs]] - self.__delays[outCell], first)
+            rows = self.__levelRows[l]
+            required[rows] = self.__rowRequired(rows)
+
+    def __setPeriod(self):
+        " the period, the latest endpoint arrival unless it was given "
+        period = self.__fixedPeriod
+        if period is None:
+            ends = numpy.concatenate([ self.__outPorts, self.__seqInRow ])
+            period = len(ends) and float(self.__arrival[ends].max()) or 0.0
+        changed = period != self.__period
+        self.__period = period
+        return changed
+
+    def __analyze(self, first=0, last=None):
+        " propagate arrival times from level first, required from level last "
+        self.__forward(first)
+        if self.__setPeriod() or last is None:
+            # all required times depend on the period
+            nrows = len(self.__names)
+            self.__endpointRequired = numpy.empty(nrows)
+            self.__endpointRequired.fill(numpy.inf)
+            self.__endpointRequired[self.__outPorts] = self.__period
+            self.__cellRequired.fill(numpy.inf)
+            self.__cellRequired[self.__level == 0] = self.__period
+            self.__required = self.__rowRequired(numpy.arange(nrows))
+            last = self.__numLevels - 1
+        self.__backward(last)
+
+    #
+    # incremental updates
+    #
+    def setDelay(self, cell, delay):
+        " change the delay of cell (a cell name), see update() "
+        c = self.__cell(cell)
+        self.__delays[c] = delay
+        self.__changed.add(c)
+
+    def update(self):
+        """ Bring the timing up to date: after setDelay() only the levels
+        at and above the changed cells are propagated forward and those at
+        and below them backward, after a change to the module everything is
+        analyzed again """
+        if self.__mod.revision != self.__revision:
+            delays = dict([ (self.__cellName(c), self.__delays[c])
+                            for c in self.__changed ])
+            self.__build()
+            for (cell, delay) in delays.iteritems():
+                if cell in self.__mod.cells:
+                    self.__delays[self.__cell(cell)] = delay
+            self.__analyze()
+            return
+        if not self.__changed:
+            return
+        levels = self.__level[list(self.__changed)]
+        self.__changed = set()
+        self.__analyze(int(levels.min()), int(levels.max()))
+
+    #
+    # results
+    #
+    def __row(self, name):
+        return self.__rows[name]
+
+    def arrival(self, name):
+        return float(self.__arrival[self.__row(name)])
+
+    def required(self, name):
+        return float(self.__required[self.__row(name)])
+
+    def slack(self, name):
+        return float(self.__required[self.__row(name)] - self.__arrival[self.__row(name)])
+
+    def slacks(self):
+        " the slack of every signal (inf off all timing paths), see signalNames "
+        return self.__required - self.__arrival
+
+    worstSlack = property(lambda self: float(self.slacks().min()))
+
+    def criticalPaths(self, k=1):
+        """ The k endpoints with the least slack and their critical paths,
+        as a list of (slack, [(driving cell, signal, arrival), ...]) from
+        the start of the path to the endpoint """
+        ends = numpy.concatenate([ self.__outPorts, self.__seqInRow ])
+        ends = numpy.unique(ends)
+        slack = self.__period - self.__arrival[ends]
+        paths = []
+        for i in numpy.argsort(slack, kind="mergesort")[:k]:
+            row = ends[i]
+            path = []
+            while True:
+                c = self.__driver[row]
+                if c < 0:
+                    path.append((None, self.__names[row], float(self.__arrival[row])))
+                    break
+                path.append((self.__cellName(c), self.__names[row],
+                             float(self.__arrival[row])))
+                rows = self.__cellInRow[self.__cellInStart[c]:self.__cellInStart[c + 1]]
+                if self.__level[c] == 0 or len(rows) == 0:
+                    break
+                row = rows[numpy.argmax(self.__arrival[rows])]
+            path.reverse()
+            paths.append((float(slack[i]), path))
+        return paths
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,75 @@
+"""
+Memory used per netlist object.
+
+Builds n objects of each kind with the normal constructors and reports the
+growth of the resident set size divided by n. Names are shared between all
+objects, so only the objects themselves are measured.
+
+    python bench/objectMemory.py [n]
+"""
+import os
+import sys
+import gc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import Module
+import Cell
+import Net
+import Pin
+import PortIn
+
+def rss():
+    " resident set size of this process in bytes "
+    FH = open("/proc/self/statm")
+    pages = int(FH.read().split()[1])
+    FH.close()
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+# objects of earlier measurements are kept alive, so that their memory is
+# not reused by the next one
+_keep = []
+
+def measure(make, n):
+    " average number of bytes of the objects returned by make(i) "
+    gc.collect()
+    objs = [ None ] * n
+    before = rss()
+    for i in xrange(n):
+        objs[i] = make(i)
+    after = rss()
+    _keep.append(objs)
+    return float(after - before) / n
+
+def main(n):
+    mod = Module.Module({"name": "bench"})
+    cell = mod.new_cell({"name": "u", "submodname": "INVD1"})
+    net = mod.new_net({"name": "n", "width": 1, "busMember": False,
+                       "bitIdx": None, "busName": None})
+
+    def makeNet(i):
+        return Net.Net({"name": "n", "module": mod, "width": 1,
+                        "busMember": False, "bitIdx": None, "busName": None})
+    def makePort(i):
+        return PortIn.PortIn({"name": "a", "module": mod, "width": 1,
+                              "busMember": True, "bitIdx": 3, "busName": "a"})
+    def makePin(i):
+        pin = Pin.Pin({"name": "I", "portname": "I", "module": mod, "cell": cell})
+        pin.connectNet(net)
+        return pin
+    def makeCell(i):
+        return Cell.Cell({"name": "u", "submodname": "INVD1", "module": mod})
+    def makeCell4(i):
+        c = Cell.Cell({"name": "u", "submodname": "AN3D1", "module": mod})
+        for name in ("A1", "A2", "A3", "Z"):
+            c.new_pin({"name": name, "portname": name}).connectNet(net)
+        return c
+
+    for (label, make) in [ ("Net", makeNet), ("PortIn (bus bit)", makePort),
+                           ("Pin", makePin), ("Cell", makeCell),
+                           ("Cell with 4 pins", makeCell4) ]:
+        print "%-18s %7.1f bytes" % (label, measure(make, n))
+
+if __name__ == "__main__":
+    n = 200000
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    main(n)
@@ -0,0 +1,387 @@
+#
+# binaryNetlist.py
+#
+# A compact, versioned binary file format for Netlist objects, used by
+# Netlist.dump() and Netlist.load().
+#
+# Layout (all integers little endian):
+#
+#   header    "PYVNETL\0", uint32 version, uint32 number of sections
+#   index     one (8 byte tag, uint64 offset, uint64 length) per section
+#   sections
+#     STRINGS   every name in the file, '\0' separated. Everything else
+#               refers to names by their index in this table (-1 is None).
+#               Cell types, pin, port and bus names are interned into
+#               SymbolTable.symbols when a module is decoded
+#     MODULES   one (int32 name, uint64 offset, uint64 length) per module,
+#               the offset is relative to the MODDATA section
+#     MODDATA   the module records
+#     META      pickled dict with the top module and the YAML config
+#
+# A module record starts with uint32 nports, nnets, ncells, npins, flags
+# (1: the module is marked sequential) followed by int32 columns:
+#
+#   ports   name kind width msb lsb busName bitIdx flags
+#   nets    name width msb lsb busName bitIdx flags
+#   cells   name submodname, then ncells+1 pin start offsets (CSR)
+#   pins    name net        net >= 0 is a net, net < 0 is port -net-1
+#
+# Modules are decoded from an mmap of the file only when they are first
+# looked up, so loading a netlist costs almost nothing until it is used.
+# The mapping is read-only, so processes that read the same file (a compiled
+# cell library, see Netlist.compileLibrary) share its physical pages.
+#
+import os
+import sys
+import mmap
+import array
+import struct
+import cPickle as pickle
+import Module
+import Port
+import PortIn
+import PortOut
+import PortClk
+import myutils
+from SymbolTable import symbols
+
+
+class FormatError(Exception):
+    "Raised for files that are not netlist dumps of a supported version"
+    pass
+
+
+MAGIC = "PYVNETL\0"
+VERSION = 2
+
+_header = struct.Struct("<8sII")
+_section = struct.Struct("<8sQQ")
+_moduleEntry = struct.Struct("<iQQ")
+_counts = struct.Struct("<IIIII")
+
+# port classes and their 'kind' code
+_portKinds = [ PortIn.PortIn, PortOut.PortOut, PortClk.PortClk ]
+_PORT_IN, _PORT_OUT = 3, 4
+
+# flag bits
+_BUS_MEMBER = 1
+_BIT_INT    = 2
+_BIT_STR    = 4
+_HAS_MSB    = 8
+_HAS_LSB    = 16
+
+_NO_NET = -(1 << 31)
+
+# module flag bits
+_SEQUENTIAL = 1
+
+
+def _intArray(values=()):
+    return array.array('i', values)
+
+def _bytes(a):
+    if sys.byteorder != 'little':
+        a = array.array(a.typecode, a)
+        a.byteswap()
+    return a.tostring()
+
+def _fromBytes(data, n, offset):
+    " decode n int32 starting at offset, returns (array, new offset) "
+    a = array.array('i')
+    end = offset + 4 * n
+    a.fromstring(data[offset:end])
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return (a, end)
+
+
+class _Strings(object):
+    " string table used while writing "
+    def __init__(self):
+        self.ids = dict()
+        self.strings = []
+
+    def id(self, s):
+        if s is None:
+            return -1
+        i = self.ids.get(s)
+        if i is None:
+            i = len(self.strings)
+            self.ids[s] = i
+            self.strings.append(s)
+        return i
+
+
+def _netColumns(strings, net):
+    " (width, msb, lsb, busName, bitIdx, flags) of a net or port "
+    flags = 0
+    if net.busMember:
+        flags |= _BUS_MEMBER
+    bitIdx = net.bitIdx
+    if bitIdx is None:
+        bitIdx = -1
+    elif isinstance(bitIdx, basestring):
+        flags |= _BIT_STR
+        bitIdx = strings.id(bitIdx)
+    else:
+        flags |= _BIT_INT
+    msb = net.msb
+    if msb is None:
+        msb = 0
+    else:
+        flags |= _HAS_MSB
+    lsb = net.lsb
+    if lsb is None:
+        lsb = 0
+    else:
+        flags |= _HAS_LSB
+    return (net.width, msb, lsb, strings.id(net.busName), bitIdx, flags)
+
+def _encodeModule(strings, mod):
+    ports = [ _intArray() for i in range(8) ]
+    portIdx = dict()
+    for (i, port) in enumerate(mod.ports.values()):
+        if type(port) in _portKinds:
+            kind = _portKinds.index(type(port))
+        elif port.direction == "in":
+            kind = _PORT_IN
+        else:
+            kind = _PORT_OUT
+        row = (strings.id(port.name), kind) + _netColumns(strings, port)
+        for (col, value) in zip(ports, row):
+            col.append(value)
+        portIdx[port.name] = i
+
+    # nets and ports are looked up by name, the nets of an ArrayModule are
+    # views that are created anew on every access
+    nets = [ _intArray() for i in range(7) ]
+    netIdx = dict()
+    for (i, net) in enumerate(mod.nets.values()):
+        row = (strings.id(net.name),) + _netColumns(strings, net)
+        for (col, value) in zip(nets, row):
+            col.append(value)
+        netIdx[net.name] = i
+
+    cellName = _intArray()
+    cellType = _intArray()
+    pinStart = _intArray([0])
+    pinName = _intArray()
+    pinNet = _intArray()
+    for cell in mod.cells.values():
+        cellName.append(strings.id(cell.name))
+        cellType.append(strings.id(cell.submodname))
+        for pin in cell.pins.values():
+            pinName.append(strings.id(pin.name))
+            net = pin.net
+            if net is None:
+                pinNet.append(_NO_NET)
+            elif isinstance(net, Port.Port):
+                pinNet.append(-portIdx[net.name] - 1)
+            else:
+                pinNet.append(netIdx[net.name])
+        pinStart.append(len(pinName))
+
+    modFlags = 0
+    if mod.sequential:
+        modFlags |= _SEQUENTIAL
+    data = [ _counts.pack(len(ports[0]), len(nets[0]), len(cellName), len(pinName),
+                          modFlags) ]
+    for col in ports + nets + [ cellName, cellType, pinStart, pinName, pinNet ]:
+        data.append(_bytes(col))
+    return ''.join(data)
+
+
+def dump(fileName, mods, topMod=None, config=None):
+    " Write the modules (a dict name -> Module) to fileName "
+    strings = _Strings()
+    entries = []
+    moddata = []
+    offset = 0
+    for mod in mods.values():
+        data = _encodeModule(strings, mod)
+        entries.append(_moduleEntry.pack(strings.id(mod.name), offset, len(data)))
+        moddata.append(data)
+        offset += len(data)
+
+    meta = pickle.dumps({ "topMod": topMod, "yaml": config },
+                        pickle.HIGHEST_PROTOCOL)
+    sections = [ ("STRINGS", '\0'.join(strings.strings)),
+                 ("MODULES", ''.join(entries)),
+                 ("MODDATA", ''.join(moddata)),
+                 ("META",    meta) ]
+
+    FH = open(fileName, 'wb')
+    FH.write(_header.pack(MAGIC, VERSION, len(sections)))
+    offset = _header.size + _section.size * len(sections)
+    for (tag, data) in sections:
+        FH.write(_section.pack(tag, offset, len(data)))
+        offset += len(data)
+    for (tag, data) in sections:
+        FH.write(data)
+    FH.close()
+
+
+class Reader(object):
+    """
+    Random access to the modules of a netlist dump. The file is mapped into
+    memory and each module is only decoded when module() is called.
+
+    >>> import tempfile, os
+    >>> latch = Module.Module({"name": "LATCH", "sequential": True})
+    >>> (fd, dumpFile) = tempfile.mkstemp()
+    >>> dump(dumpFile, {"LATCH": latch})
+    >>> reader = Reader(dumpFile)
+    >>> reader.names, reader.module(0).sequential
+    (['LATCH'], True)
+    >>> os.remove(dumpFile)
+    """
+
+    names  = property(lambda self: [ name for (name, offset, length) in self.__entries ])
+    meta   = property(lambda self: self.__meta)
+
+    def __init__(self, fileName):
+        FH = open(fileName, 'rb')
+        try:
+            self.__data = mmap.mmap(FH.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            FH.close()
+        data = self.__data
+
+        if len(data) < _header.size:
+            raise FormatError(fileName + " is not a netlist dump")
+        (magic, version, nsections) = _header.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise FormatError(fileName + " is not a netlist dump")
+        if version != VERSION:
+            raise FormatError(fileName + " has unsupported version " + str(version))
+
+        sections = dict()
+        for i in range(nsections):
+            (tag, offset, length) = _section.unpack_from(data, _header.size + i * _section.size)
+            sections[tag.rstrip('\0')] = (offset, length)
+        self.__sections = sections
+
+        self.__strings = self.section("STRINGS").split('\0')
+        (self.__moddata, length) = sections["MODDATA"]
+        modules = self.section("MODULES")
+        self.__entries = []
+        for i in range(len(modules) / _moduleEntry.size):
+            (name, offset, length) = _moduleEntry.unpack_from(modules, i * _moduleEntry.size)
+            self.__entries.append((self.__strings[name], offset, length))
+        self.__meta = pickle.loads(self.section("META"))
+
+    def section(self, tag):
+        " the raw bytes of a section "
+        (offset, length) = self.__sections[tag]
+        return self.__data[offset:offset + length]
+
+    def loader(self, i):
+        " a callback that decodes the i'th module "
+        return lambda: self.module(i)
+
+    def __string(self, i):
+        if i < 0:
+            return None
+        return self.__strings[i]
+
+    def __netAttrs(self, cols, i, first):
+        " the constructor attributes of row i of the width..flags columns "
+        strings = self.__strings
+        (width, msb, lsb, busName, bitIdx, flags) = [ cols[c][i] for c in range(first, first + 6) ]
+        if flags & _BIT_STR:
+            bitIdx = strings[bitIdx]
+        elif not flags & _BIT_INT:
+            bitIdx = None
+        attrs = { "width": width,
+                  "busMember": bool(flags & _BUS_MEMBER),
+                  "busName": symbols.intern(self.__string(busName)),
+                  "bitIdx": bitIdx }
+        if flags & _HAS_MSB:
+            attrs["msb"] = msb
+        if flags & _HAS_LSB:
+            attrs["lsb"] = lsb
+        return attrs
+
+    def module(self, i):
+        " decode the i'th module into a new Module object "
+        # the module is one big reference cycle, so collecting while it is
+        # being built only burns time
+        with myutils.gcPaused():
+            return self.__module(i)
+
+    def __module(self, i):
+        (name, offset, length) = self.__entries[i]
+        data = self.__data[self.__moddata + offset:self.__moddata + offset + length]
+        strings = self.__strings
+        (nports, nnets, ncells, npins, modFlags) = _counts.unpack_from(data, 0)
+        pos = _counts.size
+
+        cols = []
+        for c in range(8):
+            (a, pos) = _fromBytes(data, nports, pos)
+            cols.append(a)
+        ports = cols
+        cols = []
+        for c in range(7):
+            (a, pos) = _fromBytes(data, nnets, pos)
+            cols.append(a)
+        nets = cols
+        (cellName, pos) = _fromBytes(data, ncells, pos)
+        (cellType, pos) = _fromBytes(data, ncells, pos)
+        (pinStart, pos) = _fromBytes(data, ncells + 1, pos)
+        (pinName, pos) = _fromBytes(data, npins, pos)
+        (pinNet, pos) = _fromBytes(data, npins, pos)
+
+        mod = Module.Module({"name": name,
+                             "sequential": bool(modFlags & _SEQUENTIAL)})
+        portObjs = []
+        for i in range(nports):
+            attrs = self.__netAttrs(ports, i, 2)
+            attrs["name"] = symbols.intern(strings[ports[0][i]])
+            attrs["module"] = mod
+            kind = ports[1][i]
+            if kind == _PORT_IN or kind == _PORT_OUT:
+                attrs["direction"] = kind == _PORT_IN and "in" or "out"
+                port = Port.Port(attrs)
+            else:
+                port = _portKinds[kind](attrs)
+            portObjs.append(mod.add_port(port))
+
+        netObjs = []
+        for i in range(nnets):
+            attrs = self.__netAttrs(nets, i, 1)
+            attrs["name"] = strings[nets[0][i]]
+            netObjs.append(mod.new_net(attrs))
+
+        for c in range(ncells):
+            cell = mod.new_cell({"name": strings[cellName[c]],
+                                 "submodname": strings[cellType[c]]})
+            for p in range(pinStart[c], pinStart[c + 1]):
+                pname = strings[pinName[p]]
+                pin = cell.new_pin({"name": pname, "portname": pname})
+                net = pinNet[p]
+                if net >= 0:
+                    pin.connectNet(netObjs[net])
+                elif net != _NO_NET:
+                    pin.connectNet(portObjs[-net - 1])
+        return mod
+
+
+_readers = dict()
+
+def getReader(fileName):
+    """ The Reader of fileName, shared by all netlists of this process. A
+    file that changed on disk is opened again """
+    path = os.path.abspath(fileName)
+    st = os.stat(path)
+    key = (path, st.st_mtime, st.st_size)
+    reader = _readers.get(key)
+    if reader is None:
+        reader = _readers[key] = Reader(path)
+    return reader
+
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
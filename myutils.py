@@ -1,5 +1,54 @@
+import gc
+import threading
+from contextlib import contextmanager
+
 def cleanget(dictionary, key):
     val = dict()
     if key in dictionary:
         val = dictionary.get(key)
     return val
+
+
+_gcLock = threading.Lock()
+# number of active gcPaused blocks, collector state before the first one
+_gcPause = [ 0, False ]
+
+@contextmanager
+def gcPaused():
+    """ Disable the cyclic garbage collector inside a with block. The
+    collector is process wide, so the blocks of all threads are counted and
+    only the last one to end restores the state from before the first one.
+
+    >>> gc.isenabled()
+    True
+    >>> with gcPaused():
+    ...     with gcPaused():
+    ...         pass
+    ...     gc.isenabled()
+    False
+    >>> gc.isenabled()
+    True
+    >>> gc.disable()
+    >>> with gcPaused():
+    ...     pass
+    >>> gc.isenabled()
+    False
+    >>> gc.enable()
+    """
+    with _gcLock:
+        if _gcPause[0] == 0:
+            _gcPause[1] = gc.isenabled()
+            gc.disable()
+        _gcPause[0] += 1
+    try:
+        yield
+    finally:
+        with _gcLock:
+            _gcPause[0] -= 1
+            if _gcPause[0] == 0 and _gcPause[1]:
+                gc.enable()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
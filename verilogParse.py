@@ -73,6 +73,7 @@ from pyparsing import Literal, CaselessLiteral, Keyword, Word, Upcase, OneOrMore
         alphanums, printables, dblQuotedString, empty, ParseException, ParseResults, MatchFirst, oneOf, GoToColumn, \
         ParseResults,StringEnd, FollowedBy, ParserElement, And, Regex, cppStyleComment#,__version__
 import pyparsing
+from SymbolTable import symbols
 usePackrat = True
 usePsyco = False
 
@@ -102,101 +103,141 @@ def dumpTokens(s,l,t):
     import pprint
     pprint.pprint( t.asList() )
 
-module = None
-
-def parseModule(s,l,t):
-    import Module
-    global module
-    module = Module.Module({"name": t[0]})
-
-def parsePort(s,l,t,port):
-    global module
-    width=1
-    idx=1
-    # handle optional size declaration
-    if t[1] == '[':
-        width = int(t[2])-int(t[4])+1
-        idx = 6
-    token = t[idx]
-    # handle possibly many signal declarations
-    while token != ';':
+def addPorts(module, port, names, width, lsb=0):
+    """Add the ports declared by one input/output statement to module, a
+    multi-bit port has the bits lsb..lsb+width-1"""
+    for token in names:
+        token = symbols.intern(token)
         if token == 'clk' or token == 'CLK' or token == 'Clk':
             import PortClk
             if width != 1:
                 raise Exception("Expect clock signal " + token + " to have width=1, not " + str(width))
             module.add_port(PortClk.PortClk({ "name":token, "module":module, "busMember":False, "bitIdx":None, "busName":None } ))
-        elif token != ',':
-            if width == 1:
-                module.add_port(port({ "name":token, "width":width, "module":module, "busMember":False, "bitIdx":None, "busName":None }))
-            else:
-                # account for multi-bit ports by adding a new port for each bit
-                for i in range( 0, width ):
-                    module.add_port(port({ "name":token + "[" + str(i) + "]", "width": 1, "module":module, "busMember":True, "bitIdx":i, "busName":token }))
-        #
-        idx += 1
-        token = t[idx]
-
-def parseInput(s,l,t):
-    import PortIn
-    if t[0][0] != 'input':
-        raise Exception("Expected input identifier")
-    parsePort(s,l,t[0],PortIn.PortIn)
-
-def parseOutput(s,l,t):
-    import PortOut
-    if t[0][0] != 'output':
-        raise Exception("Expected output identifier")
-    parsePort(s,l,t[0],PortOut.PortOut)
-
-def parseSubmod(s,l,t):
-    import Cell
-    t = t[0]
-    global module
-    submodname = t[0]
-    if t[1][0][0] == "#":
-        raise Exception("This cell might have parameters? " + str(t[1][0]))
-    name = t[1][0][0]
+        elif width == 1:
+            module.add_port(port({ "name":token, "width":width, "module":module, "busMember":False, "bitIdx":None, "busName":None }))
+        else:
+            # multi-bit ports are added as a bus, its bits (named token[i])
+            # are created when they are first looked up
+            import PortOut
+            direction = issubclass(port, PortOut.PortOut) and "out" or "in"
+            module.new_bus({ "name":token, "width":width, "lsb":lsb, "direction":direction, "portClass":port })
+
+def addCell(module, submodname, name, conns):
+    """Instantiate submodname as cell name inside module. conns holds one
+    (pinName, netName, bitIdx) tuple per pin, bitIdx is None unless the
+    pin connects to a single bit of a bus"""
     cell = module.new_cell({ "name" : name, "submodname": submodname })
-    
-    for tok in t[1][1]:
-        # look for pin-connections
-        if tok != '(' and tok != ')':
-            if len(tok) != 4:
-                raise Exception("Expected this to have length 4")
-            netName = tok[2][0]
-            isBus = False
-            if len(tok[2]) > 1:
-                # account for possible bit select (eg [0])
-                busName = netName
-                bitIdx  = tok[2][1][1]
-                netName += "[" + str( bitIdx ) + "]"
-                isBus = True
-            if netName in module.ports:
-                net = module.ports.get(netName)
-            elif netName in module.nets:
-                net = module.nets.get(netName)
+
+    for (pinName, netName, bitIdx) in conns:
+        isBus = False
+        if bitIdx != None:
+            # account for possible bit select (eg [0])
+            busName = netName
+            netName = busName + "[" + str(bitIdx) + "]"
+            isBus = True
+        # most connections go to a net that already exists, so look there
+        # first (a net is never created for a name that is a port)
+        net = module.nets.get(netName)
+        if net is None:
+            net = module.ports.get(netName)
+        if net is None:
+            if isBus:
+                net = module.new_net({ "name":netName, "width":1, "busMember":True,  "bitIdx":bitIdx, "busName":busName })
             else:
-                if isBus:
-                    net = module.new_net({ "name":netName, "width":1, "busMember":True,  "bitIdx":bitIdx, "busName":busName })
-                else:
-                    try:
-                        net = module.new_net({ "name":netName, "width":1, "busMember":False, "bitIdx":None,   "busName":None    })
-                    except:
-                        print 'tok =', tok
-                        print 'netName =', netName
-                        print 'isBus =', isBus
-                        raise
-            #
-            tmp = tok[0].split('.')
-            if len(tmp) != 2:
-                raise  Exception("Bad pin decl " + str(tmp))
-            pinName = tmp[1]
-            pin = cell.new_pin({"name":pinName, "portname":pinName})
-            pin.connectNet(net)
-
-verilogbnf = None
-def Verilog_BNF():
-    global verilogbnf
+                net = module.new_net({ "name":netName, "width":1, "busMember":False, "bitIdx":None,   "busName":None    })
+        pin = cell.new_pin({"name":pinName, "portname":pinName})
+        pin.connectNet(net)
+    return cell
+
+class ParseContext(object):
+    """Holds the state of one parse: the parse actions below build into this
+    object instead of module globals, so several files can be parsed
+    independently (e.g. in a process pool). Every context gets its own copy
+    of the grammar with the actions bound to it."""
+
+    def __init__(self, moduleClass=None):
+        self.module  = None
+        self.modules = []
+        self.bnf     = None
+        # Module.Module unless given
+        self.moduleClass = moduleClass
+
+    def parseModule(self,s,l,t):
+        moduleClass = self.moduleClass
+        if moduleClass is None:
+            import Module
+            moduleClass = Module.Module
+        self.module = moduleClass({"name": t[0]})
+        self.modules.append(self.module)
+
+    def parsePort(self,s,l,t,port):
+        width=1
+        lsb=0
+        idx=1
+        # handle optional size declaration, [msb:lsb] in either order
+        if t[1] == '[':
+            width = abs(int(t[2])-int(t[4]))+1
+            lsb = min(int(t[2]), int(t[4]))
+            idx = 6
+        names = []
+        token = t[idx]
+        # handle possibly many signal declarations
+        while token != ';':
+            if token != ',':
+                names.append(token)
+            idx += 1
+            token = t[idx]
+        addPorts(self.module, port, names, width, lsb)
+
+    def parseInput(self,s,l,t):
+        import PortIn
+        if t[0][0] != 'input':
+            raise Exception("Expected input identifier")
+        self.parsePort(s,l,t[0],PortIn.PortIn)
+
+    def parseOutput(self,s,l,t):
+        import PortOut
+        if t[0][0] != 'output':
+            raise Exception("Expected output identifier")
+        self.parsePort(s,l,t[0],PortOut.PortOut)
+
+    def parseSubmod(self,s,l,t):
+        t = t[0]
+        submodname = t[0]
+        if t[1][0][0] == "#":
+            raise Exception("This cell might have parameters? " + str(t[1][0]))
+        name = t[1][0][0]
+        conns = []
+
+        for tok in t[1][1]:
+            # look for pin-connections
+            if tok != '(' and tok != ')':
+                if len(tok) != 4:
+                    raise Exception("Expected this to have length 4")
+                netName = tok[2][0]
+                bitIdx = None
+                if len(tok[2]) > 1:
+                    bitIdx = tok[2][1][1]
+                tmp = tok[0].split('.')
+                if len(tmp) != 2:
+                    raise  Exception("Bad pin decl " + str(tmp))
+                conns.append((tmp[1], netName, bitIdx))
+
+        addCell(self.module, submodname, name, conns)
+
+    def parseString(self, strng):
+        return Verilog_BNF(self).parseString( strng )
+
+    def parseFile(self, fileName):
+        return Verilog_BNF(self).parseFile( fileName )
+
+# used by Verilog_BNF() when no context is given
+defaultContext = ParseContext()
+
+def Verilog_BNF(context=None):
+    if context is None:
+        context = defaultContext
+    verilogbnf = context.bnf
 
     if verilogbnf is None:
 
@@ -314,8 +355,8 @@ def Verilog_BNF():
         paramAssgnmt = Group( identifier + "=" + expr ).setName("paramAssgnmt")
         parameterDecl = Group( "parameter" + Optional( range ) + delimitedList( paramAssgnmt ) + semi).setName("paramDecl")
 
-        inputDecl = Group( "input" + Optional( range ) + delimitedList( identifier ) + semi ).setParseAction(parseInput)
-        outputDecl = Group( "output" + Optional( range ) + delimitedList( identifier ) + semi ).setParseAction(parseOutput)
+        inputDecl = Group( "input" + Optional( range ) + delimitedList( identifier ) + semi ).setParseAction(context.parseInput)
+        outputDecl = Group( "output" + Optional( range ) + delimitedList( identifier ) + semi ).setParseAction(context.parseOutput)
         inoutDecl = Group( "inout" + Optional( range ) + delimitedList( identifier ) + semi )
 
         regIdentifier = Group( identifier + Optional( "[" + expr + ":" + expr + "]" ) )
@@ -478,7 +519,7 @@ def Verilog_BNF():
         moduleInstantiation = Group( identifier +
             Optional( parameterValueAssignment ) +
             delimitedList( moduleInstance ).setName("moduleInstanceList") +
-            semi ).setName("moduleInstantiation").setParseAction(parseSubmod)
+            semi ).setName("moduleInstantiation").setParseAction(context.parseSubmod)
 
         parameterOverride = Group( "defparam" + delimitedList( paramAssgnmt ) + semi )
         task = Group( "task" + identifier + semi +
@@ -651,7 +692,7 @@ def Verilog_BNF():
         portExpr = portRef | Group( "{" + delimitedList( portRef ) + "}" )
         port = portExpr | Group( ( "." + identifier + "(" + portExpr + ")" ) )
 
-        moduleHdr = Group ( oneOf("module macromodule") + identifier("moduleName").setParseAction(parseModule) +
+        moduleHdr = Group ( oneOf("module macromodule") + identifier("moduleName").setParseAction(context.parseModule) +
                  Optional( "(" + Group( Optional( delimitedList( 
                                     Group(oneOf("input output") + 
                                             (netDecl1Arg | netDecl2Arg | netDecl3Arg) ) |
@@ -701,6 +742,7 @@ def Verilog_BNF():
 
         verilogbnf.ignore( cppStyleComment )
         verilogbnf.ignore( compilerDirective )
+        context.bnf = verilogbnf
 
     return verilogbnf 
 
@@ -708,7 +750,7 @@ def Verilog_BNF():
 def test( strng ):
     tokens = []
     try:
-        tokens = Verilog_BNF().parseString( strng )
+        tokens = ParseContext().parseString( strng )
     except ParseException, err:
         print err.line
         print " "*(err.column-1) + "^"
@@ -716,10 +758,13 @@ def test( strng ):
     return tokens
 
 
-def parseFile(fileName):
+def parseFileModules(fileName, moduleClass=None):
+    """Parse a Verilog file, returns all modules defined in it, built as
+    moduleClass objects (Module.Module by default)"""
+    context = ParseContext(moduleClass)
     tokens = []
     try:
-        tokens = Verilog_BNF().parseFile( fileName )
+        tokens = context.parseFile( fileName )
     except ParseException, err:
         print err.line
         print " "*(err.column-1) + "^"
@@ -741,7 +786,14 @@ def parseFile(fileName):
     #totalTime += elapsed
     #if ( len( tokens ) ):
     #    print "OK", elapsed
-    return module
+    return context.modules
+
+def parseFile(fileName):
+    "Parse a Verilog file, returns the last module defined in it"
+    mods = parseFileModules(fileName)
+    if len(mods) == 0:
+        return None
+    return mods[-1]
 
 #~ if __name__ == "__main__":
 #if 0:
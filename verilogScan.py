@@ -0,0 +1,384 @@
+#
+# verilogScan.py
+#
+# A fast, streaming reader for flattened gate-level Verilog netlists.
+#
+# verilogParse.py runs every file through the complete Verilog BNF, which is
+# very slow on large netlists even though a gate-level netlist only ever uses
+# a handful of statements:
+#
+#     module / input / output / wire / <cell instance> / endmodule
+#
+# This reader splits the source into statements with a few regular
+# expressions and builds the Module through the same addPorts/addCell code the
+# pyparsing actions use, so both readers produce identical netlists.  Anything
+# outside of that subset raises Unsupported, and the caller is expected to
+# fall back to verilogParse.parseFile.
+#
+# The source is consumed in blocks and turned into a stream of events (see
+# events()), so tools that only need statistics never hold more than one
+# statement of the file in memory.
+#
+import re
+import multiprocessing
+import Module
+import PortIn
+import PortOut
+import verilogParse
+
+
+class Unsupported(Exception):
+    "Raised for Verilog constructs the fast reader does not handle"
+    pass
+
+
+# splits the source into comments, statement terminators and statement text
+_pieceRe = re.compile(r"""
+      (?P<comment>//[^\n]*|/\*.*?\*/|`[^\n]*)
+    | (?P<semi>;)
+    | (?P<open>/\*)
+    | (?P<text>[^;/`\\]+|/|\\\S*)
+    """, re.S | re.X)
+
+_ident   = r"(?:[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*|\\\S+)"
+_range   = r"(?:\[\s*(\d+)\s*:\s*(\d+)\s*\])"
+_pin     = r"\s*\.\s*([A-Za-z_$][\w$]*)\s*\(\s*(%s)\s*(?:\[\s*(\d+)\s*\])?\s*\)\s*" % _ident
+_pinNC   = r"\s*\.\s*[A-Za-z_$][\w$]*\s*\(\s*%s\s*(?:\[\s*\d+\s*\])?\s*\)\s*" % _ident
+
+_endRe      = re.compile(r"\s*endmodule\b")
+_moduleRe   = re.compile(r"\s*(?:module|macromodule)\s+(%s)\s*(?:\((.*)\))?\s*\Z" % _ident, re.S)
+_declRe     = re.compile(r"\s*(input|output|wire)\b\s*%s?\s*(.*?)\s*\Z" % _range, re.S)
+_identRe    = re.compile(r"\s*(%s)\s*\Z" % _ident, re.S)
+_instRe     = re.compile(r"\s*(%s)\s+(%s)\s*\((.*)\)\s*\Z" % (_ident, _ident), re.S)
+_pinRe      = re.compile(_pin, re.S)
+_pinListRe  = re.compile(r"(?:%s,)*%s\Z" % (_pinNC, _pinNC), re.S)
+_headerRe   = re.compile(r"\b(?:input|output|inout)\b")
+_declStartRe = re.compile(r"\s*(?:module|macromodule|input|output|wire)\b")
+
+# statements starting with one of these are never cell instances
+_keywords = set("""always and assign buf bufif0 bufif1 case casex casez cmos
+    deassign default defparam disable else end endcase endfunction endtask
+    event for force forever fork function highz0 highz1 if initial inout
+    input integer join large macromodule medium module nand negedge nmos nor
+    not notif0 notif1 or output parameter pmos posedge primitive pull0 pull1
+    pulldown pullup rcmos real realtime reg release repeat rnmos rpmos rtran
+    rtranif0 rtranif1 scalared small specify specparam strong0 strong1
+    supply0 supply1 table task time tran tranif0 tranif1 tri tri0 tri1
+    triand trior trireg vectored wait wand weak0 weak1 while wire wor xnor
+    xor""".split())
+
+_directions = { "input": "in", "output": "out" }
+
+# how much of the source is read at a time
+blockSize = 1 << 20
+
+
+def _name(ident):
+    "strip the leading backslash from escaped identifiers"
+    if ident[0] == '\\':
+        return ident[1:]
+    return ident
+
+def _names(text):
+    "split a comma separated list of identifiers"
+    names = []
+    for item in text.split(','):
+        m = _identRe.match(item)
+        if m is None:
+            raise Unsupported("unsupported identifier list '" + text.strip() + "'")
+        names.append(_name(m.group(1)))
+    return names
+
+
+def statements(source):
+    """Split Verilog source into statements. source is a file name or an
+    open file, which is read blockSize characters at a time. Comments and
+    compiler directives are dropped, the terminating ';' is not included
+    and 'endmodule' (which has no terminator) is returned on its own"""
+    if isinstance(source, basestring):
+        FH = open(source)
+    else:
+        FH = source
+
+    try:
+        stmt = []
+        buf = ''
+        eof = False
+        while not eof:
+            block = FH.read(blockSize)
+            eof = len(block) == 0
+            buf += block
+            carry = ''
+            for m in _pieceRe.finditer(buf):
+                kind = m.lastgroup
+                if not eof and (kind == 'open' or m.end() == len(buf)):
+                    # the piece may continue in the next block
+                    carry = buf[m.start():]
+                    break
+                if kind == 'text':
+                    stmt.append(m.group())
+                elif kind == 'semi':
+                    for s in _splitEnd(''.join(stmt)):
+                        yield s
+                    stmt = []
+                elif kind == 'open':
+                    raise Unsupported("unterminated comment")
+            buf = carry
+        for s in _splitEnd(''.join(stmt)):
+            yield s
+    finally:
+        if FH is not source:
+            FH.close()
+
+def _splitEnd(stmt):
+    "separate leading endmodule keywords from the statement that follows"
+    m = _endRe.match(stmt)
+    while m is not None:
+        yield 'endmodule'
+        stmt = stmt[m.end():]
+        m = _endRe.match(stmt)
+    if stmt.strip():
+        yield stmt
+
+
+def events(source):
+    """Read a gate-level Verilog file incrementally and yield one event per
+    declaration or instance:
+
+        ("module", name)
+        ("port", direction, name, width, lsb)    direction is "in" or "out"
+        ("wire", name, width, lsb)
+        ("instance", submodname, name, [(pinName, netName, bitIdx), ...])
+        ("endmodule", name)
+
+    bitIdx is None unless the pin connects to a single bit of a bus.
+    Raises Unsupported for anything outside of the gate-level subset.
+    """
+    name = None
+    for stmt in statements(source):
+        if stmt == 'endmodule':
+            if name is None:
+                raise Unsupported("statement outside of a module")
+            yield ("endmodule", name)
+            name = None
+            continue
+
+        ev = _event(stmt)
+        kind = ev[0]
+        if kind == "module":
+            if name is not None:
+                raise Unsupported("nested module " + ev[1])
+            name = ev[1]
+            yield ev
+        elif name is None:
+            raise Unsupported("statement outside of a module")
+        elif kind == "instance":
+            yield ev
+        else:
+            for ev in _declEvents(ev):
+                yield ev
+    if name is not None:
+        raise Unsupported("missing endmodule in " + name)
+
+def _event(stmt):
+    """classify one statement, declarations are returned as a single
+    (keyword, width, lsb, [names]) record"""
+    m = _instRe.match(stmt)
+    if m is not None and m.group(1) not in _keywords:
+        pins = m.group(3)
+        if _pinListRe.match(pins) is None:
+            raise Unsupported("unsupported connections in instance " + m.group(2))
+        conns = [ (p, _name(n), b or None) for (p, n, b) in _pinRe.findall(pins) ]
+        return ("instance", _name(m.group(1)), _name(m.group(2)), conns)
+
+    m = _declRe.match(stmt)
+    if m is not None:
+        width = 1
+        lsb = 0
+        if m.group(2) is not None:
+            (msb, lsb) = (int(m.group(2)), int(m.group(3)))
+            width = abs(msb - lsb) + 1
+            lsb = min(msb, lsb)
+        return (m.group(1), width, lsb, _names(m.group(4)))
+
+    m = _moduleRe.match(stmt)
+    if m is not None:
+        if m.group(2) is not None and _headerRe.search(m.group(2)):
+            raise Unsupported("port declarations inside the module header")
+        return ("module", _name(m.group(1)))
+
+    raise Unsupported("unsupported statement '" + stmt.strip()[:60] + "'")
+
+def _declEvents(decl):
+    "expand a declaration record into port/wire events"
+    (keyword, width, lsb, names) = decl
+    if keyword == "wire":
+        return [ ("wire", name, width, lsb) for name in names ]
+    direction = _directions[keyword]
+    return [ ("port", direction, name, width, lsb) for name in names ]
+
+
+def buildModules(evts, moduleClass=Module.Module):
+    """Build Module objects from a stream of events, yields each finished
+    module. moduleClass may also be ArrayModule.ArrayModule"""
+    module = None
+    for ev in evts:
+        kind = ev[0]
+        if kind == "instance":
+            verilogParse.addCell(module, ev[1], ev[2], ev[3])
+        elif kind == "port":
+            _addPort(module, ev)
+        elif kind == "module":
+            module = moduleClass({"name": ev[1]})
+        elif kind == "endmodule":
+            yield module
+            module = None
+        # nets are created once they are connected (like verilogParse),
+        # so wire declarations do not add anything
+
+def _addPort(module, ev):
+    "add the port(s) of a port event to module"
+    if ev[1] == "in":
+        verilogParse.addPorts(module, PortIn.PortIn, [ev[2]], ev[3], ev[4])
+    else:
+        verilogParse.addPorts(module, PortOut.PortOut, [ev[2]], ev[3], ev[4])
+
+
+def _instanceChunk(stmts):
+    """ buildChunked worker, returns compact (submodname, name, conns)
+    records for a list of instance statements """
+    records = []
+    for stmt in stmts:
+        ev = _event(stmt)
+        if ev[0] != "instance":
+            raise Unsupported("unsupported statement '" + stmt.strip()[:60] + "'")
+        records.append(ev[1:])
+    return records
+
+def buildChunked(source, pool, chunkSize=10000, moduleClass=Module.Module):
+    """Like buildModules(events(source)), but the instance statements are
+    sent to the worker processes of pool in chunks of chunkSize statements.
+    The port declarations of a module are added before any of its cells,
+    then the cells are stitched into the module in their original order."""
+    mods = []
+    module = None
+    ports = []
+    pending = []
+    chunk = []
+    for stmt in statements(source):
+        if stmt == 'endmodule':
+            if module is None:
+                raise Unsupported("statement outside of a module")
+            if chunk:
+                pending.append(pool.apply_async(_instanceChunk, (chunk,)))
+                chunk = []
+            for ev in ports:
+                _addPort(module, ev)
+            for result in pending:
+                for (submodname, name, conns) in result.get():
+                    verilogParse.addCell(module, submodname, name, conns)
+            mods.append(module)
+            module = None
+            ports = []
+            pending = []
+        elif _declStartRe.match(stmt):
+            ev = _event(stmt)
+            if ev[0] == "module":
+                if module is not None:
+                    raise Unsupported("nested module " + ev[1])
+                module = moduleClass({"name": ev[1]})
+            elif module is None:
+                raise Unsupported("statement outside of a module")
+            else:
+                ports.extend([ e for e in _declEvents(ev) if e[0] == "port" ])
+        else:
+            if module is None:
+                raise Unsupported("statement outside of a module")
+            chunk.append(stmt)
+            if len(chunk) >= chunkSize:
+                pending.append(pool.apply_async(_instanceChunk, (chunk,)))
+                chunk = []
+    if module is not None:
+        raise Unsupported("missing endmodule in " + module.name)
+    return mods
+
+
+def parseFileModules(fileName, workers=1, moduleClass=Module.Module):
+    """Parse a gate-level Verilog file, returns all modules defined in it.
+    With workers > 1 the cell instances are parsed in a process pool."""
+    if workers is None or workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            mods = buildChunked(fileName, pool, moduleClass=moduleClass)
+        except:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+    else:
+        mods = list(buildModules(events(fileName), moduleClass))
+
+    if len(mods) == 0:
+        raise Unsupported("no module found in " + fileName)
+    return mods
+
+def parseFile(fileName):
+    """Parse a gate-level Verilog file, returns the last module defined in
+    it (like verilogParse.parseFile)"""
+    return parseFileModules(fileName)[-1]
+
+
+def cellCounts(source):
+    """Count the instances of every cell type without building a netlist
+
+    >>> counts = cellCounts("test/Iface_test.gv")
+    >>> counts["EDFQD1"], counts["INVD1"]
+    (24, 14)
+    """
+    counts = dict()
+    for ev in events(source):
+        if ev[0] == "instance":
+            counts[ev[1]] = counts.get(ev[1], 0) + 1
+    return counts
+
+def fanoutHistogram(source, library=None):
+    """Histogram {fanout: number of nets} of a Verilog file, computed
+    without building a netlist. library maps cell type names to modules
+    (e.g. Netlist.mods after readYAML), it is used to leave out the pins
+    driving a net. Without a library every pin on a net is counted.
+
+    >>> import Netlist
+    >>> nl = Netlist.Netlist()
+    >>> nl.readYAML("test/gates.yml")
+    >>> hist = fanoutHistogram("test/Iface_test.gv", nl.mods)
+    >>> hist[1], max(hist)
+    (60, 35)
+    """
+    drivers = dict()
+    if library is not None:
+        for (name, mod) in library.items():
+            drivers[name] = set([ p for p in mod.ports
+                                  if mod.ports[p].direction == "out" ])
+
+    fanout = dict()
+    for ev in events(source):
+        if ev[0] != "instance":
+            continue
+        outs = drivers.get(ev[1], ())
+        for (pinName, netName, bitIdx) in ev[3]:
+            if bitIdx is not None:
+                netName += "[" + bitIdx + "]"
+            if pinName in outs:
+                fanout.setdefault(netName, 0)
+            else:
+                fanout[netName] = fanout.get(netName, 0) + 1
+
+    hist = dict()
+    for count in fanout.itervalues():
+        hist[count] = hist.get(count, 0) + 1
+    return hist
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()